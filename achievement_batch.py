@@ -0,0 +1,157 @@
+"""Re-evaluate every user against the achievement rules in parallel chunks
+
+Users are split into id ranges. Worker processes compute each chunk's
+metrics with grouped queries and return the UserAchievement rows that are
+missing; the parent process bulk-inserts them, skipping any a live request
+awarded in the meantime, commits and checkpoints the chunk in a state
+file, so an interrupted run picks up where it stopped.
+"""
+import bisect
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from app import app, db
+from models import Meal, User, UserAchievement
+from achievements import DAYS_STREAK, MEALS_LOGGED, achievement_engine
+from streaks import longest_streaks_between
+from upserts import insert_ignore
+
+DEFAULT_CHUNK_SIZE = 2000
+DEFAULT_STATE_FILE = '.achievement_recompute.json'
+
+
+def _meal_counts(first_id, last_id):
+    rows = db.session.query(Meal.user_id, db.func.count(Meal.id)).filter(
+        Meal.user_id.between(first_id, last_id)
+    ).group_by(Meal.user_id)
+    return dict(rows.all())
+
+
+# Set-based computation of each counter for a range of user ids
+METRICS = {
+    MEALS_LOGGED: _meal_counts,
+    DAYS_STREAK: longest_streaks_between,
+}
+
+
+def rules_fingerprint(rules):
+    """Identify a rule set, so a state file from other thresholds is not resumed"""
+    payload = json.dumps({counter: entries for counter, (_, entries) in sorted(rules.items())}, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def _init_worker():
+    # Connections inherited from the parent must not be shared across processes
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def compute_chunk(first_id, last_id, rules):
+    """Return (user count, missing UserAchievement rows) for users with ids in [first_id, last_id]"""
+    with app.app_context():
+        user_count = db.session.query(db.func.count(User.id)).filter(User.id.between(first_id, last_id)).scalar()
+        earned = set(db.session.query(UserAchievement.user_id, UserAchievement.achievement_id).filter(
+            UserAchievement.user_id.between(first_id, last_id)).all())
+
+        missing = []
+        for counter, (thresholds, entries) in rules.items():
+            metric = METRICS.get(counter)
+            if metric is None:
+                continue
+            for user_id, value in metric(first_id, last_id).items():
+                for _, achievement_id, _ in entries[:bisect.bisect_right(thresholds, value)]:
+                    if (user_id, achievement_id) not in earned:
+                        missing.append({'user_id': user_id, 'achievement_id': achievement_id})
+        db.session.remove()
+        return user_count, missing
+
+
+class RecomputeState:
+    """Completed chunks of a recompute run, kept in a JSON file"""
+
+    def __init__(self, path, fingerprint, chunk_size):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.chunk_size = chunk_size
+        self.done = set()
+
+    def load(self):
+        """Resume from the file when it belongs to the same rules and chunking"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                saved = json.load(file)
+        except (OSError, ValueError):
+            return
+        if saved.get('rules') == self.fingerprint and saved.get('chunk_size') == self.chunk_size:
+            self.done = set(saved.get('done', []))
+
+    def mark_done(self, first_id):
+        self.done.add(first_id)
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump({'rules': self.fingerprint, 'chunk_size': self.chunk_size, 'done': sorted(self.done)}, file)
+        os.replace(temp_path, self.path)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def recompute_achievements(chunk_size=DEFAULT_CHUNK_SIZE, workers=None, state_file=DEFAULT_STATE_FILE,
+                           restart=False, report=print):
+    """Award every achievement any user has reached, returning the number awarded
+
+    report is called with one progress line per finished chunk.
+    """
+    achievement_engine.reset()
+    rules = achievement_engine.rules()
+    state = RecomputeState(state_file, rules_fingerprint(rules), chunk_size)
+    if not restart:
+        state.load()
+
+    low, high = db.session.query(db.func.min(User.id), db.func.max(User.id)).one()
+    if low is None:
+        return 0
+    chunks = [(first, min(first + chunk_size - 1, high)) for first in range(low, high + 1, chunk_size)]
+    pending = [chunk for chunk in chunks if chunk[0] not in state.done]
+    if len(pending) < len(chunks):
+        report(f'Resuming: {len(chunks) - len(pending)} of {len(chunks)} chunks already done')
+
+    started = time.perf_counter()
+    processed_users = awarded = 0
+
+    def finish(chunk, result):
+        nonlocal processed_users, awarded
+        user_count, missing = result
+        now = datetime.utcnow()
+        for row in missing:
+            row['earned_date'] = now
+        inserted = insert_ignore(UserAchievement, missing, ['user_id', 'achievement_id'])
+        db.session.commit()
+        state.mark_done(chunk[0])
+        processed_users += user_count
+        awarded += len(inserted)
+        elapsed = time.perf_counter() - started
+        report(f'[{len(state.done)}/{len(chunks)}] users {chunk[0]}-{chunk[1]}: {len(inserted)} awarded, '
+               f'{processed_users / elapsed if elapsed else 0:.0f} users/s')
+
+    if workers == 1 or len(pending) <= 1:
+        for chunk in pending:
+            finish(chunk, compute_chunk(*chunk, rules))
+    else:
+        # Workers only read; all writes and checkpoints happen here, in order
+        db.session.remove()
+        db.engine.dispose()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            futures = [(chunk, pool.submit(compute_chunk, *chunk, rules)) for chunk in pending]
+            for chunk, future in futures:
+                finish(chunk, future.result())
+
+    state.clear()
+    return awarded
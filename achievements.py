@@ -0,0 +1,147 @@
+import bisect
+import threading
+from datetime import datetime
+
+from app import db
+from models import Achievement, Meal, UserAchievement, UserCounter
+from upserts import insert_ignore
+from versions import ACHIEVEMENT_RULES, shared_versions
+
+MEALS_LOGGED = 'meals_logged'
+# Longest run of consecutive days with a logged meal, see streaks.py
+DAYS_STREAK = 'days_streak'
+
+# Seeded into the Achievement table at startup; every Achievement row with a
+# requirement is a rule, so more can be added without code changes
+DEFAULT_ACHIEVEMENTS = [
+    {'id': 1, 'name': 'First Meal', 'description': 'Log your first meal', 'icon': 'fa-utensils',
+     'requirement_type': MEALS_LOGGED, 'requirement_value': 1},
+    {'id': 2, 'name': 'Regular Tracker', 'description': 'Log 10 meals', 'icon': 'fa-utensils',
+     'requirement_type': MEALS_LOGGED, 'requirement_value': 10},
+    {'id': 3, 'name': 'Committed Tracker', 'description': 'Log 30 meals', 'icon': 'fa-utensils',
+     'requirement_type': MEALS_LOGGED, 'requirement_value': 30},
+    {'id': 4, 'name': 'Nutrition Master', 'description': 'Log 100 meals', 'icon': 'fa-utensils',
+     'requirement_type': MEALS_LOGGED, 'requirement_value': 100},
+    {'id': 5, 'name': 'Three in a Row', 'description': 'Log meals 3 days in a row', 'icon': 'fa-fire',
+     'requirement_type': DAYS_STREAK, 'requirement_value': 3},
+    {'id': 6, 'name': 'Week Streak', 'description': 'Log meals 7 days in a row', 'icon': 'fa-fire',
+     'requirement_type': DAYS_STREAK, 'requirement_value': 7},
+    {'id': 7, 'name': 'Month Streak', 'description': 'Log meals 30 days in a row', 'icon': 'fa-fire',
+     'requirement_type': DAYS_STREAK, 'requirement_value': 30},
+]
+
+
+def _count_meals(user_id):
+    return Meal.query.filter_by(user_id=user_id).count()
+
+
+# How to compute a counter from scratch the first time a user needs it
+COUNTER_SOURCES = {
+    MEALS_LOGGED: _count_meals,
+}
+
+
+def seed_achievements():
+    """Insert the default achievements that are missing from the table
+
+    Every worker seeds at startup, so rows another worker inserted first
+    are skipped rather than failing the later ones.
+    """
+    existing = {row[0] for row in db.session.query(Achievement.id)}
+    missing = [data for data in DEFAULT_ACHIEVEMENTS if data['id'] not in existing]
+    if missing and insert_ignore(Achievement, missing, ['id']):
+        shared_versions.bump(ACHIEVEMENT_RULES)
+    db.session.commit()
+
+
+class AchievementEngine:
+    """Awards achievements from per-user counters and the Achievement rules
+
+    Each Achievement row says "reach requirement_value on the counter named
+    requirement_type". The thresholds are held sorted per counter, so an
+    event costs one counter UPDATE and a bisect; UserAchievement is only
+    touched when the event actually crosses a threshold. The rules are
+    reloaded whenever the shared ACHIEVEMENT_RULES version moves.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rules = None
+
+    def rules(self):
+        """Return {requirement_type: (sorted thresholds, [(threshold, id, name), ...])}"""
+        rules = self._rules
+        if rules is not None:
+            return rules
+        with self._lock:
+            if self._rules is None:
+                grouped = {}
+                query = db.session.query(Achievement.requirement_type, Achievement.requirement_value,
+                                         Achievement.id, Achievement.name).filter(
+                    Achievement.requirement_type.isnot(None), Achievement.requirement_value.isnot(None))
+                for requirement_type, value, achievement_id, name in query:
+                    grouped.setdefault(requirement_type, []).append((value, achievement_id, name))
+                self._rules = {
+                    requirement_type: ([value for value, _, _ in sorted(entries)], sorted(entries))
+                    for requirement_type, entries in grouped.items()
+                }
+            return self._rules
+
+    def reset(self):
+        """Forget the cached rules after the Achievement table changed"""
+        with self._lock:
+            self._rules = None
+
+    def check_progress(self, user_id, counter, old, new):
+        """Award every rule on counter whose threshold lies in (old, new]; the caller commits
+
+        For counters kept outside UserCounter, such as streaks. Returns the
+        names of the achievements awarded.
+        """
+        rules = self.rules()
+        if new <= old or counter not in rules:
+            return []
+        thresholds, entries = rules[counter]
+        crossed = entries[bisect.bisect_right(thresholds, old):bisect.bisect_right(thresholds, new)]
+        if not crossed:
+            return []
+
+        # Two requests crossing the same threshold both try the insert; only one row lands
+        inserted = insert_ignore(UserAchievement, [
+            {'user_id': user_id, 'achievement_id': achievement_id, 'earned_date': datetime.utcnow()}
+            for _, achievement_id, _ in crossed
+        ], ['user_id', 'achievement_id'])
+        return [name for _, achievement_id, name in crossed if (user_id, achievement_id) in inserted]
+
+    def record_event(self, user_id, counter=MEALS_LOGGED, delta=1):
+        """Add delta to a user's counter and award what it unlocks; the caller commits
+
+        Call after the event's own rows are flushed: a counter the user does
+        not have yet is initialized from COUNTER_SOURCES, which must already
+        see them. Returns the names of the achievements awarded.
+        """
+        statement = db.update(UserCounter).where(
+            UserCounter.user_id == user_id, UserCounter.name == counter
+        ).values(value=UserCounter.value + delta)
+        if db.session.get_bind().dialect.update_returning:
+            new = db.session.execute(statement.returning(UserCounter.value)).scalar()
+        else:
+            result = db.session.execute(statement)
+            new = db.session.query(UserCounter.value).filter_by(
+                user_id=user_id, name=counter).scalar() if result.rowcount else None
+
+        if new is None:
+            # First event for this counter: start from the source of truth
+            # and check every threshold up to it
+            source = COUNTER_SOURCES.get(counter)
+            new = source(user_id) if source else delta
+            if insert_ignore(UserCounter, [{'user_id': user_id, 'name': counter, 'value': new}], ['user_id', 'name']):
+                return self.check_progress(user_id, counter, 0, new)
+            # A concurrent first event created the row from rows that did not
+            # include this event's; count this event on top of it instead
+            return self.record_event(user_id, counter, delta)
+        return self.check_progress(user_id, counter, new - delta, new)
+
+
+achievement_engine = AchievementEngine()
+shared_versions.on_change(ACHIEVEMENT_RULES, achievement_engine.reset)
@@ -0,0 +1,143 @@
+from collections import defaultdict
+from datetime import date, timedelta
+
+from app import db
+from models import DailyNutrition, Food, Meal, MealItem
+from nutrients import NUTRIENTS, PORTION_MULTIPLIERS
+from rollups import DEFAULT_MEAL_TYPE
+
+# Dimensions a nutrition summary can be grouped by
+DIMENSIONS = ('date', 'week', 'month', 'meal_type', 'category', 'food')
+# Summable measures besides the nutrients themselves. meal_count counts the
+# meals with at least one item in the group, on the rollup and item paths alike
+MEASURES = NUTRIENTS + ('meal_count',)
+
+# Dimensions the DailyNutrition rollup can answer without touching meal items
+ROLLUP_DIMENSIONS = frozenset(('date', 'week', 'month', 'meal_type'))
+
+# Foods without a category are reported under this name
+UNCATEGORIZED = 'other'
+
+
+def _bucket_expression(dialect, bucket, column):
+    """Return a SQL expression truncating a date column to its week or month, if the dialect has one"""
+    if dialect == 'sqlite':
+        if bucket == 'week':
+            # Monday of the week: move forward to Sunday, then back six days
+            return db.func.date(column, 'weekday 0', '-6 days')
+        return db.func.date(column, 'start of month')
+    if dialect == 'postgresql':
+        return db.cast(db.func.date_trunc(bucket, column), db.Date)
+    return None
+
+
+def _bucket_in_python(day, bucket):
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def _as_date(value):
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def aggregate_nutrition(user_id, start_date, end_date, group_by=(), measures=('calories',), use_rollup=None):
+    """Sum measures for one user's meals between two dates, grouped by any dimensions
+
+    group_by is a sequence of DIMENSIONS and measures a sequence of MEASURES.
+    Returns one dict per group holding the dimension values (dates as ISO
+    strings, food as the Food id plus its food_name) and the summed
+    measures, sorted by the dimensions. When every dimension is known to
+    the DailyNutrition rollup the query reads the rollup; otherwise it runs
+    as a GROUP BY over the meal items joined with their foods, scaling by
+    portion size in SQL. use_rollup=False forces the meal item query.
+    """
+    group_by = list(dict.fromkeys(group_by))
+    measures = list(dict.fromkeys(measures))
+    for dimension in group_by:
+        if dimension not in DIMENSIONS:
+            raise ValueError(f'Unknown dimension: {dimension}')
+    for measure in measures:
+        if measure not in MEASURES:
+            raise ValueError(f'Unknown measure: {measure}')
+
+    use_rollup = use_rollup is not False and set(group_by) <= ROLLUP_DIMENSIONS
+    source = DailyNutrition if use_rollup else Meal
+    dialect = db.session.get_bind().dialect.name
+
+    columns = {
+        'date': source.date,
+        # Blank meal types are rolled up under the default too
+        'meal_type': DailyNutrition.meal_type if use_rollup
+        else db.func.coalesce(db.func.nullif(Meal.meal_type, ''), DEFAULT_MEAL_TYPE),
+        'category': db.func.coalesce(Food.category, UNCATEGORIZED),
+        'food': Food.id,
+    }
+    # Week and month buckets fall back to grouping by day and merging in
+    # Python on databases without a date truncation function here
+    python_buckets = {}
+    for bucket in ('week', 'month'):
+        if bucket in group_by:
+            expression = _bucket_expression(dialect, bucket, source.date)
+            if expression is None:
+                python_buckets[bucket] = True
+                expression = source.date
+            columns[bucket] = expression
+    keys = [columns[dimension].label(dimension) for dimension in group_by]
+
+    if use_rollup:
+        sums = [db.func.sum(getattr(DailyNutrition, measure)) for measure in measures]
+        query = db.select(*keys, *sums).where(
+            DailyNutrition.user_id == user_id,
+            DailyNutrition.date >= start_date,
+            DailyNutrition.date <= end_date,
+        )
+    else:
+        multiplier = db.case(
+            *((db.func.lower(MealItem.portion_size) == name, value) for name, value in PORTION_MULTIPLIERS.items()),
+            else_=1.0,
+        )
+        sums = [
+            db.func.count(db.distinct(Meal.id)) if measure == 'meal_count'
+            else db.func.sum(db.func.coalesce(getattr(Food, measure), 0) * multiplier)
+            for measure in measures
+        ]
+        query = db.select(*keys, *sums).select_from(Meal).join(
+            MealItem, MealItem.meal_id == Meal.id
+        ).join(
+            Food, Food.id == MealItem.food_id
+        ).where(
+            Meal.user_id == user_id,
+            Meal.date >= start_date,
+            Meal.date <= end_date,
+        )
+    if keys:
+        query = query.group_by(*keys)
+
+    groups = defaultdict(lambda: [0.0] * len(measures))
+    for row in db.session.execute(query):
+        key = list(row[:len(keys)])
+        for position, dimension in enumerate(group_by):
+            if dimension in ('date', 'week', 'month'):
+                key[position] = _as_date(key[position])
+                if dimension in python_buckets:
+                    key[position] = _bucket_in_python(key[position], dimension)
+        totals = groups[tuple(key)]
+        for position, value in enumerate(row[len(keys):]):
+            totals[position] += value or 0.0
+
+    results = []
+    for key in sorted(groups, key=lambda key: tuple((value is None, value) for value in key)):
+        result = {
+            dimension: value.isoformat() if isinstance(value, date) else value
+            for dimension, value in zip(group_by, key)
+        }
+        for measure, value in zip(measures, groups[key]):
+            result[measure] = int(value) if measure == 'meal_count' else round(float(value), 1)
+        results.append(result)
+
+    if 'food' in group_by and results:
+        names = dict(db.session.query(Food.id, Food.name).filter(Food.id.in_([r['food'] for r in results])))
+        for result in results:
+            result['food_name'] = names.get(result['food'])
+    return results
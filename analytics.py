@@ -0,0 +1,103 @@
+from datetime import timedelta
+
+import numpy as np
+
+from nutrients import DEFAULT_TARGETS
+from rollups import get_daily_totals
+
+# Nutrients reported by the analytics endpoint; the ones with daily targets
+ANALYTICS_NUTRIENTS = tuple(DEFAULT_TARGETS)
+# Longest window the endpoint computes, about five years
+ANALYTICS_MAX_DAYS = 5 * 366
+ROLLING_WINDOW = 7
+PERCENTILES = (10, 25, 50, 75, 90)
+# A day adheres to a target when intake is within this fraction of it
+ADHERENCE_TOLERANCE = 0.1
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+
+def load_daily_series(user_id, start_date, end_date):
+    """Return (logged, values) arrays with one row per calendar day in the range
+
+    logged is a bool array marking days with at least one meal; values is a
+    (days, len(ANALYTICS_NUTRIENTS)) float64 array read from the rollup in
+    one query.
+    """
+    day_count = (end_date - start_date).days + 1
+    values = np.zeros((day_count, len(ANALYTICS_NUTRIENTS)))
+    logged = np.zeros(day_count, dtype=bool)
+    totals = get_daily_totals(user_id, start_date, end_date, ANALYTICS_NUTRIENTS)
+    if totals:
+        offsets = np.fromiter(((day - start_date).days for day in totals), dtype=np.int64, count=len(totals))
+        values[offsets] = np.array(list(totals.values()))
+        logged[offsets] = True
+    return logged, values
+
+
+def _rounded(array):
+    """Round to one decimal for JSON, turning NaN into None"""
+    return [None if value != value else value for value in np.round(array, 1).tolist()]
+
+
+def rolling_average(logged, values, window=ROLLING_WINDOW):
+    """Trailing mean of each column over the logged days of each window, NaN where none were logged"""
+    sums = np.cumsum(np.where(logged[:, None], values, 0.0), axis=0)
+    counts = np.cumsum(logged)
+    sums[window:] = sums[window:] - sums[:-window]
+    counts[window:] = counts[window:] - counts[:-window]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts[:, None] > 0, sums / counts[:, None], np.nan)
+
+
+def compute_analytics(logged, values, start_date, targets):
+    """Compute trend metrics for the analytics endpoint from load_daily_series() arrays
+
+    Only days with logged meals count towards adherence, percentiles and
+    weekday averages so that untracked days do not read as fasting.
+    """
+    day_count = len(logged)
+    logged_series = values[logged]
+    target_vector = np.array([targets[name] for name in ANALYTICS_NUTRIENTS], dtype=np.float64)
+
+    rolling = rolling_average(logged, values)
+
+    if len(logged_series):
+        within = np.abs(logged_series - target_vector) <= ADHERENCE_TOLERANCE * target_vector
+        adherence = within.mean(axis=0) * 100
+        percentiles = np.percentile(logged_series, PERCENTILES, axis=0)
+    else:
+        adherence = np.full(len(ANALYTICS_NUTRIENTS), np.nan)
+        percentiles = np.full((len(PERCENTILES), len(ANALYTICS_NUTRIENTS)), np.nan)
+
+    weekdays = (np.arange(day_count) + start_date.weekday()) % 7
+    logged_weekdays = weekdays[logged]
+    weekday_counts = np.bincount(logged_weekdays, minlength=7)
+    weekday_sums = np.zeros((7, len(ANALYTICS_NUTRIENTS)))
+    np.add.at(weekday_sums, logged_weekdays, logged_series)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weekday_means = weekday_sums / weekday_counts[:, None]
+
+    return {
+        'start_date': start_date.isoformat(),
+        'end_date': (start_date + timedelta(days=day_count - 1)).isoformat(),
+        'days': day_count,
+        'logged_days': int(logged.sum()),
+        'dates': [(start_date + timedelta(days=offset)).isoformat() for offset in range(day_count)],
+        'targets': targets,
+        'rolling_average': {name: _rounded(rolling[:, i]) for i, name in enumerate(ANALYTICS_NUTRIENTS)},
+        'adherence': dict(zip(ANALYTICS_NUTRIENTS, _rounded(adherence))),
+        'percentiles': {
+            name: {f'p{p}': value for p, value in zip(PERCENTILES, _rounded(percentiles[:, i]))}
+            for i, name in enumerate(ANALYTICS_NUTRIENTS)
+        },
+        'weekday_average': {
+            name: dict(zip(WEEKDAYS, _rounded(weekday_means[:, i])))
+            for i, name in enumerate(ANALYTICS_NUTRIENTS)
+        },
+    }
+
+
+def get_user_analytics(user_id, start_date, end_date, targets):
+    """Load a user's daily series once and compute every trend metric over it"""
+    logged, values = load_daily_series(user_id, start_date, end_date)
+    return compute_analytics(logged, values, start_date, targets)
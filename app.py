@@ -1,5 +1,6 @@
 import os
 import logging
+import tempfile
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
@@ -30,6 +31,38 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_pre_ping": True,
 }
 
+# Configure food search: 'memory' (in-process indexes) or 'fts5' (SQLite only)
+app.config["SEARCH_BACKEND"] = os.environ.get("SEARCH_BACKEND", "memory")
+
+# Shared secret for the kiosk/POS bulk meal import API; the API is off when unset
+app.config["MEAL_IMPORT_TOKEN"] = os.environ.get("MEAL_IMPORT_TOKEN")
+
+# Logged-in users cached per process: entries and seconds before a reload
+app.config["USER_CACHE_SIZE"] = int(os.environ.get("USER_CACHE_SIZE", 10000))
+app.config["USER_CACHE_TTL"] = int(os.environ.get("USER_CACHE_TTL", 60))
+
+# Password hashing: Werkzeug method ('scrypt' or 'pbkdf2'), its cost (scrypt N or
+# pbkdf2 iterations, method default when unset) and how many hashes one process
+# runs at once before answering logins with a 503 (only reachable with a
+# threaded worker class). Hashes made with another method or cost are upgraded
+# on the next login.
+app.config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+app.config["PASSWORD_HASH_COST"] = os.environ.get("PASSWORD_HASH_COST")
+app.config["PASSWORD_HASH_MAX_CONCURRENT"] = int(
+    os.environ.get("PASSWORD_HASH_MAX_CONCURRENT", 4 * (os.cpu_count() or 1)))
+
+# Per-user cache of chart and search responses: 'memory' (per process),
+# 'filesystem' (shared by the workers on a host, under RESPONSE_CACHE_DIR) or
+# 'none'. ETags and 304 responses work with any of them
+app.config["RESPONSE_CACHE_BACKEND"] = os.environ.get("RESPONSE_CACHE_BACKEND", "memory")
+app.config["RESPONSE_CACHE_DIR"] = os.environ.get(
+    "RESPONSE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "smartcafe-response-cache"))
+app.config["RESPONSE_CACHE_SIZE"] = int(os.environ.get("RESPONSE_CACHE_SIZE", 5000))
+app.config["RESPONSE_CACHE_TTL"] = int(os.environ.get("RESPONSE_CACHE_TTL", 300))
+
+# Seconds between a worker's checks for data other workers changed (see versions.py)
+app.config["SHARED_VERSION_POLL_INTERVAL"] = float(os.environ.get("SHARED_VERSION_POLL_INTERVAL", 1))
+
 # Configure Flask-Login
 login_manager.login_view = 'login'
 login_manager.login_message_category = 'info'
@@ -56,6 +89,14 @@ login_manager.init_app(app)
 # Import routes at the end to avoid circular imports
 with app.app_context():
     import routes  # noqa: F401
+    import commands  # noqa: F401
     
     # Create database tables if they don't exist
-    db.create_all()
\ No newline at end of file
+    db.create_all()
+    
+    from achievements import seed_achievements
+    seed_achievements()
+    
+    # Backfill data for features added to an existing database
+    from migrations import run_migrations
+    run_migrations()
\ No newline at end of file
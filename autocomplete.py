@@ -0,0 +1,322 @@
+import logging
+import threading
+import time
+
+from search_index import LOCALES, food_payload, normalize
+from versions import FOODS, shared_versions
+
+logger = logging.getLogger(__name__)
+
+TOP_K = 10
+# Seconds before the tries are rebuilt to pick up meals logged on other workers
+AUTOCOMPLETE_MAX_AGE = 300
+
+
+def completion_keys(name):
+    """Return the suffixes of a normalized name that start at a word boundary
+
+    Inserting every word-start suffix lets "chai" complete "Hot tea (Garam Chai)".
+    """
+    name = normalize(name)
+    if not name:
+        return []
+    keys = [name]
+    for position, char in enumerate(name):
+        if char == ' ':
+            keys.append(name[position + 1:])
+    return keys
+
+
+class TrieNode:
+    __slots__ = ('children', 'top')
+
+    def __init__(self):
+        self.children = {}
+        self.top = []
+
+
+class PopularityTrie:
+    """Prefix trie whose nodes cache the most popular food ids below them
+
+    Completing a prefix is a walk of len(prefix) nodes; the answer is
+    already sitting in the last node. Popularity only ever increases, so
+    a bump only has to re-offer the food to the nodes on its own paths.
+    """
+
+    def __init__(self, popularity):
+        self.root = TrieNode()
+        self.popularity = popularity
+
+    def _rank(self, food_id):
+        return (-self.popularity.get(food_id, 0), food_id)
+
+    def _offer(self, node, food_id):
+        top = node.top
+        if food_id not in top:
+            if len(top) >= TOP_K and self._rank(food_id) >= self._rank(top[-1]):
+                return
+            top.append(food_id)
+        top.sort(key=self._rank)
+        del top[TOP_K:]
+
+    def insert(self, key, food_id):
+        node = self.root
+        self._offer(node, food_id)
+        for char in key:
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = TrieNode()
+            node = child
+            self._offer(node, food_id)
+
+    def bump(self, key, food_id):
+        """Re-rank food_id along the path of key after its popularity grew"""
+        node = self.root
+        self._offer(node, food_id)
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                return
+            self._offer(node, food_id)
+
+    def complete(self, prefix):
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return list(node.top)
+
+
+class FoodAutocomplete:
+    """Per-locale completion over Food names ranked by how often each is eaten
+
+    Built from two queries on first use; after that add_food() and
+    record_use() keep it current for changes made in this process. All
+    later database work happens on a background thread while requests keep
+    completing from the current tries: foods created, renamed or synced by
+    other workers bump the shared FOODS version, which schedules a rebuild
+    that is swapped in whole (see versions.py), and every
+    AUTOCOMPLETE_MAX_AGE seconds meals logged since the last look, on any
+    worker, are counted and fed in as popularity increments.
+    """
+
+    def __init__(self, max_age=AUTOCOMPLETE_MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._tries = None
+        self._payloads = {}
+        self._popularity = {}
+        # Highest MealItem id counted into _popularity
+        self._last_item_id = 0
+        # Uses record_use() counted that a later count of new meal items will see again
+        self._local_uses = {}
+        self._refreshed_at = 0.0
+        self._worker = None
+        self._rebuild_wanted = False
+        # Bumped by reset() so a refresh that started before it is dropped
+        self._generation = 0
+
+    def _names_for(self, payload, locale):
+        names = [payload['name']]
+        if locale != 'en' and payload.get(f'name_{locale}'):
+            names.append(payload[f'name_{locale}'])
+        return names
+
+    def _keys_for(self, payload, locale):
+        keys = []
+        for name in self._names_for(payload, locale):
+            keys.extend(completion_keys(name))
+        return keys
+
+    def _insert(self, tries, payloads, payload):
+        food_id = payload['id']
+        payloads[food_id] = payload
+        for locale, trie in tries.items():
+            for key in self._keys_for(payload, locale):
+                trie.insert(key, food_id)
+
+    def _bump(self, food_id, count):
+        """Add count uses of food_id and re-rank it; call with the lock held"""
+        self._popularity[food_id] = self._popularity.get(food_id, 0) + count
+        payload = self._payloads.get(food_id)
+        if payload is None:
+            return
+        for locale, trie in self._tries.items():
+            for key in self._keys_for(payload, locale):
+                trie.bump(key, food_id)
+
+    def _build(self):
+        """Load popularity and foods from the database and swap in fresh tries"""
+        from app import db
+        from models import Food, MealItem
+
+        with self._lock:
+            generation = self._generation
+            # Uses recorded so far are in items the count below includes
+            self._local_uses = {}
+        last_item_id = db.session.query(db.func.max(MealItem.id)).scalar() or 0
+        counts = db.session.query(MealItem.food_id, db.func.count(MealItem.id)).filter(
+            MealItem.id <= last_item_id).group_by(MealItem.food_id)
+        popularity = dict(counts.all())
+        tries = {locale: PopularityTrie(popularity) for locale in LOCALES}
+        payloads = {}
+        for food in Food.query.all():
+            self._insert(tries, payloads, food_payload(food))
+
+        with self._lock:
+            if generation != self._generation:
+                return
+            if self._tries is not None:
+                # Foods this process added while the queries ran
+                for food_id, payload in self._payloads.items():
+                    if payloads.get(food_id) != payload:
+                        self._insert(tries, payloads, payload)
+            self._tries, self._payloads, self._popularity = tries, payloads, popularity
+            self._last_item_id = last_item_id
+            # Uses recorded during the queries may be in items they missed
+            for food_id, count in self._local_uses.items():
+                self._bump(food_id, count)
+            self._refreshed_at = time.monotonic()
+
+    def _count_new_meals(self):
+        """Feed meal items logged since the last look in as popularity increments"""
+        from app import db
+        from models import MealItem
+
+        with self._lock:
+            generation = self._generation
+            last_item_id = self._last_item_id
+            local_uses, self._local_uses = self._local_uses, {}
+        counts = db.session.query(MealItem.food_id, db.func.count(MealItem.id), db.func.max(MealItem.id)).filter(
+            MealItem.id > last_item_id).group_by(MealItem.food_id).all()
+
+        with self._lock:
+            if generation != self._generation or self._tries is None:
+                return
+            for food_id, count, max_id in counts:
+                # This process already counted its own uses through record_use()
+                count -= local_uses.get(food_id, 0)
+                if count > 0:
+                    self._bump(food_id, count)
+                self._last_item_id = max(self._last_item_id, max_id)
+            self._refreshed_at = time.monotonic()
+
+    def _refresh(self):
+        from app import app, db
+
+        try:
+            with app.app_context():
+                try:
+                    while True:
+                        with self._lock:
+                            rebuild, self._rebuild_wanted = self._rebuild_wanted, False
+                        if rebuild:
+                            self._build()
+                        else:
+                            self._count_new_meals()
+                        with self._lock:
+                            if not self._rebuild_wanted:
+                                return
+                finally:
+                    db.session.remove()
+        except Exception:
+            logger.exception("Food autocomplete refresh failed")
+        finally:
+            with self._lock:
+                self._worker = None
+
+    def _schedule(self, rebuild):
+        """Start a background refresh unless one is running; a running one picks up a rebuild request"""
+        with self._lock:
+            self._rebuild_wanted = self._rebuild_wanted or rebuild
+            if self._worker is not None:
+                return
+            # Set now so requests arriving during the refresh do not start another
+            self._refreshed_at = time.monotonic()
+            self._worker = threading.Thread(target=self._refresh, name='food-autocomplete', daemon=True)
+            self._worker.start()
+
+    def _ensure_built(self):
+        if self._tries is None:
+            with self._lock:
+                building = self._tries is None
+            if building:
+                # Nothing to answer from yet, so the first build is the one done in the request
+                self._build()
+        elif time.monotonic() - self._refreshed_at >= self.max_age:
+            self._schedule(rebuild=False)
+        return self._tries
+
+    def wait(self, timeout=None):
+        """Block until a background refresh that is running has finished"""
+        worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
+
+    def invalidate(self):
+        """Rebuild the tries in the background, answering from the current ones meanwhile"""
+        if self._tries is not None:
+            self._schedule(rebuild=True)
+
+    def reset(self):
+        """Forget everything so the tries are rebuilt from the database on next use"""
+        self.wait()
+        with self._lock:
+            self._generation += 1
+            self._tries = None
+            self._payloads = {}
+            self._popularity = {}
+            self._local_uses = {}
+            self._last_item_id = 0
+            self._rebuild_wanted = False
+
+    def add_food(self, food):
+        """Make a new or renamed Food completable; a no-op until first use"""
+        if self._tries is None:
+            return
+        payload = food_payload(food)
+        with self._lock:
+            if self._tries is None:
+                return
+            previous = self._payloads.get(food.id)
+            renamed = previous is not None and any(
+                self._names_for(previous, locale) != self._names_for(payload, locale) for locale in LOCALES)
+            self._insert(self._tries, self._payloads, payload)
+        if renamed:
+            # complete() skips the old name's keys, but they still take up
+            # top-K slots until a rebuild drops them
+            self._schedule(rebuild=True)
+
+    def record_use(self, food_ids):
+        """Count one MealItem per id and re-rank those foods"""
+        if self._tries is None:
+            return
+        with self._lock:
+            if self._tries is None:
+                return
+            for food_id in food_ids:
+                self._local_uses[food_id] = self._local_uses.get(food_id, 0) + 1
+                self._bump(food_id, 1)
+
+    def complete(self, prefix, locale='en', limit=TOP_K):
+        """Return payload dicts for the most popular foods starting with prefix"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        tries = self._ensure_built()
+        payloads = self._payloads
+        trie = tries.get(locale) or tries['en']
+        results = []
+        for food_id in trie.complete(prefix):
+            payload = payloads.get(food_id)
+            # A swap between the reads above can leave ids without a payload,
+            # and a renamed food keeps its old keys until the next rebuild
+            if payload is None or not any(key.startswith(prefix) for key in self._keys_for(payload, locale)):
+                continue
+            results.append(payload)
+        return results[:limit]
+
+
+food_autocomplete = FoodAutocomplete()
+shared_versions.on_change(FOODS, food_autocomplete.invalidate)
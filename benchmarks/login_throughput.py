@@ -0,0 +1,127 @@
+"""Measure logins during a spike and how much they slow the routes that do not hash
+
+Usage: python benchmarks/login_throughput.py [concurrency] [bounds] [logins per thread]
+
+concurrency and bounds are comma-separated lists (default 1,4,16 and
+2,4,16). Each bound is a PASSWORD_HASH_MAX_CONCURRENT value. For each one,
+users start with legacy pbkdf2 hashes, so the first round includes the
+rehash to the configured method; later rounds are steady-state logins. A
+probe thread requests the login page throughout to show how much the
+spike slows routes that do no hashing.
+
+The threads stand in for a threaded worker class. Hashing runs on the
+request thread, so the login rate is bounded by the CPUs; logins beyond
+the bound are answered with a 503 at once and counted as rejected.
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'login_bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging  # noqa: E402
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from app import app, db  # noqa: E402
+import models  # noqa: E402
+from models import User  # noqa: E402
+from password_hashing import PasswordHasher  # noqa: E402
+
+logging.disable(logging.INFO)
+
+PASSWORD = 'correct horse battery staple'
+LEGACY_METHOD = 'pbkdf2:sha256:100000'
+
+
+def populate(user_count):
+    db.drop_all()
+    db.create_all()
+    legacy_hash = generate_password_hash(PASSWORD, LEGACY_METHOD)
+    db.session.execute(db.insert(User), [
+        {'username': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': legacy_hash}
+        for i in range(user_count)
+    ])
+    db.session.commit()
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[max(int(len(values) * share) - 1, 0)] * 1000 if values else 0.0
+
+
+def login_round(concurrency, logins_per_thread):
+    """Run one spike; returns (logins/s, login p50, login p95, probe p95, rejected)"""
+    latencies = []
+    probes = []
+    rejected = [0]
+    done = threading.Event()
+    lock = threading.Lock()
+
+    def worker(index):
+        client = app.test_client()
+        for attempt in range(logins_per_thread):
+            username = f'user{index * logins_per_thread + attempt}'
+            start = time.perf_counter()
+            response = client.post('/login', data={'username': username, 'password': PASSWORD})
+            elapsed = time.perf_counter() - start
+            with lock:
+                if response.status_code == 503:
+                    rejected[0] += 1
+                else:
+                    latencies.append(elapsed)
+            client.get('/logout')
+
+    def probe():
+        client = app.test_client()
+        while not done.is_set():
+            start = time.perf_counter()
+            client.get('/login')
+            probes.append(time.perf_counter() - start)
+            time.sleep(0.005)
+
+    prober = threading.Thread(target=probe)
+    prober.start()
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    done.set()
+    prober.join()
+    return (len(latencies) / elapsed, percentile(latencies, 0.5), percentile(latencies, 0.95),
+            percentile(probes, 0.95), rejected[0])
+
+
+def run(concurrency, bound, logins_per_thread):
+    populate(concurrency * logins_per_thread)
+    models.password_hasher = PasswordHasher(
+        method=app.config['PASSWORD_HASH_METHOD'], cost=app.config['PASSWORD_HASH_COST'], max_concurrent=bound)
+    for label in ('rehash', 'steady'):
+        rate, p50, p95, probe_p95, rejected = login_round(concurrency, logins_per_thread)
+        print(f'bound {bound:>2} threads {concurrency:>3} {label:<6} {rate:8.1f} logins/s  '
+              f'p50 {p50:7.1f}ms  p95 {p95:7.1f}ms  other routes p95 {probe_p95:7.1f}ms  '
+              f'rejected {rejected}')
+
+
+def main():
+    levels = [int(s) for s in (sys.argv[1] if len(sys.argv) > 1 else '1,4,16').split(',')]
+    bounds = [int(s) for s in (sys.argv[2] if len(sys.argv) > 2 else '2,4,16').split(',')]
+    logins_per_thread = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    print(f"method {app.config['PASSWORD_HASH_METHOD']} cost {app.config['PASSWORD_HASH_COST'] or 'default'}, "
+          f'{os.cpu_count()} CPUs')
+    with app.app_context():
+        for bound in bounds:
+            for concurrency in levels:
+                run(concurrency, bound, logins_per_thread)
+    os.remove(DB_PATH)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""Compare the in-process and FTS5 food search backends on synthetic catalogs
+
+Usage: python benchmarks/search_backends.py [sizes] [queries]
+
+sizes is a comma-separated list of catalog sizes (default 10000,100000,1000000).
+Each size gets a fresh temporary SQLite database, so the numbers include
+building each backend's index from the food table.
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'search_bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging  # noqa: E402
+
+from app import app, db  # noqa: E402
+from models import Food  # noqa: E402
+from search_backends import FTS5SearchBackend, InProcessSearchBackend  # noqa: E402
+from search_index import FoodSearchIndex  # noqa: E402
+from fuzzy_search import FuzzyIndex  # noqa: E402
+
+logging.disable(logging.INFO)
+
+SYLLABLES = ['ka', 'ra', 'ma', 'pa', 'ni', 'lo', 'chi', 'dal', 'tor', 'bhu', 'sha', 'ven', 'gu', 'ri', 'tha', 'po']
+WORDS = ['rice', 'curry', 'dal', 'tea', 'coffee', 'roti', 'paneer', 'masala', 'lemon', 'punch', 'sweet', 'spicy']
+HINDI = ['चावल', 'करी', 'दाल', 'चाय', 'कॉफी', 'रोटी', 'पनीर', 'मसाला']
+
+
+def make_word(rng):
+    if rng.random() < 0.3:
+        return rng.choice(WORDS)
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def populate(size, rng):
+    # The FTS table is not part of the models' metadata, so drop it by hand
+    db.session.execute(db.text(f'DROP TABLE IF EXISTS {FTS5SearchBackend.table}'))
+    db.session.commit()
+    db.drop_all()
+    db.create_all()
+    batch = []
+    for food_id in range(1, size + 1):
+        words = [make_word(rng) for _ in range(rng.randint(2, 4))]
+        batch.append({
+            'id': food_id,
+            'name': ' '.join(words).title(),
+            'name_hi': ' '.join(rng.choice(HINDI) for _ in range(2)),
+            'calories': rng.randint(10, 600),
+            'protein': 1.0, 'carbs': 1.0, 'fat': 1.0, 'fiber': 0.0,
+            'category': 'other', 'is_custom': False,
+        })
+        if len(batch) == 10000:
+            db.session.execute(db.insert(Food), batch)
+            batch = []
+    if batch:
+        db.session.execute(db.insert(Food), batch)
+    db.session.commit()
+
+
+def make_queries(count, rng):
+    queries = []
+    for _ in range(count):
+        word = make_word(rng)
+        queries.append(word[:rng.randint(3, len(word))] if len(word) > 3 else word)
+    return queries
+
+
+def measure(backend, queries):
+    latencies = []
+    hits = 0
+    for query in queries:
+        start = time.perf_counter()
+        hits += bool(backend.search(query, limit=10, fuzzy=False))
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        'p50': statistics.median(latencies),
+        'p95': latencies[int(len(latencies) * 0.95) - 1],
+        'hit_rate': hits / len(queries),
+    }
+
+
+def run(size, query_count):
+    rng = random.Random(size)
+    populate(size, rng)
+    queries = make_queries(query_count, rng)
+
+    memory = InProcessSearchBackend(FoodSearchIndex(), FoodSearchIndex(index_factory=FuzzyIndex))
+    start = time.perf_counter()
+    memory.search('warmup', fuzzy=False)
+    memory_build = time.perf_counter() - start
+
+    fts = FTS5SearchBackend(db)
+    start = time.perf_counter()
+    fts.install()
+    fts_build = time.perf_counter() - start
+
+    for name, backend, build in (('memory', memory, memory_build), ('fts5', fts, fts_build)):
+        stats = measure(backend, queries)
+        print(f"{size:>9,} {name:<7} build {build:7.2f}s  p50 {stats['p50']:7.3f}ms  "
+              f"p95 {stats['p95']:7.3f}ms  hit rate {stats['hit_rate']:.0%}")
+    db.session.remove()
+
+
+def main():
+    sizes = [int(s) for s in (sys.argv[1] if len(sys.argv) > 1 else '10000,100000,1000000').split(',')]
+    query_count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    with app.app_context():
+        for size in sizes:
+            run(size, query_count)
+    os.remove(DB_PATH)
+
+
+if __name__ == '__main__':
+    main()
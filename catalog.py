@@ -0,0 +1,179 @@
+import csv
+import logging
+import os
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+CSV_PATH = os.path.join(os.path.dirname(__file__), 'food_data.csv')
+
+# Binary snapshot shared by all workers through mmap; set the variable to an
+# empty string to keep the catalog in process memory instead
+SNAPSHOT_PATH = os.environ.get('CATALOG_SNAPSHOT_PATH', os.path.join(os.path.dirname(__file__), 'food_data.snapshot'))
+
+# Columns that hold free text; every other column in the CSV is numeric
+TEXT_COLUMNS = ('Dish Name', 'name_hi', 'name_kn', 'name_ta', 'name_te', 'name_mr', 'name_gu')
+
+# CSV column -> Food attribute for the columns synced into the database
+CSV_TO_FOOD_COLUMNS = {
+    'Dish Name': 'name',
+    'Calories (kcal)': 'calories',
+    'Protein (g)': 'protein',
+    'Carbohydrate (g)': 'carbs',
+    'Fats (g)': 'fat',
+    'Fibre (g)': 'fiber',
+    'Free Sugar (g)': 'free_sugar',
+    'Sodium (mg)': 'sodium',
+    'Calcium (mg)': 'calcium',
+    'Iron (mg)': 'iron',
+    'Vitamin C (mg)': 'vitamin_c',
+    'Folate (mcg)': 'folate',
+    'name_hi': 'name_hi',
+    'name_kn': 'name_kn',
+    'name_ta': 'name_ta',
+    'name_te': 'name_te',
+    'name_mr': 'name_mr',
+    'name_gu': 'name_gu',
+    'category': 'category',
+}
+
+# Menu categories, checked in order; the first rule whose keywords occur in
+# the lowercased dish name wins and anything unmatched is a snack
+CATEGORY_RULES = [
+    ('beverage', ('tea', 'coffee', 'drink', 'juice', 'punch', 'lemonade')),
+    ('main_course', ('rice', 'curry', 'dal', 'meal')),
+    ('side', ('bread', 'roti', 'naan')),
+]
+DEFAULT_CATEGORY = 'snack'
+CATEGORIES = [category for category, _ in CATEGORY_RULES] + [DEFAULT_CATEGORY]
+
+_CATEGORY_PATTERNS = [
+    (category, re.compile('|'.join(re.escape(keyword) for keyword in keywords)))
+    for category, keywords in CATEGORY_RULES
+]
+
+
+def categorize_food(name):
+    """Return the menu category for a dish name"""
+    name = (name or '').lower()
+    for category, pattern in _CATEGORY_PATTERNS:
+        if pattern.search(name):
+            return category
+    return DEFAULT_CATEGORY
+
+
+def _to_float(value):
+    """Convert a CSV cell to float, treating blanks and bad values as 0"""
+    try:
+        return float(value) if value else 0.0
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def parse_food_row(row):
+    """Return a typed copy of a CSV row with numeric columns as floats"""
+    typed = {}
+    for key, value in row.items():
+        if key is None:
+            continue
+        if key in TEXT_COLUMNS:
+            typed[key] = (value or '').strip()
+        else:
+            typed[key] = _to_float(value)
+    typed['category'] = categorize_food(typed.get('Dish Name'))
+    return typed
+
+
+class CatalogSnapshot:
+    """Immutable view of the food CSV as loaded at one point in time"""
+
+    def __init__(self, rows, mtime, version, by_category=None, search_index=None):
+        self.rows = rows
+        self.mtime = mtime
+        self.version = version
+        # A prebuilt n-gram index over the rows, when the source provides one
+        self.search_index = search_index
+        if by_category is None:
+            grouped = {category: [] for category in CATEGORIES}
+            for row in rows:
+                grouped[row['category']].append(row)
+            by_category = {category: tuple(items) for category, items in grouped.items()}
+        self.by_category = by_category
+
+
+class FoodCatalog:
+    """Process-wide food catalog that parses the CSV once and reloads on change
+
+    Readers always get a complete snapshot: a reload builds a new
+    CatalogSnapshot off to the side and swaps the reference in one step.
+    With a snapshot_path the rows come from a memory-mapped binary snapshot
+    (see catalog_snapshot) that is written once and shared by all workers.
+    """
+
+    def __init__(self, path=CSV_PATH, snapshot_path=SNAPSHOT_PATH):
+        self.path = path
+        self.snapshot_path = snapshot_path or None
+        self._lock = threading.Lock()
+        self._snapshot = CatalogSnapshot((), None, 0)
+
+    def _current_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _parse(self):
+        rows = []
+        with open(self.path, 'r', encoding='utf-8') as file:
+            for row in csv.DictReader(file):
+                if row.get('Dish Name'):
+                    rows.append(parse_food_row(row))
+        return tuple(rows)
+
+    def _load(self, mtime, version):
+        if mtime is None:
+            return CatalogSnapshot((), mtime, version)
+        if self.snapshot_path:
+            from catalog_snapshot import load_or_build
+
+            try:
+                mapped = load_or_build(self.snapshot_path, mtime, self._parse)
+                return CatalogSnapshot(mapped.rows, mtime, version, mapped.by_category, mapped.search_index)
+            except (OSError, ValueError) as e:
+                logger.warning("Could not use catalog snapshot %s: %s", self.snapshot_path, e)
+        return CatalogSnapshot(self._parse(), mtime, version)
+
+    def snapshot(self):
+        """Return the current snapshot, reloading first if the file changed"""
+        snapshot = self._snapshot
+        mtime = self._current_mtime()
+        if mtime == snapshot.mtime and snapshot.version:
+            return snapshot
+
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock
+            snapshot = self._snapshot
+            if mtime != snapshot.mtime or not snapshot.version:
+                snapshot = self._load(mtime, snapshot.version + 1)
+                self._snapshot = snapshot
+        return snapshot
+
+    def write_snapshot(self):
+        """Write the binary snapshot for the current CSV, e.g. before workers start"""
+        from catalog_snapshot import write_snapshot
+
+        mtime = self._current_mtime()
+        write_snapshot(self._parse(), mtime, self.snapshot_path)
+        return self.snapshot_path
+
+    @property
+    def rows(self):
+        return self.snapshot().rows
+
+    @property
+    def version(self):
+        return self.snapshot().version
+
+
+food_catalog = FoodCatalog()
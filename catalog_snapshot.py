@@ -0,0 +1,271 @@
+"""Compact binary snapshot of the food catalog, shared read-only through mmap
+
+File layout (little-endian):
+
+    8 bytes   magic b'SCAFCAT1'
+    4 bytes   uint32 length of the JSON header
+    N bytes   JSON header: row count, column lists, categories, CSV mtime
+              and the dtype/shape/offset of every array below
+    arrays    8-byte aligned numpy arrays
+
+Strings are stored as a uint32 offsets array plus one UTF-8 blob. The
+category index and the trigram index over the normalized names are
+CSR-style offset/value array pairs. Every worker that maps the file
+shares one physical copy through the page cache, and searching needs
+nothing beyond the mapping. Only the CSV catalog is shared this way: the
+search indexes over the Food table and the nutrient matrix are still
+built in each worker.
+"""
+import bisect
+import heapq
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from catalog import CATEGORIES, TEXT_COLUMNS
+from search_index import name_grams, normalize, query_grams, score_name
+
+MAGIC = b'SCAFCAT1'
+FORMAT_VERSION = 2
+ALIGNMENT = 8
+
+
+def _pack_strings(values):
+    """Return (offsets, blob) arrays for a list of strings"""
+    encoded = [value.encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype='<u4')
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+
+def _pack_lists(lists):
+    """Return (offsets, values) arrays for a list of integer lists"""
+    offsets = np.zeros(len(lists) + 1, dtype='<u4')
+    np.cumsum([len(values) for values in lists], out=offsets[1:])
+    values = np.fromiter((value for values in lists for value in values), dtype='<u4', count=int(offsets[-1]))
+    return offsets, values
+
+
+def write_snapshot(rows, source_mtime, path):
+    """Write typed catalog rows to path atomically"""
+    numeric_columns = []
+    for row in rows:
+        for key in row:
+            if key not in TEXT_COLUMNS and key != 'category' and key not in numeric_columns:
+                numeric_columns.append(key)
+
+    arrays = {}
+    for column in TEXT_COLUMNS:
+        arrays[f'text:{column}:offsets'], arrays[f'text:{column}:data'] = _pack_strings(
+            [row.get(column, '') for row in rows])
+
+    # float64 so values read back exactly as parsed from the CSV
+    arrays['numeric'] = np.array([[row.get(c, 0.0) for c in numeric_columns] for row in rows],
+                                 dtype='<f8').reshape(len(rows), len(numeric_columns))
+
+    codes = np.array([CATEGORIES.index(row['category']) for row in rows], dtype=np.uint8)
+    arrays['category'] = codes
+    arrays['category:offsets'], arrays['category:rows'] = _pack_lists(
+        [np.flatnonzero(codes == code).tolist() for code in range(len(CATEGORIES))])
+
+    # Trigram index over the normalized names, grams sorted for binary search
+    search_names = []
+    postings = {}
+    for position, row in enumerate(rows):
+        names = list(dict.fromkeys(n for n in (normalize(row.get(c)) for c in TEXT_COLUMNS) if n))
+        search_names.append('\n'.join(names))
+        for gram in set().union(*(name_grams(name) for name in names)) if names else ():
+            postings.setdefault(gram, []).append(position)
+    grams = sorted(postings)
+    arrays['search:names:offsets'], arrays['search:names:data'] = _pack_strings(search_names)
+    arrays['search:grams:offsets'], arrays['search:grams:data'] = _pack_strings(grams)
+    arrays['search:postings:offsets'], arrays['search:postings'] = _pack_lists([postings[g] for g in grams])
+
+    header = {
+        'format': FORMAT_VERSION,
+        'source_mtime': source_mtime,
+        'row_count': len(rows),
+        'text_columns': list(TEXT_COLUMNS),
+        'numeric_columns': numeric_columns,
+        'categories': CATEGORIES,
+        'arrays': {},
+    }
+    # Offsets depend on the header length, so lay out the arrays after sizing it
+    position = 0
+    layout = []
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        layout.append((name, array, position))
+        header['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': position}
+        position += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = -(-(len(MAGIC) + 4 + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(MAGIC)
+        file.write(struct.pack('<I', len(header_bytes)))
+        file.write(header_bytes)
+        for name, array, offset in layout:
+            file.seek(data_start + offset)
+            file.write(array.tobytes())
+        file.truncate(data_start + position)
+    os.replace(temp_path, path)
+
+
+class MappedRows:
+    """Read-only sequence of catalog row dicts decoded on access from the mapping"""
+
+    def __init__(self, catalog, positions=None):
+        self._catalog = catalog
+        self._positions = positions
+
+    def __len__(self):
+        return self._catalog.row_count if self._positions is None else len(self._positions)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        position = index if self._positions is None else int(self._positions[index])
+        return self._catalog.row(position)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __bool__(self):
+        return len(self) > 0
+
+
+class MappedNgramIndex:
+    """Search over the trigram postings stored in a mapped snapshot
+
+    Behaves like search_index.NgramIndex.search for the CSV catalog. Queries
+    shorter than a gram have no postings to narrow by, so they check every
+    row; the CSV catalog is small enough for that.
+    """
+
+    def __init__(self, catalog):
+        self._catalog = catalog
+        self._grams = catalog._strings('search:grams')
+        self._names = catalog._strings('search:names')
+        self._posting_offsets = catalog._array('search:postings:offsets')
+        self._postings = catalog._array('search:postings')
+
+    def _posting(self, gram):
+        position = bisect.bisect_left(self._grams, gram)
+        if position < len(self._grams) and self._grams[position] == gram:
+            return self._postings[self._posting_offsets[position]:self._posting_offsets[position + 1]]
+        return None
+
+    def __len__(self):
+        return self._catalog.row_count
+
+    def search(self, query, limit=10):
+        query = normalize(query)
+        if not query:
+            return []
+        postings = []
+        for gram in query_grams(query):
+            posting = self._posting(gram)
+            if posting is None:
+                return []
+            postings.append(posting)
+        positions = min(postings, key=len).tolist() if postings else range(len(self._names))
+        scored = []
+        for position in positions:
+            best = max((score_name(query, name) for name in self._names[position].split('\n')), default=0.0)
+            if best > 0:
+                scored.append((best, position))
+        top = heapq.nlargest(limit, scored, key=lambda item: (item[0], -item[1]))
+        return [self._catalog.row(position) for _, position in top]
+
+
+class MappedStrings:
+    """Sequence of strings backed by an offsets array and a UTF-8 blob"""
+
+    def __init__(self, offsets, data):
+        self._offsets = offsets
+        self._data = data
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        return self._data[self._offsets[index]:self._offsets[index + 1]].tobytes().decode('utf-8')
+
+
+class MappedCatalog:
+    """Read-only view of a snapshot file mapped into memory"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} is not a catalog snapshot')
+        try:
+            (header_length,) = struct.unpack_from('<I', self._mmap, len(MAGIC))
+        except struct.error as e:
+            raise ValueError(f'{path} is truncated') from e
+        header_end = len(MAGIC) + 4 + header_length
+        self.header = json.loads(self._mmap[len(MAGIC) + 4:header_end])
+        if self.header.get('format') != FORMAT_VERSION:
+            raise ValueError(f'{path} has snapshot format {self.header["format"]}')
+        self._data_start = -(-header_end // ALIGNMENT) * ALIGNMENT
+
+        self.row_count = self.header['row_count']
+        self.source_mtime = self.header['source_mtime']
+        self._text = {column: self._strings(f'text:{column}') for column in self.header['text_columns']}
+        self._numeric_columns = self.header['numeric_columns']
+        self.numeric = self._array('numeric')
+        self._categories = self.header['categories']
+        self._category_codes = self._array('category')
+
+        offsets = self._array('category:offsets')
+        category_rows = self._array('category:rows')
+        self.by_category = {
+            category: MappedRows(self, category_rows[offsets[code]:offsets[code + 1]])
+            for code, category in enumerate(self._categories)
+        }
+        self.rows = MappedRows(self)
+        self.search_index = MappedNgramIndex(self)
+
+    def _array(self, name):
+        spec = self.header['arrays'][name]
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape'])) if spec['shape'] else 1
+        array = np.frombuffer(self._mmap, dtype=dtype, count=count, offset=self._data_start + spec['offset'])
+        return array.reshape(spec['shape'])
+
+    def _strings(self, prefix):
+        return MappedStrings(self._array(f'{prefix}:offsets'), self._array(f'{prefix}:data'))
+
+    def row(self, position):
+        """Decode one catalog row into the same dict shape the CSV loader produces"""
+        row = {column: strings[position] for column, strings in self._text.items()}
+        row.update(zip(self._numeric_columns, self.numeric[position].tolist()))
+        row['category'] = self._categories[self._category_codes[position]]
+        return row
+
+
+def load_or_build(snapshot_path, source_mtime, parse_rows):
+    """Map the snapshot for the CSV's current mtime, writing it first if needed
+
+    parse_rows() is only called when the snapshot is missing or stale; the
+    first process to get there writes the file and everyone else maps it.
+    """
+    try:
+        mapped = MappedCatalog(snapshot_path)
+        if mapped.source_mtime == source_mtime:
+            return mapped
+    except (OSError, ValueError):
+        pass
+    write_snapshot(parse_rows(), source_mtime, snapshot_path)
+    return MappedCatalog(snapshot_path)
@@ -0,0 +1,104 @@
+import json
+from datetime import datetime
+
+import click
+
+from app import app
+from catalog import food_catalog
+from utils import sync_foods_from_catalog
+from rollups import rebuild_rollups
+from achievement_batch import DEFAULT_CHUNK_SIZE, DEFAULT_STATE_FILE, recompute_achievements
+from leaderboard import rebuild_leaderboard, refresh_adherence
+from meal_import import IMPORT_BATCH_SIZE, MealImportError, import_meals
+from provisioning import PROVISION_BATCH_SIZE, ProvisioningError, provision_users
+
+
+@app.cli.command('sync-foods')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows per bulk INSERT/UPDATE statement.')
+def sync_foods_command(batch_size):
+    """Sync the Food table with food_data.csv"""
+    counts = sync_foods_from_catalog(batch_size=batch_size)
+    click.echo(f"Inserted {counts['inserted']}, updated {counts['updated']}, unchanged {counts['unchanged']}")
+
+
+@app.cli.command('rebuild-rollups')
+@click.option('--user-id', type=int, default=None, help='Only rebuild this user\'s rows.')
+@click.option('--batch-size', default=10000, show_default=True, help='Meal items fetched per round trip.')
+def rebuild_rollups_command(user_id, batch_size):
+    """Backfill the DailyNutrition rollup from logged meals"""
+    count = rebuild_rollups(user_id=user_id, batch_size=batch_size)
+    click.echo(f"Wrote {count} daily nutrition rows")
+
+
+@app.cli.command('build-catalog-snapshot')
+def build_catalog_snapshot_command():
+    """Write the memory-mapped catalog snapshot shared by all workers"""
+    if not food_catalog.snapshot_path:
+        raise click.ClickException('CATALOG_SNAPSHOT_PATH is empty, snapshots are disabled')
+    path = food_catalog.write_snapshot()
+    click.echo(f"Wrote {path} ({len(food_catalog.rows)} foods)")
+
+
+@app.cli.command('import-meals')
+@click.argument('path', type=click.File('r', encoding='utf-8'))
+@click.option('--batch-size', default=IMPORT_BATCH_SIZE, show_default=True, help='Meals per bulk INSERT statement.')
+def import_meals_command(path, batch_size):
+    """Import meals from a JSON array or NDJSON file in one transaction"""
+    text = path.read()
+    try:
+        records = json.loads(text) if text.lstrip().startswith('[') else [
+            json.loads(line) for line in text.splitlines() if line.strip()]
+    except json.JSONDecodeError as e:
+        raise click.ClickException(f'Could not parse {path.name}: {e}')
+    try:
+        summary = import_meals(records, batch_size=batch_size)
+    except MealImportError as e:
+        for error in e.errors:
+            click.echo(error, err=True)
+        raise click.ClickException(str(e))
+    click.echo(f"Imported {summary['meals']} meals with {summary['items']} items for {summary['users']} users")
+
+
+@app.cli.command('recompute-achievements')
+@click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True, help='Users per chunk.')
+@click.option('--workers', type=int, default=None, help='Worker processes, one per CPU by default.')
+@click.option('--state-file', default=DEFAULT_STATE_FILE, show_default=True, help='Checkpoint used to resume.')
+@click.option('--restart', is_flag=True, help='Ignore any checkpoint and start from the first chunk.')
+def recompute_achievements_command(chunk_size, workers, state_file, restart):
+    """Re-evaluate every user against the achievement rules, e.g. after changing thresholds"""
+    awarded = recompute_achievements(chunk_size=chunk_size, workers=workers, state_file=state_file,
+                                     restart=restart, report=click.echo)
+    click.echo(f"Awarded {awarded} achievements")
+
+
+@app.cli.command('rebuild-leaderboard')
+def rebuild_leaderboard_command():
+    """Recompute every user's leaderboard scores, e.g. after a backfill"""
+    count = rebuild_leaderboard()
+    click.echo(f"Wrote {count} leaderboard scores")
+
+
+@app.cli.command('refresh-leaderboard-adherence')
+def refresh_leaderboard_adherence_command():
+    """Rescore calorie target adherence as the window moves; run once a day, e.g. from cron"""
+    today = datetime.utcnow().date()
+    if refresh_adherence(today):
+        click.echo(f"Rescored adherence for {today}")
+    else:
+        click.echo(f"Adherence was already rescored for {today}")
+
+
+@app.cli.command('provision-users')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=PROVISION_BATCH_SIZE, show_default=True, help='Users per transaction.')
+@click.option('--workers', type=int, default=None, help='Password hashing processes, one per CPU by default.')
+def provision_users_command(path, batch_size, workers):
+    """Create accounts from an employee CSV (username, email, password, optional locale)"""
+    try:
+        with open(path, 'r', encoding='utf-8', newline='') as file:
+            summary = provision_users(file, batch_size=batch_size, workers=workers, report=click.echo)
+    except ProvisioningError as e:
+        raise click.ClickException(str(e))
+    for problem in summary['skipped']:
+        click.echo(problem, err=True)
+    click.echo(f"Created {summary['created']} users, skipped {len(summary['skipped'])} lines")
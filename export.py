@@ -0,0 +1,67 @@
+import csv
+import io
+import json
+
+from app import db
+from models import Food, Meal, MealItem
+from nutrients import NUTRIENTS, portion_multiplier
+
+# One exported row per MealItem, oldest first
+EXPORT_COLUMNS = ('date', 'time', 'meal_id', 'meal_type', 'food_id', 'food_name', 'portion_size') + NUTRIENTS
+EXPORT_BATCH_SIZE = 1000
+
+
+def iter_meal_item_rows(user_id, batch_size=EXPORT_BATCH_SIZE):
+    """Yield lists of export row dicts for every item a user has logged
+
+    Rows are read through yield_per, a server-side cursor where the driver
+    supports one, so only one batch is held in memory at a time.
+    """
+    query = db.select(
+        Meal.date, Meal.time, Meal.id, Meal.meal_type, Food.id, Food.name, MealItem.portion_size,
+        *(getattr(Food, name) for name in NUTRIENTS)
+    ).select_from(Meal).join(
+        MealItem, MealItem.meal_id == Meal.id
+    ).join(
+        Food, Food.id == MealItem.food_id
+    ).where(
+        Meal.user_id == user_id
+    ).order_by(Meal.date, Meal.time, Meal.id, MealItem.id).execution_options(yield_per=batch_size)
+
+    for partition in db.session.execute(query).partitions():
+        rows = []
+        for row in partition:
+            multiplier = portion_multiplier(row[6])
+            values = dict(zip(EXPORT_COLUMNS[:7], row[:7]))
+            values['date'] = values['date'].isoformat() if values['date'] else None
+            values['time'] = values['time'].strftime('%H:%M:%S') if values['time'] else None
+            values.update(
+                (name, round((value or 0) * multiplier, 2)) for name, value in zip(NUTRIENTS, row[7:])
+            )
+            rows.append(values)
+        yield rows
+
+
+def stream_csv(batches):
+    """Yield CSV text, a header line first and then one chunk per batch"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    yield buffer.getvalue()
+    for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue()
+
+
+def stream_ndjson(batches):
+    """Yield newline-delimited JSON, one object per row and one chunk per batch"""
+    for rows in batches:
+        yield ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows)
+
+
+EXPORT_FORMATS = {
+    'csv': (stream_csv, 'text/csv'),
+    'ndjson': (stream_ndjson, 'application/x-ndjson'),
+}
@@ -0,0 +1,251 @@
+import heapq
+import re
+import threading
+import unicodedata
+
+from search_index import FoodSearchIndex, normalize
+
+# The Devanagari, Gujarati, Tamil, Telugu and Kannada Unicode blocks share
+# one layout, so a single table keyed by the offset within the block covers
+# every Indic name column on Food.
+INDIC_BLOCKS = (0x0900, 0x0A80, 0x0B80, 0x0C00, 0x0C80)
+
+INDIC_CONSONANTS = {
+    0x15: 'k', 0x16: 'kh', 0x17: 'g', 0x18: 'gh', 0x19: 'n',
+    0x1A: 'ch', 0x1B: 'chh', 0x1C: 'j', 0x1D: 'jh', 0x1E: 'n',
+    0x1F: 't', 0x20: 'th', 0x21: 'd', 0x22: 'dh', 0x23: 'n',
+    0x24: 't', 0x25: 'th', 0x26: 'd', 0x27: 'dh', 0x28: 'n', 0x29: 'n',
+    0x2A: 'p', 0x2B: 'ph', 0x2C: 'b', 0x2D: 'bh', 0x2E: 'm',
+    0x2F: 'y', 0x30: 'r', 0x31: 'r', 0x32: 'l', 0x33: 'l', 0x34: 'zh', 0x35: 'v',
+    0x36: 'sh', 0x37: 'sh', 0x38: 's', 0x39: 'h',
+}
+INDIC_VOWELS = {
+    0x05: 'a', 0x06: 'aa', 0x07: 'i', 0x08: 'ii', 0x09: 'u', 0x0A: 'uu', 0x0B: 'ri',
+    0x0D: 'e', 0x0E: 'e', 0x0F: 'e', 0x10: 'ai', 0x11: 'o', 0x12: 'o', 0x13: 'o', 0x14: 'au',
+}
+INDIC_VOWEL_SIGNS = {
+    0x3E: 'aa', 0x3F: 'i', 0x40: 'ii', 0x41: 'u', 0x42: 'uu', 0x43: 'ri',
+    0x45: 'e', 0x46: 'e', 0x47: 'e', 0x48: 'ai', 0x49: 'o', 0x4A: 'o', 0x4B: 'o', 0x4C: 'au',
+}
+INDIC_NASALS = {0x01: 'n', 0x02: 'm'}
+INDIC_VIRAMA = 0x4D
+
+PHONETIC_RULES = [
+    (re.compile(r'([bcdgjkptsz])h'), r'\1'),   # drop aspiration: chh -> c, bh -> b
+    (re.compile(r'ph'), 'f'),
+    (re.compile(r'[wv]'), 'v'),
+    (re.compile(r'q'), 'k'),
+    (re.compile(r'x'), 'ks'),
+    (re.compile(r'z'), 'j'),
+    (re.compile(r'y(?![aeiou])'), 'i'),        # trailing or pre-consonant y is a vowel
+    (re.compile(r'[aeiou]+'), 'a'),            # vowel quality varies most between spellings
+    (re.compile(r'(.)\1+'), r'\1'),            # doubled letters
+]
+
+
+def _indic_offset(char):
+    code = ord(char)
+    for base in INDIC_BLOCKS:
+        if base <= code < base + 0x80:
+            return code - base
+    return None
+
+
+def transliterate(text):
+    """Romanize Indic script in normalized text; other scripts lose their accents"""
+    out = []
+    pending_vowel = False
+    for char in text:
+        offset = _indic_offset(char)
+        if offset is None:
+            # Leaving the script ends the word; its inherent vowel is silent
+            pending_vowel = False
+            out.append(char)
+        elif offset in INDIC_CONSONANTS:
+            if pending_vowel:
+                out.append('a')
+            out.append(INDIC_CONSONANTS[offset])
+            pending_vowel = True
+        elif offset in INDIC_VOWEL_SIGNS:
+            out.append(INDIC_VOWEL_SIGNS[offset])
+            pending_vowel = False
+        elif offset == INDIC_VIRAMA:
+            pending_vowel = False
+        elif offset in INDIC_NASALS:
+            if pending_vowel:
+                out.append('a')
+                pending_vowel = False
+            out.append(INDIC_NASALS[offset])
+        elif offset in INDIC_VOWELS:
+            if pending_vowel:
+                out.append('a')
+                pending_vowel = False
+            out.append(INDIC_VOWELS[offset])
+    # A word-final consonant drops its inherent vowel (schwa deletion), so a
+    # vowel still pending at the end or before a non-Indic character is skipped
+    text = ''.join(out)
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def phonetic_key(word):
+    """Collapse a romanized word to a spelling-insensitive key ("chai", "chay" -> "ca")"""
+    for pattern, replacement in PHONETIC_RULES:
+        word = pattern.sub(replacement, word)
+    return word
+
+
+def word_keys(text):
+    """Return the phonetic keys for each word of a name or query"""
+    words = transliterate(normalize(text).replace(' ', '\x00')).split('\x00')
+    return [key for key in (phonetic_key(word) for word in words) if key]
+
+
+def max_distance(key):
+    """Edit-distance budget for a key: none for very short keys, then 1, then 2"""
+    if len(key) <= 2:
+        return 0
+    if len(key) <= 5:
+        return 1
+    return 2
+
+
+def bounded_levenshtein(a, b, bound):
+    """Levenshtein distance, or bound + 1 as soon as it is known to exceed bound"""
+    if abs(len(a) - len(b)) > bound:
+        return bound + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            ))
+        if min(current) > bound:
+            return bound + 1
+        previous = current
+    return previous[-1]
+
+
+def deletes(word, depth):
+    """Return every string reachable from word by removing up to depth characters"""
+    found = {word}
+    frontier = {word}
+    for _ in range(depth):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        found |= frontier
+    return found
+
+
+class DeletionIndex:
+    """Symmetric-delete dictionary for bounded edit-distance lookups
+
+    Every word is stored under all of its deletion variants, so two words
+    within distance d share a variant made of at most d deletions each.
+    A lookup generates the query's variants, gathers candidate words from
+    the precomputed table and verifies them, without touching the rest of
+    the vocabulary.
+    """
+
+    def __init__(self, max_depth=2):
+        self.max_depth = max_depth
+        self._variants = {}
+
+    def add(self, word):
+        for variant in deletes(word, min(self.max_depth, max_distance(word))):
+            self._variants.setdefault(variant, []).append(word)
+
+    def search(self, word, bound):
+        """Return (distance, word) pairs within bound of word"""
+        candidates = set()
+        for variant in deletes(word, min(bound, self.max_depth)):
+            candidates.update(self._variants.get(variant, ()))
+        matches = []
+        for candidate in candidates:
+            distance = bounded_levenshtein(word, candidate, bound)
+            if distance <= bound:
+                matches.append((distance, candidate))
+        return matches
+
+
+class FuzzyIndex:
+    """Word-level fuzzy index over phonetic keys of every name of a document
+
+    Documents rank by how many query words they match, then by the total
+    edit distance of those matches, then by how short their names are.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._words = DeletionIndex()
+        self._postings = {}
+        self._lengths = []
+        self._payloads = []
+        self._doc_for_key = {}
+
+    def __len__(self):
+        return len(self._doc_for_key)
+
+    def add(self, key, names, payload):
+        """Index a document under all of its names, replacing any older version"""
+        keys = set()
+        length = None
+        for name in names:
+            name_keys = word_keys(name) if name else []
+            keys.update(name_keys)
+            if name_keys:
+                length = min(length or len(name_keys), len(name_keys))
+
+        with self._lock:
+            old_doc = self._doc_for_key.get(key)
+            if old_doc is not None:
+                self._payloads[old_doc] = None
+            doc = len(self._payloads)
+            self._payloads.append(payload)
+            self._lengths.append(length or 0)
+            self._doc_for_key[key] = doc
+            for word_key in keys:
+                posting = self._postings.get(word_key)
+                if posting is None:
+                    posting = self._postings[word_key] = []
+                    self._words.add(word_key)
+                posting.append(doc)
+
+    def remove(self, key):
+        """Drop a document from the results"""
+        with self._lock:
+            doc = self._doc_for_key.pop(key, None)
+            if doc is not None:
+                self._payloads[doc] = None
+
+    def search(self, query, limit=10):
+        """Return up to `limit` payloads whose names approximately match the query"""
+        query_keys = list(dict.fromkeys(word_keys(query)))
+        if not query_keys:
+            return []
+
+        # doc -> [matched words, total distance]
+        hits = {}
+        for query_key in query_keys:
+            best = {}
+            for distance, word_key in self._words.search(query_key, max_distance(query_key)):
+                for doc in self._postings[word_key]:
+                    if distance < best.get(doc, distance + 1):
+                        best[doc] = distance
+            for doc, distance in best.items():
+                hit = hits.setdefault(doc, [0, 0])
+                hit[0] += 1
+                hit[1] += distance
+
+        ranked = heapq.nsmallest(
+            limit,
+            ((-matched, distance, self._lengths[doc], doc)
+             for doc, (matched, distance) in hits.items()
+             if self._payloads[doc] is not None),
+        )
+        return [self._payloads[item[-1]] for item in ranked]
+
+
+food_fuzzy_index = FoodSearchIndex(index_factory=FuzzyIndex)
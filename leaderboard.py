@@ -0,0 +1,414 @@
+import bisect
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import app, db
+from models import DailyNutrition, LeaderboardChange, LeaderboardScore, Meal, UserCounter, UserProfile, UserStreak
+from achievements import MEALS_LOGGED
+from analytics import ADHERENCE_TOLERANCE
+from nutrients import DEFAULT_TARGETS
+from streaks import longest_streaks_between
+from upserts import UPSERT_DIALECTS
+from versions import LEADERBOARD, shared_versions
+
+# Leaderboard metrics and their titles
+METRICS = {
+    'meals': 'Meals logged',
+    'streak': 'Longest streak',
+    'adherence': 'Calorie target adherence',
+}
+# Scores are integers; adherence is stored in tenths of a percent
+SCORE_SCALE = {'adherence': 10}
+
+# Adherence is the share of logged days in the window within tolerance of the
+# calorie target; users with fewer logged days are not ranked on it
+ADHERENCE_WINDOW_DAYS = 30
+ADHERENCE_MIN_DAYS = 7
+
+# Shared version claimed by the one run that rescores adherence each day
+ADHERENCE_VERSION = 'leaderboard_adherence'
+
+# A change id skipped by a poll may belong to a transaction still in flight;
+# it is looked for again for this many seconds, then taken as rolled back
+LEADERBOARD_GAP_TIMEOUT = 60
+# Only this many ids below the newest are tracked as gaps; a sequence that
+# jumped further, e.g. after a restart, skipped ids nobody will commit
+LEADERBOARD_MAX_GAPS = 1000
+# LeaderboardChange rows older than this are deleted by the daily refresh
+LEADERBOARD_CHANGE_RETENTION = timedelta(days=1)
+# Users whose scores are read per query when applying changes
+APPLY_BATCH_SIZE = 500
+
+PENDING_KEY = 'leaderboard_pending'
+
+
+class FenwickTree:
+    """Binary indexed tree of counts over the integers [0, size), growing on demand"""
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.tree = [0] * (size + 1)
+        self.total = 0
+
+    def _grow(self, index):
+        counts = [self.count(i) for i in range(self.size)]
+        size = self.size
+        while size <= index:
+            size *= 2
+        self.__init__(size)
+        for i, count in enumerate(counts):
+            if count:
+                self.add(i, count)
+
+    def add(self, index, delta):
+        if index >= self.size:
+            self._grow(index)
+        self.total += delta
+        index += 1
+        while index <= self.size:
+            self.tree[index] += delta
+            index += index & -index
+
+    def prefix(self, index):
+        """Sum of the counts at positions [0, index]"""
+        index = min(index, self.size - 1) + 1
+        total = 0
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+    def count(self, index):
+        return self.prefix(index) - (self.prefix(index - 1) if index else 0)
+
+    def find(self, k):
+        """Return the smallest position whose prefix sum reaches k (1 <= k <= total)"""
+        position = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            following = position + step
+            if following <= self.size and self.tree[following] < k:
+                position = following
+                k -= self.tree[following]
+            step >>= 1
+        return position
+
+
+class MetricRanking:
+    """Users ranked by one integer score; rank and top-N in O(log max score) per step
+
+    Users with a score of zero or less are not ranked. Each score's bucket
+    holds its user ids sorted, so top() slices ties without sorting them.
+    """
+
+    def __init__(self):
+        self.scores = {}
+        self.buckets = defaultdict(list)
+        self.counts = FenwickTree()
+
+    def set(self, user_id, score):
+        old = self.scores.pop(user_id, None)
+        if old is not None:
+            bucket = self.buckets[old]
+            del bucket[bisect.bisect_left(bucket, user_id)]
+            if not bucket:
+                del self.buckets[old]
+            self.counts.add(old, -1)
+        if score > 0:
+            self.scores[user_id] = score
+            bisect.insort(self.buckets[score], user_id)
+            self.counts.add(score, 1)
+
+    def __len__(self):
+        return self.counts.total
+
+    def rank(self, user_id):
+        """Return 1 + the number of users with a strictly higher score, or None"""
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        return self.counts.total - self.counts.prefix(score) + 1
+
+    def top(self, limit):
+        """Return [(rank, user_id, score)] for the best users, ties sharing a rank"""
+        results = []
+        remaining = self.counts.total
+        while remaining and len(results) < limit:
+            score = self.counts.find(remaining)
+            rank = self.counts.total - remaining + 1
+            members = self.buckets[score]
+            results.extend((rank, user_id, score) for user_id in members[:limit - len(results)])
+            remaining -= len(members)
+        return results
+
+
+def adherence_score(daily_calories, target):
+    """Score the share of logged days within tolerance of the calorie target, 0 below the minimum"""
+    if len(daily_calories) < ADHERENCE_MIN_DAYS:
+        return 0
+    target = target or DEFAULT_TARGETS['calories']
+    within = sum(1 for value in daily_calories if abs(value - target) <= ADHERENCE_TOLERANCE * target)
+    return round(within * 100 * SCORE_SCALE['adherence'] / len(daily_calories))
+
+
+def _adherence_score(user_id, today):
+    start = today - timedelta(days=ADHERENCE_WINDOW_DAYS - 1)
+    calories = [row[0] for row in db.session.query(db.func.sum(DailyNutrition.calories)).filter(
+        DailyNutrition.user_id == user_id,
+        DailyNutrition.date >= start,
+        DailyNutrition.date <= today
+    ).group_by(DailyNutrition.date)]
+    if len(calories) < ADHERENCE_MIN_DAYS:
+        return 0
+    return adherence_score(calories, db.session.query(UserProfile.target_calories).filter_by(user_id=user_id).scalar())
+
+
+def compute_user_scores(user_id):
+    """Return {metric: score} for one user from the counters kept as meals are logged"""
+    meals = db.session.query(UserCounter.value).filter_by(user_id=user_id, name=MEALS_LOGGED).scalar()
+    streak = db.session.query(UserStreak.longest_streak).filter_by(user_id=user_id).scalar()
+    return {
+        'meals': meals or 0,
+        'streak': streak or 0,
+        'adherence': _adherence_score(user_id, datetime.utcnow().date()),
+    }
+
+
+def _save_scores(user_id, scores):
+    rows = [{'metric': metric, 'user_id': user_id, 'score': score} for metric, score in scores.items()]
+    dialect_insert = UPSERT_DIALECTS.get(db.session.get_bind().dialect.name)
+    if dialect_insert is not None:
+        statement = dialect_insert(LeaderboardScore).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=['metric', 'user_id'], set_={'score': statement.excluded.score})
+        db.session.execute(statement)
+        return
+    existing = {row.metric: row for row in LeaderboardScore.query.filter_by(user_id=user_id)}
+    for row in rows:
+        if row['metric'] in existing:
+            existing[row['metric']].score = row['score']
+        else:
+            db.session.add(LeaderboardScore(**row))
+
+
+class Leaderboard:
+    """Per-metric rankings held in memory and persisted in LeaderboardScore
+
+    update_user() writes a user's scores in the caller's transaction and
+    logs the user in LeaderboardChange; the in-memory rankings change only
+    once that transaction commits. Rankings are loaded from the table on
+    first use. After that, at most every poll_interval seconds, a worker
+    reads the changes logged since its last poll and re-reads just those
+    users' scores. Bulk rewrites bump the shared LEADERBOARD version, which
+    makes every worker load the table again.
+    """
+
+    def __init__(self, poll_interval=1.0):
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self.reset()
+
+    def _ensure_loaded(self):
+        if self._rankings is not None and time.monotonic() < self._next_poll:
+            return self._rankings
+        with self._lock:
+            if self._rankings is None:
+                self._load()
+            elif time.monotonic() >= self._next_poll:
+                self._poll_changes()
+            self._next_poll = time.monotonic() + self.poll_interval
+            return self._rankings
+
+    def _load(self):
+        # Changes from the last LEADERBOARD_GAP_TIMEOUT seconds are read
+        # again by the next poll, in case their transactions had not yet
+        # committed when the scores were read
+        settled = datetime.utcnow() - timedelta(seconds=LEADERBOARD_GAP_TIMEOUT)
+        last_settled = db.session.query(db.func.max(LeaderboardChange.id)).filter(
+            LeaderboardChange.changed_at < settled).scalar()
+        if last_settled is None:
+            # Start just below the oldest change rather than at 0, so ids
+            # pruned long ago are not taken for gaps
+            oldest = db.session.query(db.func.min(LeaderboardChange.id)).scalar()
+            last_settled = oldest - 1 if oldest is not None else 0
+        self._last_change_id = last_settled
+        self._gaps = {}
+        rankings = {metric: MetricRanking() for metric in METRICS}
+        query = db.session.query(LeaderboardScore.metric, LeaderboardScore.user_id, LeaderboardScore.score)
+        for metric, user_id, score in query:
+            if metric in rankings:
+                rankings[metric].set(user_id, score)
+        self._rankings = rankings
+
+    def _poll_changes(self):
+        now = time.monotonic()
+        self._gaps = {change_id: seen for change_id, seen in self._gaps.items() if now - seen < LEADERBOARD_GAP_TIMEOUT}
+        condition = LeaderboardChange.id > self._last_change_id
+        if self._gaps:
+            condition = db.or_(condition, LeaderboardChange.id.in_(list(self._gaps)))
+        changes = db.session.query(LeaderboardChange.id, LeaderboardChange.user_id).filter(condition).all()
+        if not changes:
+            return
+
+        found = set()
+        for change_id, _ in changes:
+            found.add(change_id)
+            self._gaps.pop(change_id, None)
+        newest = max(found)
+        # Ids below the newest that are missing may still be committing
+        for change_id in range(max(self._last_change_id + 1, newest - LEADERBOARD_MAX_GAPS), newest):
+            if change_id not in found:
+                self._gaps[change_id] = now
+        self._last_change_id = max(self._last_change_id, newest)
+        self._apply_scores({user_id for _, user_id in changes})
+
+    def _apply_scores(self, user_ids):
+        user_ids = sorted(user_ids)
+        for start in range(0, len(user_ids), APPLY_BATCH_SIZE):
+            batch = user_ids[start:start + APPLY_BATCH_SIZE]
+            scores = {user_id: dict.fromkeys(METRICS, 0) for user_id in batch}
+            query = db.session.query(LeaderboardScore.user_id, LeaderboardScore.metric, LeaderboardScore.score).filter(
+                LeaderboardScore.user_id.in_(batch))
+            for user_id, metric, score in query:
+                if metric in METRICS:
+                    scores[user_id][metric] = score
+            for user_id, user_scores in scores.items():
+                for metric, score in user_scores.items():
+                    self._rankings[metric].set(user_id, score)
+
+    def reset(self):
+        """Drop the rankings so they are reloaded from the table on next use"""
+        with self._lock:
+            self._rankings = None
+            self._last_change_id = 0
+            self._gaps = {}
+            self._next_poll = 0.0
+
+    def update_user(self, user_id):
+        """Recompute and store a user's scores; call before committing the meal"""
+        scores = compute_user_scores(user_id)
+        _save_scores(user_id, scores)
+        db.session.execute(db.insert(LeaderboardChange).values(user_id=user_id, changed_at=datetime.utcnow()))
+        db.session.info.setdefault(PENDING_KEY, {})[user_id] = scores
+        return scores
+
+    def apply(self, pending):
+        """Move committed {user_id: {metric: score}} updates into the rankings"""
+        if self._rankings is None:
+            return
+        with self._lock:
+            if self._rankings is None:
+                return
+            for user_id, scores in pending.items():
+                for metric, score in scores.items():
+                    self._rankings[metric].set(user_id, score)
+
+    def top(self, metric, limit=10):
+        return self._ensure_loaded()[metric].top(limit)
+
+    def standing(self, metric, user_id):
+        """Return (rank, score, ranked user count) for a user; rank is None if unranked"""
+        ranking = self._ensure_loaded()[metric]
+        return ranking.rank(user_id), ranking.scores.get(user_id, 0), len(ranking)
+
+
+def display_score(metric, score):
+    return score / SCORE_SCALE[metric] if metric in SCORE_SCALE else score
+
+
+def _adherence_scores(today):
+    """Return {user_id: adherence score} over the window ending today, with grouped queries"""
+    start = today - timedelta(days=ADHERENCE_WINDOW_DAYS - 1)
+    targets = dict(db.session.query(UserProfile.user_id, UserProfile.target_calories))
+    days = defaultdict(list)
+    daily = db.session.query(DailyNutrition.user_id, db.func.sum(DailyNutrition.calories)).filter(
+        DailyNutrition.date >= start, DailyNutrition.date <= today
+    ).group_by(DailyNutrition.user_id, DailyNutrition.date)
+    for user_id, calories in daily:
+        days[user_id].append(calories)
+    return {user_id: adherence_score(calories, targets.get(user_id)) for user_id, calories in days.items()}
+
+
+def _insert_scores(rows):
+    for start_row in range(0, len(rows), 10000):
+        db.session.execute(db.insert(LeaderboardScore), rows[start_row:start_row + 10000])
+
+
+def refresh_adherence(today):
+    """Rescore adherence for every user once per day, as the window moves; returns True if this call did
+
+    Adherence is otherwise only rescored when a user logs a meal, so users
+    who stopped logging would keep the score of their last active day. Run
+    daily by `flask refresh-leaderboard-adherence`, e.g. from cron, never
+    from a request. Exactly one run wins the day's claim; it also prunes
+    old LeaderboardChange rows and bumps LEADERBOARD so every worker reloads.
+    """
+    if not shared_versions.claim(ADHERENCE_VERSION, today.toordinal()):
+        db.session.commit()
+        return False
+    try:
+        db.session.execute(db.delete(LeaderboardScore).where(LeaderboardScore.metric == 'adherence'))
+        _insert_scores([
+            {'metric': 'adherence', 'user_id': user_id, 'score': score}
+            for user_id, score in _adherence_scores(today).items() if score > 0
+        ])
+        db.session.execute(db.delete(LeaderboardChange).where(
+            LeaderboardChange.changed_at < datetime.utcnow() - LEADERBOARD_CHANGE_RETENTION))
+        shared_versions.bump(LEADERBOARD)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return True
+
+
+def rebuild_leaderboard():
+    """Recompute every user's scores with grouped queries; returns the rows written"""
+    meals = dict(db.session.query(UserCounter.user_id, UserCounter.value).filter(UserCounter.name == MEALS_LOGGED))
+    # Counters are created lazily; count meals for users that have none yet
+    counted = db.session.query(Meal.user_id, db.func.count(Meal.id)).group_by(Meal.user_id)
+    for user_id, count in counted:
+        meals.setdefault(user_id, count)
+
+    low, high = db.session.query(db.func.min(Meal.user_id), db.func.max(Meal.user_id)).one()
+    streaks = longest_streaks_between(low, high) if low is not None else {}
+
+    today = datetime.utcnow().date()
+    adherence = _adherence_scores(today)
+
+    rows = [
+        {'metric': metric, 'user_id': user_id, 'score': score}
+        for metric, scores in (('meals', meals), ('streak', streaks), ('adherence', adherence))
+        for user_id, score in scores.items() if score > 0
+    ]
+    db.session.execute(db.delete(LeaderboardScore))
+    _insert_scores(rows)
+    # Every worker reloads the whole table, so the change log is not needed,
+    # and today's adherence is already fresh
+    db.session.execute(db.delete(LeaderboardChange))
+    shared_versions.claim(ADHERENCE_VERSION, today.toordinal())
+    shared_versions.bump(LEADERBOARD)
+    db.session.commit()
+    leaderboard.reset()
+    return len(rows)
+
+
+leaderboard = Leaderboard(app.config['SHARED_VERSION_POLL_INTERVAL'])
+shared_versions.on_change(LEADERBOARD, leaderboard.reset)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_committed_scores(session):
+    pending = session.info.pop(PENDING_KEY, None)
+    if pending:
+        leaderboard.apply(pending)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_rolled_back_scores(session, previous_transaction):
+    session.info.pop(PENDING_KEY, None)
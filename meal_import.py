@@ -0,0 +1,140 @@
+from collections import Counter
+from datetime import date, datetime, time
+
+from app import db
+from models import Food, Meal, MealItem, User
+from nutrients import PORTION_MULTIPLIERS
+from rollups import record_meals
+from achievements import achievement_engine, MEALS_LOGGED
+from streaks import record_active_day
+from leaderboard import leaderboard
+from autocomplete import food_autocomplete
+from response_cache import response_cache
+
+MEAL_TYPES = ('breakfast', 'lunch', 'dinner', 'snack')
+IMPORT_BATCH_SIZE = 1000
+
+
+class MealImportError(ValueError):
+    """Raised when a batch fails validation; errors lists one message per problem"""
+
+    def __init__(self, errors):
+        super().__init__(f'{len(errors)} problem(s) in the meal batch')
+        self.errors = errors
+
+
+def _parse_meal(index, record, user_ids, food_ids, errors):
+    """Return (meal values, items) for one record, appending any problems to errors"""
+    def error(message):
+        errors.append(f'meal {index}: {message}')
+
+    if not isinstance(record, dict):
+        error('must be an object')
+        return None
+    user_id = record.get('user_id')
+    if user_id not in user_ids:
+        error(f'unknown user_id {user_id!r}')
+    try:
+        meal_date = date.fromisoformat(record['date'])
+        meal_time = time.fromisoformat(record['time']) if record.get('time') else datetime.utcnow().time()
+    except (KeyError, TypeError, ValueError):
+        error('date must be YYYY-MM-DD and time HH:MM[:SS]')
+        return None
+    meal_type = record.get('meal_type') or 'snack'
+    if meal_type not in MEAL_TYPES:
+        error(f'unknown meal_type {meal_type!r}')
+
+    items = []
+    for item in record.get('items') or ():
+        food_id = item.get('food_id') if isinstance(item, dict) else None
+        portion_size = (item.get('portion_size') if isinstance(item, dict) else None) or 'medium'
+        if food_id not in food_ids:
+            error(f'unknown food_id {food_id!r}')
+        if portion_size not in PORTION_MULTIPLIERS:
+            error(f'unknown portion_size {portion_size!r}')
+        items.append((food_id, portion_size))
+    if not items:
+        error('needs at least one item')
+
+    meal = {'user_id': user_id, 'date': meal_date, 'time': meal_time, 'meal_type': meal_type}
+    return meal, items
+
+
+def _insert_meals(meals):
+    """Insert Meal rows and return their ids in the same order"""
+    if db.session.get_bind().dialect.insert_executemany_returning_sort_by_parameter_order:
+        statement = db.insert(Meal).returning(Meal.id, sort_by_parameter_order=True)
+        return db.session.execute(statement, meals).scalars().all()
+    # No ordered RETURNING on this database; let the ORM batch the inserts
+    objects = [Meal(**values) for values in meals]
+    db.session.add_all(objects)
+    db.session.flush()
+    return [meal.id for meal in objects]
+
+
+def import_meals(records, batch_size=IMPORT_BATCH_SIZE):
+    """Validate and write a batch of meals for any number of users in one transaction
+
+    records is a list of dicts with user_id, date, optional time and
+    meal_type, and items as a list of {food_id, portion_size}. Users and
+    foods are checked with one query each; nothing is written if any record
+    is invalid. Meals and items go in with bulk INSERTs, the rollup gets one
+    upsert per (user, day, meal type) and achievements are checked once per
+    user, with streaks advanced once per distinct day and leaderboard scores
+    once per user. Returns a summary dict.
+    """
+    records = list(records)
+    user_ids = {record.get('user_id') for record in records if isinstance(record, dict)}
+    food_ids = {
+        item.get('food_id') for record in records if isinstance(record, dict)
+        for item in record.get('items') or () if isinstance(item, dict)
+    }
+    user_ids = {row[0] for row in db.session.query(User.id).filter(
+        User.id.in_([i for i in user_ids if isinstance(i, int)]))}
+    food_ids = {row[0] for row in db.session.query(Food.id).filter(
+        Food.id.in_([i for i in food_ids if isinstance(i, int)]))}
+
+    errors = []
+    parsed = [_parse_meal(index, record, user_ids, food_ids, errors) for index, record in enumerate(records)]
+    if errors:
+        raise MealImportError(errors)
+
+    try:
+        item_count = 0
+        for start in range(0, len(parsed), batch_size):
+            batch = parsed[start:start + batch_size]
+            meal_ids = _insert_meals([meal for meal, _ in batch])
+            item_rows = [
+                {'meal_id': meal_id, 'food_id': food_id, 'portion_size': portion_size}
+                for meal_id, (_, items) in zip(meal_ids, batch) for food_id, portion_size in items
+            ]
+            db.session.execute(db.insert(MealItem), item_rows)
+            item_count += len(item_rows)
+
+        record_meals([(meal['user_id'], meal['date'], meal['meal_type'], items) for meal, items in parsed])
+        meals_per_user = Counter(meal['user_id'] for meal, _ in parsed)
+        affected_users = sorted(meals_per_user)
+        achievements = {}
+        days_per_user = {}
+        for meal, _ in parsed:
+            days_per_user.setdefault(meal['user_id'], set()).add(meal['date'])
+        for user_id in affected_users:
+            awarded = achievement_engine.record_event(user_id, MEALS_LOGGED, meals_per_user[user_id])
+            for day in sorted(days_per_user[user_id]):
+                awarded += record_active_day(user_id, day)
+            leaderboard.update_user(user_id)
+            if awarded:
+                achievements[user_id] = awarded
+        response_cache.invalidate_users(affected_users)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    food_autocomplete.record_use([food_id for _, items in parsed for food_id, _ in items])
+    return {
+        'meals': len(parsed),
+        'items': item_count,
+        'users': len(affected_users),
+        'achievements': achievements,
+    }
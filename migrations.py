@@ -0,0 +1,70 @@
+"""Data migrations run at startup, each by exactly one worker
+
+The app has no schema migration tool: db.create_all() adds new tables but
+leaves existing ones alone. Each step here runs once per database. Steps
+are numbered by their position in MIGRATIONS; the worker that raises the
+shared 'migrations' version to a step's number runs it in the same
+transaction, and every other worker waits for that commit and skips it.
+Only ever append new steps.
+"""
+import logging
+
+from sqlalchemy.schema import CreateIndex
+
+from app import db
+from versions import shared_versions
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_VERSION = 'migrations'
+
+
+def backfill_rollups():
+    """Fill DailyNutrition from the meals logged before the rollup existed"""
+    from rollups import rebuild_rollups
+
+    count = rebuild_rollups()
+    logger.info("Backfilled %d daily nutrition rows", count)
+
+
+def unique_user_achievements():
+    """Drop duplicate awards left by racing requests, then stop new ones at the database"""
+    from models import UserAchievement
+
+    first_awards = db.session.query(db.func.min(UserAchievement.id)).group_by(
+        UserAchievement.user_id, UserAchievement.achievement_id)
+    deleted = db.session.execute(
+        db.delete(UserAchievement).where(UserAchievement.id.not_in(first_awards.scalar_subquery()))).rowcount
+    for index in UserAchievement.__table__.indexes:
+        if index.unique:
+            db.session.execute(CreateIndex(index, if_not_exists=True))
+    logger.info("Removed %d duplicate user achievements", deleted)
+
+
+def recount_rollup_meals():
+    """Roll up again so meal_count stops counting meals that have no items"""
+    from rollups import rebuild_rollups
+
+    count = rebuild_rollups()
+    logger.info("Recounted meals in %d daily nutrition rows", count)
+
+
+MIGRATIONS = [
+    backfill_rollups,
+    unique_user_achievements,
+    recount_rollup_meals,
+]
+
+
+def run_migrations():
+    """Run every step this database has not seen yet"""
+    for number, migration in enumerate(MIGRATIONS, 1):
+        if shared_versions.claim(MIGRATIONS_VERSION, number):
+            try:
+                migration()
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+        else:
+            db.session.rollback()
@@ -1,12 +1,21 @@
 from datetime import datetime
-from app import db, login_manager
+from app import app, db, login_manager
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from password_hashing import password_hasher
+from user_cache import UserCache
+from nutrients import NUTRIENTS, portion_multiplier, round_totals, nutrient_store
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    """Load the logged-in user, from the per-process cache when possible"""
+    user_id = int(user_id)
+    user = user_cache.get(user_id, db.session)
+    if user is None:
+        user = db.session.get(User, user_id)
+        if user is not None:
+            user_cache.put(user)
+    return user
 
 
 class User(UserMixin, db.Model):
@@ -23,10 +32,16 @@ class User(UserMixin, db.Model):
     achievements = db.relationship('UserAchievement', backref='user', lazy='dynamic')
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
         
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return password_hasher.needs_rehash(self.password_hash)
+
+
+user_cache = UserCache(User, max_size=app.config['USER_CACHE_SIZE'], ttl=app.config['USER_CACHE_TTL'])
 
 
 class UserProfile(db.Model):
@@ -85,6 +100,12 @@ class Food(db.Model):
     carbs = db.Column(db.Float)  # in grams
     fat = db.Column(db.Float)  # in grams
     fiber = db.Column(db.Float, default=0.0)  # in grams
+    free_sugar = db.Column(db.Float, default=0.0)  # in grams
+    sodium = db.Column(db.Float, default=0.0)  # in milligrams
+    calcium = db.Column(db.Float, default=0.0)  # in milligrams
+    iron = db.Column(db.Float, default=0.0)  # in milligrams
+    vitamin_c = db.Column(db.Float, default=0.0)  # in milligrams
+    folate = db.Column(db.Float, default=0.0)  # in micrograms
     category = db.Column(db.String(50))  # e.g., protein, carbs, vegetables
     is_custom = db.Column(db.Boolean, default=False)
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
@@ -100,19 +121,8 @@ class Food(db.Model):
         
     def get_nutrition_for_portion(self, portion_size):
         """Calculate nutrition based on portion size"""
-        multiplier = {
-            'small': 0.75,
-            'medium': 1.0,
-            'large': 1.5
-        }.get(portion_size.lower(), 1.0)
-        
-        return {
-            'calories': int(self.calories * multiplier),
-            'protein': round(self.protein * multiplier, 1),
-            'carbs': round(self.carbs * multiplier, 1),
-            'fat': round(self.fat * multiplier, 1),
-            'fiber': round(self.fiber * multiplier, 1)
-        }
+        multiplier = portion_multiplier(portion_size)
+        return round_totals([(getattr(self, name) or 0) * multiplier for name in NUTRIENTS])
 
 
 class Meal(db.Model):
@@ -122,29 +132,39 @@ class Meal(db.Model):
     time = db.Column(db.Time, default=datetime.utcnow().time)
     meal_type = db.Column(db.String(20))  # breakfast, lunch, dinner, snack
     
-    # Relationships
-    items = db.relationship('MealItem', backref='meal', lazy='dynamic')
+    # Relationships; a plain list so it can be eager loaded (see utils.get_meals_in_range)
+    items = db.relationship('MealItem', backref='meal')
     
     @property
     def total_nutrition(self):
-        """Calculate total nutrition for all items in the meal"""
-        totals = {
-            'calories': 0,
-            'protein': 0,
-            'carbs': 0,
-            'fat': 0,
-            'fiber': 0
-        }
+        """Calculate total nutrition for all items in the meal
         
-        for item in self.items:
-            food_nutrition = item.food.get_nutrition_for_portion(item.portion_size)
-            totals['calories'] += food_nutrition['calories']
-            totals['protein'] += food_nutrition['protein']
-            totals['carbs'] += food_nutrition['carbs']
-            totals['fat'] += food_nutrition['fat']
-            totals['fiber'] += food_nutrition['fiber']
-            
+        Computed once per instance, i.e. once per request with the default
+        request-scoped session; load_totals() fills it for many meals at once.
+        """
+        totals = self.__dict__.get('_total_nutrition')
+        if totals is None:
+            Meal.load_totals([self])
+            totals = self.__dict__['_total_nutrition']
         return totals
+    
+    @staticmethod
+    def load_totals(meals):
+        """Compute and cache total_nutrition for meals whose items are loaded
+        
+        Sums every item of every meal in one pass over the nutrient matrix
+        instead of issuing queries per meal.
+        """
+        meals = [meal for meal in meals if '_total_nutrition' not in meal.__dict__]
+        food_ids, portion_sizes, groups = [], [], []
+        for position, meal in enumerate(meals):
+            for item in meal.items:
+                food_ids.append(item.food_id)
+                portion_sizes.append(item.portion_size)
+                groups.append(position)
+        totals = nutrient_store.grouped_totals(food_ids, portion_sizes, groups, len(meals))
+        for meal, vector in zip(meals, totals):
+            meal.__dict__['_total_nutrition'] = round_totals(vector)
 
 
 class MealItem(db.Model):
@@ -170,7 +190,85 @@ class Achievement(db.Model):
 
 
 class UserAchievement(db.Model):
+    # An index rather than a constraint so migrations.py can add it to existing tables
+    __table_args__ = (
+        db.Index('uq_user_achievement_user_id_achievement_id', 'user_id', 'achievement_id', unique=True),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     achievement_id = db.Column(db.Integer, db.ForeignKey('achievement.id'), nullable=False)
     earned_date = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class UserCounter(db.Model):
+    """Running per-user count behind an achievement requirement_type, e.g. meals_logged"""
+    __table_args__ = (db.UniqueConstraint('user_id', 'name'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    name = db.Column(db.String(50), nullable=False)
+    value = db.Column(db.Integer, default=0, nullable=False)
+
+
+class UserStreak(db.Model):
+    """Consecutive days with at least one logged meal, maintained as meals are logged"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), unique=True, nullable=False)
+    current_streak = db.Column(db.Integer, default=0, nullable=False)
+    longest_streak = db.Column(db.Integer, default=0, nullable=False)
+    last_active_date = db.Column(db.Date)
+
+
+class LeaderboardScore(db.Model):
+    """A user's current score on one leaderboard metric, reloaded into memory at startup"""
+    __table_args__ = (
+        db.UniqueConstraint('metric', 'user_id'),
+        db.Index('ix_leaderboard_score_metric_score', 'metric', 'score'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    metric = db.Column(db.String(30), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    score = db.Column(db.Integer, nullable=False)
+
+
+class LeaderboardChange(db.Model):
+    """A user whose LeaderboardScore rows changed, read by other workers to update their rankings"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+class DailyNutrition(db.Model):
+    """Nutrient totals per user, day and meal type, kept in step with meal logging"""
+    __table_args__ = (db.UniqueConstraint('user_id', 'date', 'meal_type'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    meal_type = db.Column(db.String(20), nullable=False)
+    meal_count = db.Column(db.Integer, default=0, nullable=False)  # meals with at least one item
+    calories = db.Column(db.Float, default=0.0, nullable=False)
+    protein = db.Column(db.Float, default=0.0, nullable=False)
+    carbs = db.Column(db.Float, default=0.0, nullable=False)
+    fat = db.Column(db.Float, default=0.0, nullable=False)
+    fiber = db.Column(db.Float, default=0.0, nullable=False)
+    free_sugar = db.Column(db.Float, default=0.0, nullable=False)
+    sodium = db.Column(db.Float, default=0.0, nullable=False)
+    calcium = db.Column(db.Float, default=0.0, nullable=False)
+    iron = db.Column(db.Float, default=0.0, nullable=False)
+    vitamin_c = db.Column(db.Float, default=0.0, nullable=False)
+    folate = db.Column(db.Float, default=0.0, nullable=False)
+
+
+class DataVersion(db.Model):
+    """Version of data that workers cache in memory, bumped by every change to it (see versions.py)"""
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+
+
+class UserDataVersion(db.Model):
+    """Version of one user's data, part of every response cache key and ETag (see response_cache.py)"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
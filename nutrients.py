@@ -0,0 +1,144 @@
+import threading
+
+import numpy as np
+
+from versions import FOOD_NUTRIENTS, shared_versions
+
+# Food columns held in the nutrient matrix, in column order
+NUTRIENTS = (
+    'calories', 'protein', 'carbs', 'fat', 'fiber',
+    'free_sugar', 'sodium', 'calcium', 'iron', 'vitamin_c', 'folate',
+)
+NUTRIENT_INDEX = {name: position for position, name in enumerate(NUTRIENTS)}
+
+# Display units for the dashboard
+NUTRIENT_UNITS = {
+    'calories': 'kcal', 'protein': 'g', 'carbs': 'g', 'fat': 'g', 'fiber': 'g',
+    'free_sugar': 'g', 'sodium': 'mg', 'calcium': 'mg', 'iron': 'mg', 'vitamin_c': 'mg', 'folate': 'mcg',
+}
+
+# Daily targets used when a user has not filled in their profile
+DEFAULT_TARGETS = {'calories': 2000, 'protein': 125, 'carbs': 250, 'fat': 55}
+
+PORTION_MULTIPLIERS = {
+    'small': 0.75,
+    'medium': 1.0,
+    'large': 1.5
+}
+
+
+def portion_multiplier(portion_size):
+    """Return the nutrition multiplier for a portion size name"""
+    return PORTION_MULTIPLIERS.get((portion_size or 'medium').lower(), 1.0)
+
+
+def round_totals(vector):
+    """Turn a nutrient vector into the totals dict used by routes and templates"""
+    totals = {name: round(float(value), 1) for name, value in zip(NUTRIENTS, vector)}
+    totals['calories'] = int(vector[NUTRIENT_INDEX['calories']])
+    return totals
+
+
+class NutrientStore:
+    """Columnar float32 matrix of every nutrient, indexed by Food id
+
+    Row i holds the nutrients of the food with id i, so a meal, day or
+    range total is a gather of rows scaled by portion multipliers and a
+    sum. Rows are loaded from the database once; foods the process has not
+    seen yet (for example created by another worker) are fetched in one
+    query the first time they are asked for, and foods created here are
+    appended with set_food(). Only changed nutrients, e.g. after sync-foods
+    corrects the catalog, bump the shared FOOD_NUTRIENTS version, which
+    drops the matrix in every worker so it is reloaded on next use.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._matrix = np.zeros((0, len(NUTRIENTS)), dtype=np.float32)
+        self._loaded = np.zeros(0, dtype=bool)
+        self._built = False
+
+    def _grow(self, size):
+        if size <= len(self._loaded):
+            return
+        capacity = max(size, 2 * len(self._loaded), 1024)
+        matrix = np.zeros((capacity, len(NUTRIENTS)), dtype=np.float32)
+        matrix[:len(self._matrix)] = self._matrix
+        loaded = np.zeros(capacity, dtype=bool)
+        loaded[:len(self._loaded)] = self._loaded
+        self._matrix, self._loaded = matrix, loaded
+
+    def _fill(self, rows):
+        rows = list(rows)
+        if not rows:
+            return
+        ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        values = np.array([[value or 0.0 for value in row[1:]] for row in rows], dtype=np.float32)
+        self._grow(int(ids.max()) + 1)
+        self._matrix[ids] = values
+        self._loaded[ids] = True
+
+    def _query(self, food_ids=None):
+        from app import db
+        from models import Food
+
+        query = db.select(Food.id, *(getattr(Food, name) for name in NUTRIENTS))
+        if food_ids is not None:
+            query = query.where(Food.id.in_(food_ids))
+        return db.session.execute(query)
+
+    def _ensure(self, food_ids):
+        """Return a matrix holding rows for food_ids, loading any that are missing"""
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self._fill(self._query())
+                    self._built = True
+        # Read both arrays together; a concurrent reset() swaps in new ones
+        matrix, loaded = self._matrix, self._loaded
+        known = food_ids < len(loaded)
+        known[known] = loaded[food_ids[known]]
+        if known.all():
+            return matrix
+        with self._lock:
+            self._fill(self._query([int(i) for i in np.unique(food_ids[~known])]))
+            return self._matrix
+
+    def set_food(self, food):
+        """Store or refresh one food's row; a no-op until the matrix is built"""
+        if not self._built:
+            return
+        with self._lock:
+            self._fill([(food.id, *(getattr(food, name) for name in NUTRIENTS))])
+
+    def reset(self):
+        """Drop every row so the matrix is reloaded on next use"""
+        with self._lock:
+            self._matrix = np.zeros((0, len(NUTRIENTS)), dtype=np.float32)
+            self._loaded = np.zeros(0, dtype=bool)
+            self._built = False
+
+    def grouped_totals(self, food_ids, portion_sizes, groups, group_count):
+        """Sum portion-scaled nutrients per group
+
+        food_ids, portion_sizes and groups are parallel sequences with one
+        entry per MealItem; groups holds integers in [0, group_count).
+        Returns a (group_count, len(NUTRIENTS)) float64 array.
+        """
+        food_ids = np.asarray(food_ids, dtype=np.int64)
+        totals = np.zeros((group_count, len(NUTRIENTS)), dtype=np.float64)
+        if len(food_ids) == 0:
+            return totals
+        matrix = self._ensure(food_ids)
+        multipliers = np.fromiter((portion_multiplier(p) for p in portion_sizes), dtype=np.float64,
+                                  count=len(food_ids))
+        np.add.at(totals, np.asarray(groups, dtype=np.int64), matrix[food_ids] * multipliers[:, None])
+        return totals
+
+    def totals(self, food_ids, portion_sizes):
+        """Sum portion-scaled nutrients over all items into one vector"""
+        return self.grouped_totals(food_ids, portion_sizes, np.zeros(len(food_ids), dtype=np.int64), 1)[0]
+
+
+nutrient_store = NutrientStore()
+shared_versions.on_change(FOOD_NUTRIENTS, nutrient_store.reset)
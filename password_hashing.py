@@ -0,0 +1,71 @@
+import threading
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+from app import app
+
+# Werkzeug method name -> default cost (scrypt N, pbkdf2 iterations)
+HASH_METHODS = {
+    'scrypt': 2 ** 15,
+    'pbkdf2': DEFAULT_PBKDF2_ITERATIONS,
+}
+
+
+# Seconds a client rejected with PasswordHashingBusy is asked to wait
+RETRY_AFTER = 5
+
+
+class PasswordHashingBusy(Exception):
+    """Raised when this process is already running as many hashes as it accepts"""
+
+
+def method_spec(method, cost=None):
+    """Return the full Werkzeug method string that prefixes hashes, e.g. scrypt:32768:8:1"""
+    if method not in HASH_METHODS:
+        raise ValueError(f'Unsupported password hash method: {method}')
+    cost = int(cost or HASH_METHODS[method])
+    if method == 'scrypt':
+        return f'scrypt:{cost}:8:1'
+    return f'pbkdf2:sha256:{cost}'
+
+
+class PasswordHasher:
+    """Hash and verify passwords on the calling thread, shedding load past a bound
+
+    Hashing is CPU-bound and the request waits for it either way, so it
+    runs on the request thread; moving it to another thread would not free
+    a sync worker. What this bounds is how many hashes one process runs at
+    once. Under a threaded worker class, a hash beyond max_concurrent
+    raises PasswordHashingBusy at once, which the app answers with a 503
+    and Retry-After, instead of queueing behind a login spike. A sync
+    worker serves one request at a time, so it never reaches the bound.
+    """
+
+    def __init__(self, method='scrypt', cost=None, max_concurrent=16):
+        self.method = method_spec(method, cost)
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+
+    def _limited(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHashingBusy()
+        try:
+            return function(*args)
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._limited(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._limited(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """Whether a stored hash was made with another method or cost than the configured one"""
+        return password_hash.split('$', 1)[0] != self.method
+
+
+password_hasher = PasswordHasher(
+    method=app.config['PASSWORD_HASH_METHOD'],
+    cost=app.config['PASSWORD_HASH_COST'],
+    max_concurrent=app.config['PASSWORD_HASH_MAX_CONCURRENT'],
+)
@@ -0,0 +1,128 @@
+"""Create accounts for a whole site from an employee CSV
+
+The CSV is streamed in batches. Each batch's initial passwords are hashed
+across worker processes while the previous batch is written, and every
+batch is one transaction inserting its users and their empty profiles.
+"""
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from werkzeug.security import generate_password_hash
+
+from app import app, db
+from models import User, UserProfile
+from password_hashing import password_hasher
+
+PROVISION_COLUMNS = ('username', 'email', 'password')
+PROVISION_BATCH_SIZE = 1000
+
+
+class ProvisioningError(ValueError):
+    """Raised when the CSV cannot be provisioned at all, e.g. a missing column"""
+
+
+def _read_batches(reader, usernames, emails, batch_size, problems):
+    """Yield lists of new user rows; duplicates and invalid lines go to problems"""
+    locales = app.config['BABEL_SUPPORTED_LOCALES']
+    batch = []
+    for row in reader:
+        line = reader.line_num
+        username = (row.get('username') or '').strip()
+        email = (row.get('email') or '').strip()
+        password = row.get('password') or ''
+        locale = (row.get('locale') or '').strip() or 'en'
+        if not username or not email or not password:
+            problems.append(f'line {line}: username, email and password are required')
+        elif locale not in locales:
+            problems.append(f'line {line}: unsupported locale {locale!r}')
+        elif username in usernames or email in emails:
+            problems.append(f'line {line}: {username} or {email} already exists')
+        else:
+            usernames.add(username)
+            emails.add(email)
+            batch.append(({'username': username, 'email': email, 'locale': locale}, password))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def _insert_users(users):
+    """Insert User rows and return their ids in the same order"""
+    if db.session.get_bind().dialect.insert_executemany_returning_sort_by_parameter_order:
+        statement = db.insert(User).returning(User.id, sort_by_parameter_order=True)
+        return db.session.execute(statement, users).scalars().all()
+    # No ordered RETURNING on this database; let the ORM batch the inserts
+    objects = [User(**values) for values in users]
+    db.session.add_all(objects)
+    db.session.flush()
+    return [user.id for user in objects]
+
+
+def _write_batch(batch, hashes):
+    users = [dict(values, password_hash=password_hash) for (values, _), password_hash in zip(batch, hashes)]
+    try:
+        user_ids = _insert_users(users)
+        db.session.execute(db.insert(UserProfile), [{'user_id': user_id} for user_id in user_ids])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def provision_users(file, batch_size=PROVISION_BATCH_SIZE, workers=None, report=print):
+    """Create users and profiles from a CSV with username, email, password and optional locale
+
+    Existing usernames and emails are loaded once into sets, so skipping
+    them costs no query per row; repeats within the file are skipped the
+    same way. Passwords are hashed with the configured method on workers
+    processes (one per CPU by default). Returns a summary dict with the
+    created count and one message per skipped line.
+    """
+    reader = csv.DictReader(file)
+    missing = [column for column in PROVISION_COLUMNS if column not in (reader.fieldnames or ())]
+    if missing:
+        raise ProvisioningError(f"CSV is missing column(s): {', '.join(missing)}")
+
+    usernames = set()
+    emails = set()
+    for username, email in db.session.query(User.username, User.email):
+        usernames.add(username)
+        emails.add(email)
+
+    workers = workers or os.cpu_count() or 1
+    hash_password = partial(generate_password_hash, method=password_hasher.method)
+    problems = []
+    created = 0
+    started = time.perf_counter()
+
+    def finish(batch, hashes):
+        nonlocal created
+        _write_batch(batch, hashes)
+        created += len(batch)
+        elapsed = time.perf_counter() - started
+        report(f'{created} users created, {len(problems)} lines skipped, '
+               f'{created / elapsed if elapsed else 0:.0f} users/s')
+
+    batches = _read_batches(reader, usernames, emails, batch_size, problems)
+    if workers == 1:
+        for batch in batches:
+            finish(batch, [hash_password(password) for _, password in batch])
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Keep one batch hashing while the one before it is written
+            pending = None
+            for batch in batches:
+                passwords = [password for _, password in batch]
+                hashes = pool.map(hash_password, passwords, chunksize=max(1, len(passwords) // (workers * 4)))
+                if pending is not None:
+                    finish(*pending)
+                pending = (batch, hashes)
+            if pending is not None:
+                finish(*pending)
+
+    return {'created': created, 'skipped': problems}
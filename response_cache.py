@@ -0,0 +1,289 @@
+"""Per-user cache of JSON responses and ETags for the chart, menu and search endpoints
+
+Entries are keyed by user, the user's data version, the food table and
+rollup versions, endpoint, locale, the current date and the query string.
+The versions are read from the database on every request, so a change
+committed by any worker or CLI process is seen by all of them at once:
+code that changes a user's data calls invalidate_user() before
+committing, writes to the Food table bump the shared FOODS version and
+full rollup rebuilds the ROLLUPS version (see versions.py). Older entries
+stop matching and age out of the backend. ETags are a hash of the same key,
+so a client's copy can be validated without running the view.
+"""
+import hashlib
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict
+from datetime import datetime
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import g, make_response, request, session
+from flask_login import current_user
+
+from app import app
+from versions import FOODS, ROLLUPS, bump_user_versions, read_versions
+
+logger = logging.getLogger(__name__)
+
+# The filesystem backend removes expired files after this many writes
+PRUNE_EVERY = 1000
+
+
+class CacheBackend(ABC):
+    """Interface for response cache storage
+
+    get() and set() store (mimetype, body bytes) pairs under string keys
+    for ttl seconds.
+    """
+
+    name = None
+
+    @abstractmethod
+    def get(self, key):
+        raise NotImplementedError
+
+    @abstractmethod
+    def set(self, key, value, ttl):
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Bounded LRU in this process; other workers keep their own entries"""
+
+    name = 'memory'
+
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FileSystemCacheBackend(CacheBackend):
+    """One file per entry in a directory shared by every worker on the host; files are replaced atomically"""
+
+    name = 'filesystem'
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._writes = itertools.count(1)
+        os.makedirs(directory, exist_ok=True)
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def _write(self, path, data):
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, path)
+
+    def get(self, key):
+        try:
+            with open(self._entry_path(key), 'rb') as file:
+                header = json.loads(file.readline())
+                if header['expires'] < time.time():
+                    return None
+                return header['mimetype'], file.read()
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def set(self, key, value, ttl):
+        mimetype, body = value
+        header = json.dumps({'expires': time.time() + ttl, 'mimetype': mimetype}).encode('utf-8')
+        try:
+            self._write(self._entry_path(key), header + b'\n' + body)
+            if next(self._writes) % PRUNE_EVERY == 0:
+                self.prune()
+        except OSError as e:
+            logger.warning("Could not write response cache entry: %s", e)
+
+    def prune(self):
+        """Delete entries that have expired, including those under old versions"""
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            try:
+                with open(entry.path, 'rb') as file:
+                    expired = json.loads(file.readline())['expires'] < now
+            except (OSError, ValueError, KeyError):
+                # Partial files left by a crashed writer
+                expired = entry.name.endswith('.tmp') and entry.stat().st_mtime < now - 60
+            if expired:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+    def clear(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                try:
+                    os.remove(os.path.join(root, name))
+                except OSError:
+                    pass
+
+
+class ResponseCache:
+    """Cache successful responses of login-protected views per user
+
+    Views opt in with the cached() decorator; responses carry an X-Cache
+    header of HIT or MISS. Hit and miss counts per endpoint are kept for
+    this process and returned by stats() along with its pid.
+    """
+
+    def __init__(self, backend=None, ttl=300):
+        self.backend = backend
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def _key(self, scope):
+        """Build the key once per request, so stacked conditional() and cached() share it"""
+        keys = g.setdefault('response_cache_keys', {})
+        if scope not in keys:
+            args = urlencode(sorted(request.args.items(multi=True)))
+            user, versions = read_versions(current_user.id, FOODS, ROLLUPS)
+            parts = [
+                current_user.id, user, versions[FOODS], versions[ROLLUPS],
+                request.endpoint, g.locale, datetime.utcnow().date().isoformat(), args,
+            ]
+            if scope is not None:
+                parts.append(scope())
+            keys[scope] = ':'.join(str(part) for part in parts)
+        return keys[scope]
+
+    def cached(self, scope=None):
+        """Decorate a view to serve its 200 responses from the cache
+
+        scope is an optional callable whose value is added to the key, for
+        data shared between users such as the food catalog.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if self.backend is None or not current_user.is_authenticated:
+                    return view(*args, **kwargs)
+                key = self._key(scope)
+                entry = self.backend.get(key)
+                if entry is not None:
+                    self._count(self.hits)
+                    mimetype, body = entry
+                    response = app.response_class(body, mimetype=mimetype)
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                self._count(self.misses)
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200 and not response.is_streamed:
+                    self.backend.set(key, (response.mimetype, response.get_data()), self.ttl)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+    def conditional(self, scope=None):
+        """Decorate a GET view to answer If-None-Match with 304 before it runs
+
+        The strong ETag hashes the same inputs as the cache key, so it
+        changes whenever the user's data, the foods, the rollups, the
+        locale, the date or the query string do, whichever worker or
+        command changed them. Requests with flashed messages waiting are
+        always rendered, since the client's copy cannot show them. ETags
+        need no cache backend, so they work with RESPONSE_CACHE_BACKEND=none.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method != 'GET' or not current_user.is_authenticated or '_flashes' in session:
+                    return view(*args, **kwargs)
+                etag = hashlib.sha1(self._key(scope).encode('utf-8')).hexdigest()
+                if request.if_none_match.contains(etag):
+                    response = app.response_class(status=304)
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                response.set_etag(etag)
+                # Browsers must revalidate, and shared caches must not keep per-user pages
+                response.headers['Cache-Control'] = 'private, no-cache'
+                return response
+            return wrapper
+        return decorator
+
+    def _count(self, counter):
+        with self._lock:
+            counter[request.endpoint] += 1
+
+    def invalidate_user(self, user_id):
+        """Make every cached response and ETag of a user stale; call before committing the change"""
+        self.invalidate_users([user_id])
+
+    def invalidate_users(self, user_ids):
+        """invalidate_user() for many users in one statement; the caller commits
+
+        Versions are bumped even without a backend, since ETags hash them too.
+        """
+        bump_user_versions(user_ids)
+
+    def stats(self):
+        """Return hit and miss counts per endpoint for this process, identified by its pid"""
+        with self._lock:
+            endpoints = sorted(set(self.hits) | set(self.misses))
+            return {
+                'pid': os.getpid(),
+                'backend': self.backend.name if self.backend is not None else None,
+                'hits': sum(self.hits.values()),
+                'misses': sum(self.misses.values()),
+                'endpoints': {
+                    endpoint: {'hits': self.hits[endpoint], 'misses': self.misses[endpoint]}
+                    for endpoint in endpoints
+                },
+            }
+
+
+def _make_backend(choice):
+    if choice == 'memory':
+        return MemoryCacheBackend(app.config['RESPONSE_CACHE_SIZE'])
+    if choice == 'filesystem':
+        return FileSystemCacheBackend(app.config['RESPONSE_CACHE_DIR'])
+    if choice != 'none':
+        logger.warning("Unknown RESPONSE_CACHE_BACKEND %r, response caching is off", choice)
+    return None
+
+
+response_cache = ResponseCache(_make_backend(app.config['RESPONSE_CACHE_BACKEND']), app.config['RESPONSE_CACHE_TTL'])
@@ -0,0 +1,182 @@
+from collections import defaultdict
+
+import numpy as np
+
+from app import db
+from models import DailyNutrition, Meal, MealItem
+from nutrients import NUTRIENTS, nutrient_store
+from response_cache import response_cache
+from upserts import UPSERT_DIALECTS
+from versions import ROLLUPS, shared_versions
+
+ROLLUP_KEY = ('user_id', 'date', 'meal_type')
+
+# Meal.meal_type is nullable; untyped meals are rolled up as snacks
+DEFAULT_MEAL_TYPE = 'snack'
+
+# Bound on the (user, day) pairs or food ids in one IN clause
+REBUILD_DAYS_PER_QUERY = 500
+
+
+def _add_to_rollup(values):
+    """Add one set of deltas to its DailyNutrition row inside the current transaction"""
+    dialect_insert = UPSERT_DIALECTS.get(db.session.get_bind().dialect.name)
+    if dialect_insert is not None:
+        # Single atomic INSERT ... ON CONFLICT DO UPDATE, no read needed
+        statement = dialect_insert(DailyNutrition).values(**values)
+        table = DailyNutrition.__table__
+        statement = statement.on_conflict_do_update(
+            index_elements=list(ROLLUP_KEY),
+            set_={name: table.c[name] + statement.excluded[name]
+                  for name in values if name not in ROLLUP_KEY},
+        )
+        db.session.execute(statement)
+        return
+
+    row = DailyNutrition.query.filter_by(**{key: values[key] for key in ROLLUP_KEY}).first()
+    if row is None:
+        db.session.add(DailyNutrition(**values))
+    else:
+        for name, delta in values.items():
+            if name not in ROLLUP_KEY:
+                setattr(row, name, getattr(row, name) + delta)
+
+
+def record_meal(meal, items):
+    """Fold a newly logged meal into the rollup; the caller commits
+
+    items is a list of (food_id, portion_size) pairs for the meal's MealItems.
+    """
+    record_meals([(meal.user_id, meal.date, meal.meal_type, items)])
+
+
+def record_meals(meals):
+    """Fold many newly logged meals into the rollup with one upsert per rollup row
+
+    meals is a list of (user_id, date, meal_type, items) tuples, items as
+    for record_meal(). The caller commits.
+    """
+    meal_counts = defaultdict(int)
+    food_ids, portion_sizes, groups = [], [], []
+    keys = {}
+    for user_id, date, meal_type, items in meals:
+        if not items:
+            # meal_count only counts meals with items, as aggregation.py does
+            continue
+        key = (user_id, date, meal_type or DEFAULT_MEAL_TYPE)
+        position = keys.setdefault(key, len(keys))
+        meal_counts[key] += 1
+        for food_id, portion_size in items:
+            food_ids.append(food_id)
+            portion_sizes.append(portion_size)
+            groups.append(position)
+    sums = nutrient_store.grouped_totals(food_ids, portion_sizes, groups, len(keys))
+
+    for key, position in keys.items():
+        values = dict(zip(ROLLUP_KEY, key), meal_count=meal_counts[key])
+        values.update({name: float(value) for name, value in zip(NUTRIENTS, sums[position])})
+        _add_to_rollup(values)
+
+
+def get_daily_totals(user_id, start_date, end_date, nutrients=NUTRIENTS):
+    """Return {date: nutrient vector} summed over meal types, for days that have meals
+
+    One grouped query over the rollup, whatever the length of the window;
+    portion multipliers were already applied when each meal was recorded.
+    Vectors hold the given nutrients, all of NUTRIENTS by default.
+    """
+    rows = db.session.query(
+        DailyNutrition.date, *(db.func.sum(getattr(DailyNutrition, name)) for name in nutrients)
+    ).filter(
+        DailyNutrition.user_id == user_id,
+        DailyNutrition.date >= start_date,
+        DailyNutrition.date <= end_date
+    ).group_by(DailyNutrition.date).all()
+    return {row[0]: np.asarray(row[1:], dtype=np.float64) for row in rows}
+
+
+def _rebuild(meal_filter, rollup_filter, batch_size):
+    """Replace the rollup rows matching rollup_filter with sums over the meals matching meal_filter
+
+    Items are streamed in batches and summed through the nutrient matrix, so
+    memory grows with the number of (user, day, meal type) groups only. The
+    caller commits; returns the number of rows written.
+    """
+    db.session.execute(db.delete(DailyNutrition).where(*rollup_filter))
+    
+    meal_counts = defaultdict(int)
+    # Meals without items are not counted, matching record_meals()
+    grouped = db.session.query(
+        Meal.user_id, Meal.date, Meal.meal_type, db.func.count(db.distinct(Meal.id))
+    ).join(MealItem, MealItem.meal_id == Meal.id).filter(
+        *meal_filter
+    ).group_by(Meal.user_id, Meal.date, Meal.meal_type)
+    for user, date, meal_type, count in grouped:
+        meal_counts[(user, date, meal_type or DEFAULT_MEAL_TYPE)] += count
+    keys = {key: position for position, key in enumerate(meal_counts)}
+    sums = np.zeros((len(keys), len(NUTRIENTS)))
+    
+    items = db.select(Meal.user_id, Meal.date, Meal.meal_type, MealItem.food_id, MealItem.portion_size).join(
+        MealItem, MealItem.meal_id == Meal.id
+    ).where(*meal_filter).execution_options(yield_per=batch_size)
+    for partition in db.session.execute(items).partitions():
+        sums += nutrient_store.grouped_totals(
+            [row.food_id for row in partition],
+            [row.portion_size for row in partition],
+            [keys[(row.user_id, row.date, row.meal_type or DEFAULT_MEAL_TYPE)] for row in partition],
+            len(keys)
+        )
+    
+    rows = []
+    for key, position in keys.items():
+        values = dict(zip(ROLLUP_KEY, key), meal_count=meal_counts[key])
+        values.update({name: float(value) for name, value in zip(NUTRIENTS, sums[position])})
+        rows.append(values)
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(db.insert(DailyNutrition), rows[start:start + batch_size])
+    return len(rows)
+
+
+def rebuild_rollups(user_id=None, batch_size=10000):
+    """Recompute DailyNutrition from Meal and MealItem rows, returning the row count
+
+    Cached responses and ETags built from the old rows stop matching, for
+    every user or just user_id.
+    """
+    if user_id is None:
+        count = _rebuild([], [], batch_size)
+        shared_versions.bump(ROLLUPS)
+    else:
+        count = _rebuild([Meal.user_id == user_id], [DailyNutrition.user_id == user_id], batch_size)
+        response_cache.invalidate_user(user_id)
+    db.session.commit()
+    return count
+
+
+def rebuild_rollup_days(days, batch_size=10000):
+    """Recompute the rollup rows of the given (user_id, date) pairs; the caller commits
+
+    Used when logged meals change value after the fact, e.g. when a food's
+    nutrients are corrected. The users' cached responses are invalidated in
+    the same transaction. Returns the number of rows written.
+    """
+    days = sorted(set(days))
+    response_cache.invalidate_users({user_id for user_id, _ in days})
+    count = 0
+    for start in range(0, len(days), REBUILD_DAYS_PER_QUERY):
+        chunk = days[start:start + REBUILD_DAYS_PER_QUERY]
+        count += _rebuild([db.tuple_(Meal.user_id, Meal.date).in_(chunk)],
+                          [db.tuple_(DailyNutrition.user_id, DailyNutrition.date).in_(chunk)], batch_size)
+    return count
+
+
+def days_with_foods(food_ids):
+    """Return the (user_id, date) pairs that have a meal containing any of food_ids"""
+    food_ids = list(food_ids)
+    days = set()
+    for start in range(0, len(food_ids), REBUILD_DAYS_PER_QUERY):
+        rows = db.session.query(Meal.user_id, Meal.date).join(MealItem, MealItem.meal_id == Meal.id).filter(
+            MealItem.food_id.in_(food_ids[start:start + REBUILD_DAYS_PER_QUERY])
+        ).distinct()
+        days.update((user_id, date) for user_id, date in rows)
+    return days
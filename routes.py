@@ -1,22 +1,42 @@
-from flask import render_template, flash, redirect, url_for, request, jsonify, g
+from flask import render_template, flash, redirect, url_for, request, jsonify, g, Response, stream_with_context, make_response
 from flask_login import login_user, logout_user, current_user, login_required
 from urllib.parse import urlparse
 from flask_babel import _, get_locale
 
 from app import app, db, babel
-from models import User, UserProfile, Food, Meal, MealItem, Achievement, UserAchievement
+from models import User, UserProfile, Food, Meal, MealItem, Achievement, UserAchievement, user_cache
 from utils import (
     calculate_bmi, get_bmi_category, calculate_daily_calorie_needs,
-    get_daily_meals, calculate_daily_nutrition, get_weekly_nutrition_data,
-    search_food_in_csv, import_foods_from_csv, get_food_data_from_csv,
+    get_daily_meals, get_meals_in_range, get_daily_nutrition, get_weekly_nutrition_data,
+    get_nutrition_range_data, get_nutrition_targets, RANGE_WINDOWS, clamp_range,
+    search_food_catalog, import_foods_from_csv,
     get_meal_type_distribution
 )
+from search_backends import get_search_backend
+from autocomplete import food_autocomplete
+from nutrients import NUTRIENTS, NUTRIENT_UNITS, nutrient_store
+from catalog import food_catalog
+from rollups import record_meal
+from achievements import achievement_engine, MEALS_LOGGED
+from streaks import record_active_day
+from leaderboard import leaderboard, METRICS as LEADERBOARD_METRICS, display_score
+from aggregation import aggregate_nutrition
+from analytics import ANALYTICS_MAX_DAYS, get_user_analytics
+from export import EXPORT_FORMATS, iter_meal_item_rows
+from meal_import import MealImportError, import_meals
+from password_hashing import RETRY_AFTER as PASSWORD_HASH_RETRY_AFTER, PasswordHashingBusy
+from response_cache import response_cache
+from versions import FOODS, shared_versions
 
+import hmac
 import json
 import os
 from datetime import datetime, date, timedelta
 from werkzeug.utils import secure_filename
 
+# Nutrients shown on the dashboard besides calories and the macro bars
+EXTRA_NUTRIENTS = [(name, NUTRIENT_UNITS[name]) for name in NUTRIENTS[4:]]
+
 # Function to get the current locale
 def get_app_locale():
     if current_user.is_authenticated:
@@ -25,6 +45,8 @@ def get_app_locale():
 
 @app.before_request
 def before_request():
+    # Drop process caches of data another worker changed
+    shared_versions.poll()
     g.locale = str(get_locale())
 
 @app.context_processor
@@ -36,6 +58,10 @@ def attr_list_filter(obj):
     """Returns a list of attributes available on an object"""
     return [attr for attr in dir(obj) if not attr.startswith('_')]
 
+def catalog_version():
+    """Identify the loaded food catalog by file mtime, which every worker agrees on"""
+    return food_catalog.snapshot().mtime
+
 @app.route('/')
 @app.route('/index')
 def index():
@@ -43,7 +69,7 @@ def index():
     if current_user.is_authenticated:
         # Get user's daily meals and nutrition
         meals = get_daily_meals(current_user.id)
-        daily_nutrition = calculate_daily_nutrition(meals)
+        daily_nutrition = get_daily_nutrition(current_user.id)
         
         # Get weekly nutrition data for charts
         weekly_data = get_weekly_nutrition_data(current_user.id)
@@ -51,6 +77,7 @@ def index():
         return render_template('index.html', 
                              meals=meals, 
                              daily_nutrition=daily_nutrition,
+                             extra_nutrients=EXTRA_NUTRIENTS,
                              weekly_data=json.dumps(weekly_data))
     else:
         return render_template('landing.html')
@@ -71,6 +98,12 @@ def login():
         if user is None or not user.check_password(password):
             flash(_('Invalid username or password'), 'danger')
             return redirect(url_for('login'))
+
+        # Upgrade hashes made with an older method or cost while the password is at hand
+        if user.password_needs_rehash():
+            user.set_password(password)
+            db.session.commit()
+            user_cache.invalidate(user.id)
             
         login_user(user, remember=remember_me)
         
@@ -163,7 +196,9 @@ def profile():
         # Update user language preference
         current_user.locale = request.form.get('locale', 'en')
         
+        response_cache.invalidate_user(current_user.id)
         db.session.commit()
+        user_cache.invalidate(current_user.id)
         flash(_('Profile updated successfully!'), 'success')
         return redirect(url_for('profile'))
     
@@ -178,6 +213,7 @@ def profile():
 
 @app.route('/menu')
 @login_required
+@response_cache.conditional(scope=catalog_version)
 def menu():
     """Cafeteria menu page with portion selection"""
     # Import foods from CSV if none exist in the database
@@ -187,24 +223,13 @@ def menu():
     # Get all foods from database
     foods = Food.query.all()
     
-    # Get food data directly from CSV for table display
-    csv_food_data = get_food_data_from_csv()
-    
-    # Group CSV food data into categories
-    beverages = []
-    main_courses = []
-    sides = []
-    snacks = []
-    
-    for item in csv_food_data:
-        if 'tea' in item['Dish Name'].lower() or 'coffee' in item['Dish Name'].lower() or 'drink' in item['Dish Name'].lower() or 'juice' in item['Dish Name'].lower() or 'punch' in item['Dish Name'].lower() or 'lemonade' in item['Dish Name'].lower():
-            beverages.append(item)
-        elif 'rice' in item['Dish Name'].lower() or 'curry' in item['Dish Name'].lower() or 'dal' in item['Dish Name'].lower() or 'meal' in item['Dish Name'].lower():
-            main_courses.append(item)
-        elif 'bread' in item['Dish Name'].lower() or 'roti' in item['Dish Name'].lower() or 'naan' in item['Dish Name'].lower():
-            sides.append(item)
-        else:
-            snacks.append(item)
+    # CSV rows are categorized once when the catalog loads
+    snapshot = food_catalog.snapshot()
+    csv_food_data = snapshot.rows
+    beverages = snapshot.by_category['beverage']
+    main_courses = snapshot.by_category['main_course']
+    sides = snapshot.by_category['side']
+    snacks = snapshot.by_category['snack']
     
     return render_template('menu.html', 
                           foods=foods, 
@@ -240,7 +265,11 @@ def custom_entry():
         )
         
         db.session.add(food)
+        shared_versions.bump(FOODS, applied=True)
         db.session.commit()
+        get_search_backend().add_food(food)
+        food_autocomplete.add_food(food)
+        nutrient_store.set_food(food)
         
         flash(_('Custom food added successfully!'), 'success')
         return redirect(url_for('menu'))
@@ -269,6 +298,7 @@ def add_meal():
     db.session.flush()  # Get meal ID
     
     # Add meal items
+    items = []
     for food_id in food_ids:
         portion_size = request.form.get(f'portion_size_{food_id}', 'medium')
         meal_item = MealItem(
@@ -277,11 +307,14 @@ def add_meal():
             portion_size=portion_size
         )
         db.session.add(meal_item)
+        items.append((int(food_id), portion_size))
     
+    # Update the daily rollup and achievements in the same transaction as the meal
+    record_meal(meal, items)
+    check_achievements(current_user.id, meal.date)
+    response_cache.invalidate_user(current_user.id)
     db.session.commit()
-    
-    # Check for achievements
-    check_achievements(current_user.id)
+    food_autocomplete.record_use([int(food_id) for food_id in food_ids])
     
     flash(_('Meal added successfully!'), 'success')
     return redirect(url_for('index'))
@@ -299,16 +332,13 @@ def history():
         start_date = datetime.strptime(request.args.get('start_date'), '%Y-%m-%d').date()
     if request.args.get('end_date'):
         end_date = datetime.strptime(request.args.get('end_date'), '%Y-%m-%d').date()
+    start_date, end_date = clamp_range(start_date, end_date)
     
-    # Get meals in date range
-    meals = Meal.query.filter(
-        Meal.user_id == current_user.id,
-        Meal.date >= start_date,
-        Meal.date <= end_date
-    ).order_by(Meal.date.desc(), Meal.time.desc()).all()
+    # Get meals in date range, with items, foods and totals batch loaded
+    meals = get_meals_in_range(current_user.id, start_date, end_date)
     
-    # Get nutrition data for charts
-    weekly_data = get_weekly_nutrition_data(current_user.id)
+    # Get nutrition data for charts over the selected range
+    weekly_data = get_nutrition_range_data(current_user.id, start_date, end_date)
     
     return render_template('history.html', 
                          meals=meals,
@@ -318,11 +348,88 @@ def history():
 
 @app.route('/nutrition-data')
 @login_required
+@response_cache.conditional()
+@response_cache.cached()
 def nutrition_data():
-    """API endpoint for nutrition chart data"""
-    weekly_data = get_weekly_nutrition_data(current_user.id)
+    """API endpoint for nutrition chart data, over ?days=7, 30, 90 or 365"""
+    days = request.args.get('days', 7, type=int)
+    if days not in RANGE_WINDOWS:
+        days = 7
+    weekly_data = get_weekly_nutrition_data(current_user.id, days)
     return jsonify(weekly_data)
 
+@app.route('/nutrition-aggregate')
+@login_required
+@response_cache.cached()
+def nutrition_aggregate():
+    """API endpoint summing nutrients grouped by any dimensions
+    
+    ?group_by=date,meal_type&measures=calories,protein&start_date=...&end_date=...
+    """
+    end_date = datetime.utcnow().date()
+    start_date = end_date - timedelta(days=6)
+    try:
+        if request.args.get('start_date'):
+            start_date = datetime.strptime(request.args.get('start_date'), '%Y-%m-%d').date()
+        if request.args.get('end_date'):
+            end_date = datetime.strptime(request.args.get('end_date'), '%Y-%m-%d').date()
+        group_by = [d for d in request.args.get('group_by', '').split(',') if d]
+        measures = [m for m in request.args.get('measures', 'calories').split(',') if m]
+        groups = aggregate_nutrition(current_user.id, start_date, end_date, group_by, measures)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(groups)
+
+@app.route('/nutrition-analytics')
+@login_required
+@response_cache.cached()
+def nutrition_analytics():
+    """API endpoint for long-range trends: rolling averages, adherence, percentiles, weekdays"""
+    days = request.args.get('days', 90, type=int)
+    days = min(max(days, 1), ANALYTICS_MAX_DAYS)
+    end_date = datetime.utcnow().date()
+    start_date = end_date - timedelta(days=days - 1)
+    
+    analytics = get_user_analytics(current_user.id, start_date, end_date, get_nutrition_targets(current_user.id))
+    return jsonify(analytics)
+
+@app.route('/export-meals')
+@login_required
+def export_meals():
+    """Download the user's full meal history as ?format=csv or ndjson, streamed"""
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unknown format: {export_format}'}), 400
+    
+    stream, mimetype = EXPORT_FORMATS[export_format]
+    filename = f'smartcafe-meals-{datetime.utcnow().date().isoformat()}.{export_format}'
+    return Response(stream_with_context(stream(iter_meal_item_rows(current_user.id))),
+                    mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@app.route('/api/meals/import', methods=['POST'])
+def import_meals_api():
+    """Bulk meal import for kiosk and POS integrations, authorized by a bearer token"""
+    token = app.config.get('MEAL_IMPORT_TOKEN')
+    if not token:
+        return jsonify({'error': 'Meal import is not enabled'}), 404
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not hmac.compare_digest(supplied.encode(), token.encode()):
+        return jsonify({'error': 'Invalid token'}), 401
+    
+    payload = request.get_json(silent=True)
+    records = payload.get('meals') if isinstance(payload, dict) else payload
+    if not isinstance(records, list):
+        return jsonify({'error': 'Expected a list of meals or {"meals": [...]}'}), 400
+    
+    try:
+        summary = import_meals(records)
+    except MealImportError as e:
+        return jsonify({'error': str(e), 'errors': e.errors}), 400
+    
+    return jsonify(summary)
+
 @app.route('/log-meal', methods=['GET', 'POST'])
 @login_required
 def log_meal():
@@ -351,6 +458,7 @@ def log_meal():
         
         # Check if food already exists
         existing_food = Food.query.filter_by(name=meal_name).first()
+        created_food = None
         
         if existing_food:
             food = existing_food
@@ -367,6 +475,8 @@ def log_meal():
             )
             db.session.add(food)
             db.session.flush()  # Get food ID
+            shared_versions.bump(FOODS, applied=True)
+            created_food = food
         
         # Create meal item
         meal_item = MealItem(
@@ -395,12 +505,17 @@ def log_meal():
                 app.logger.error(f"Error saving image: {str(e)}")
                 flash(_('Error uploading image, but meal was logged'), 'warning')
         
-        # Save changes to database
+        # Save changes to database, updating the daily rollup and achievements in the same transaction
         db.session.add(meal_item)
+        record_meal(meal, [(food.id, portion_size)])
+        check_achievements(current_user.id, meal.date)
+        response_cache.invalidate_user(current_user.id)
         db.session.commit()
-        
-        # Check for achievements
-        check_achievements(current_user.id)
+        if created_food is not None:
+            get_search_backend().add_food(created_food)
+            food_autocomplete.add_food(created_food)
+            nutrient_store.set_food(created_food)
+        food_autocomplete.record_use([food.id])
         
         flash(_('Meal logged successfully!'), 'success')
         return redirect(url_for('index'))
@@ -412,11 +527,15 @@ def log_meal():
     csv_search_results = []
     
     if search_term:
-        # Search in database
-        search_results = Food.query.filter(Food.name.ilike(f'%{search_term}%')).all()
+        # Search the database foods and the CSV catalog through the indexes
+        fuzzy = request.args.get('fuzzy', type=int)
+        food_hits, csv_search_results = search_food_catalog(
+            search_term, food_limit=50, csv_limit=50, fuzzy=None if fuzzy is None else bool(fuzzy))
         
-        # Search in CSV
-        csv_search_results = search_food_in_csv(search_term, g.locale)
+        # Load the matching foods by primary key, keeping the index's ranking
+        food_ids = [hit['id'] for hit in food_hits]
+        foods_by_id = {food.id: food for food in Food.query.filter(Food.id.in_(food_ids))} if food_ids else {}
+        search_results = [foods_by_id[food_id] for food_id in food_ids if food_id in foods_by_id]
     
     # Prefill form from query params (from CSV item selection)
     custom_meal_name = request.args.get('custom_meal_name', '')
@@ -443,8 +562,37 @@ def log_meal():
                           search_results=search_results,
                           csv_search_results=csv_search_results)
 
+def food_result(food):
+    """Shape an indexed Food payload for the JSON search endpoints"""
+    name_key = 'name' if g.locale == 'en' else f'name_{g.locale}'
+    return {
+        'id': food['id'],
+        'name': food.get(name_key) or food['name'],
+        'calories': food['calories'],
+        'protein': food['protein'],
+        'carbs': food['carbs'],
+        'fat': food['fat'],
+        'fiber': food['fiber'],
+        'category': food['category'],
+        'source': 'db'
+    }
+
+@app.route('/food-autocomplete')
+@login_required
+def food_autocomplete_api():
+    """API endpoint for search-as-you-type, ranked by how often foods are logged"""
+    query = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', 10, type=int), 10))
+    
+    if not query or len(query) < 2:
+        return jsonify([])
+    
+    return jsonify([food_result(food) for food in food_autocomplete.complete(query, g.locale, limit)])
+
 @app.route('/food-search')
 @login_required
+@response_cache.conditional(scope=catalog_version)
+@response_cache.cached(scope=catalog_version)
 def food_search():
     """API endpoint for food search"""
     query = request.args.get('q', '')
@@ -452,29 +600,18 @@ def food_search():
     if not query or len(query) < 2:
         return jsonify([])
     
-    # Search in database
-    db_results = Food.query.filter(Food.name.ilike(f'%{query}%')).all()
-    db_foods = [{
-        'id': food.id,
-        'name': food.get_name(g.locale),
-        'calories': food.calories,
-        'protein': food.protein,
-        'carbs': food.carbs,
-        'fat': food.fat,
-        'fiber': food.fiber,
-        'category': food.category,
-        'source': 'db'
-    } for food in db_results]
-    
-    # Search in CSV
-    csv_results = search_food_in_csv(query, g.locale)
+    # Search database foods and the CSV catalog through the in-memory indexes;
+    # ?fuzzy=1 forces typo/transliteration matching, ?fuzzy=0 disables the fallback
+    fuzzy = request.args.get('fuzzy', type=int)
+    db_results, csv_results = search_food_catalog(query, fuzzy=None if fuzzy is None else bool(fuzzy))
+    db_foods = [food_result(food) for food in db_results]
     csv_foods = [{
         'name': item['Dish Name'],
-        'calories': float(item['Calories (kcal)']),
-        'protein': float(item['Protein (g)']),
-        'carbs': float(item['Carbohydrate (g)']),
-        'fat': float(item['Fats (g)']),
-        'fiber': float(item['Fibre (g)']) if item['Fibre (g)'] else 0.0,
+        'calories': item['Calories (kcal)'],
+        'protein': item['Protein (g)'],
+        'carbs': item['Carbohydrate (g)'],
+        'fat': item['Fats (g)'],
+        'fiber': item['Fibre (g)'],
         'source': 'csv'
     } for item in csv_results]
     
@@ -490,7 +627,9 @@ def set_language(language):
     
     if language in supported_languages:
         current_user.locale = language
+        response_cache.invalidate_user(current_user.id)
         db.session.commit()
+        user_cache.invalidate(current_user.id)
         flash(_('Language updated successfully!'), 'success')
     
     # Redirect back to previous page
@@ -511,50 +650,64 @@ def achievements():
                            all_achievements=all_achievements,
                            earned_ids=earned_ids)
 
-def check_achievements(user_id):
-    """Check and award achievements for a user"""
-    # Count total meals logged
-    meal_count = Meal.query.filter_by(user_id=user_id).count()
-    
-    # Check for meal counting achievements
-    achievements_to_check = [
-        {'id': 1, 'name': 'First Meal', 'description': 'Log your first meal', 'requirement': 1},
-        {'id': 2, 'name': 'Regular Tracker', 'description': 'Log 10 meals', 'requirement': 10},
-        {'id': 3, 'name': 'Committed Tracker', 'description': 'Log 30 meals', 'requirement': 30},
-        {'id': 4, 'name': 'Nutrition Master', 'description': 'Log 100 meals', 'requirement': 100}
-    ]
-    
-    for achievement_data in achievements_to_check:
-        if meal_count >= achievement_data['requirement']:
-            # Check if user already has this achievement
-            existing = UserAchievement.query.filter_by(
-                user_id=user_id, 
-                achievement_id=achievement_data['id']
-            ).first()
-            
-            if not existing:
-                # Look up the achievement or create it if it doesn't exist
-                achievement = Achievement.query.get(achievement_data['id'])
-                if not achievement:
-                    achievement = Achievement(
-                        id=achievement_data['id'],
-                        name=achievement_data['name'],
-                        description=achievement_data['description'],
-                        icon='fa-utensils',
-                        requirement_type='meals_logged',
-                        requirement_value=achievement_data['requirement']
-                    )
-                    db.session.add(achievement)
-                
-                # Award the achievement
-                user_achievement = UserAchievement(
-                    user_id=user_id,
-                    achievement_id=achievement_data['id']
-                )
-                db.session.add(user_achievement)
-                db.session.commit()
-                
-                flash(_('Achievement unlocked: %(name)s!', name=achievement_data['name']), 'success')
+def leaderboard_entries(metric, limit):
+    """Return [(rank, username, display score)] for the top of a leaderboard metric"""
+    entries = leaderboard.top(metric, limit)
+    usernames = dict(db.session.query(User.id, User.username).filter(
+        User.id.in_([user_id for _, user_id, _ in entries]))) if entries else {}
+    return [(rank, usernames.get(user_id), display_score(metric, score)) for rank, user_id, score in entries]
+
+@app.route('/leaderboard')
+@login_required
+def leaderboard_page():
+    """Site-wide rankings by meals logged, longest streak and target adherence"""
+    metric = request.args.get('metric', 'meals')
+    if metric not in LEADERBOARD_METRICS:
+        metric = 'meals'
+    
+    entries = leaderboard_entries(metric, 10)
+    rank, score, ranked = leaderboard.standing(metric, current_user.id)
+    
+    return render_template('leaderboard.html',
+                           metric=metric,
+                           metrics=LEADERBOARD_METRICS,
+                           entries=entries,
+                           my_rank=rank,
+                           my_score=display_score(metric, score),
+                           ranked=ranked)
+
+@app.route('/leaderboard-data')
+@login_required
+def leaderboard_data():
+    """API endpoint for the top users on a leaderboard metric and the current user's rank"""
+    metric = request.args.get('metric', 'meals')
+    if metric not in LEADERBOARD_METRICS:
+        return jsonify({'error': f'Unknown metric: {metric}'}), 400
+    limit = min(request.args.get('limit', 10, type=int), 100)
+    
+    entries = leaderboard_entries(metric, limit)
+    rank, score, ranked = leaderboard.standing(metric, current_user.id)
+    
+    return jsonify({
+        'metric': metric,
+        'top': [{'rank': position, 'username': username, 'score': value} for position, username, value in entries],
+        'me': {'rank': rank, 'score': display_score(metric, score)},
+        'ranked': ranked,
+    })
+
+@app.route('/cache-stats')
+@login_required
+def cache_stats():
+    """API endpoint for this worker's response cache hit and miss counters"""
+    return jsonify(response_cache.stats())
+
+def check_achievements(user_id, meal_date, meals=1):
+    """Count newly logged meals towards achievements and the leaderboard; call before committing the meal"""
+    awarded = achievement_engine.record_event(user_id, MEALS_LOGGED, meals)
+    awarded += record_active_day(user_id, meal_date)
+    leaderboard.update_user(user_id)
+    for name in awarded:
+        flash(_('Achievement unlocked: %(name)s!', name=name), 'success')
 
 @app.context_processor
 def inject_current_year():
@@ -567,4 +720,11 @@ def not_found_error(error):
 @app.errorhandler(500)
 def internal_error(error):
     db.session.rollback()
-    return render_template('errors/500.html'), 500
\ No newline at end of file
+    return render_template('errors/500.html'), 500
+
+@app.errorhandler(PasswordHashingBusy)
+def password_hashing_busy(error):
+    db.session.rollback()
+    response = make_response(render_template('errors/503.html'), 503)
+    response.headers['Retry-After'] = str(PASSWORD_HASH_RETRY_AFTER)
+    return response
\ No newline at end of file
@@ -0,0 +1,194 @@
+import logging
+import threading
+from abc import ABC, abstractmethod
+
+from sqlalchemy import text
+
+from search_index import FOOD_NAME_COLUMNS, food_search_index, normalize
+from fuzzy_search import food_fuzzy_index
+from versions import FOODS, shared_versions
+
+logger = logging.getLogger(__name__)
+
+# Ranking weight of each name column for BM25; the canonical name counts most
+FTS_COLUMN_WEIGHTS = [10.0] + [5.0] * (len(FOOD_NAME_COLUMNS) - 1)
+FOOD_PAYLOAD_COLUMNS = ['id'] + FOOD_NAME_COLUMNS + ['calories', 'protein', 'carbs', 'fat', 'fiber', 'category']
+
+
+class SearchBackend(ABC):
+    """Interface for Food name search used by /food-search and /log-meal
+
+    search() returns plain payload dicts shaped like search_index.food_payload,
+    best match first. fuzzy=None means exact search with a fuzzy fallback
+    when nothing matches; True or False force one mode.
+    """
+
+    name = None
+
+    @abstractmethod
+    def search(self, query, limit=10, fuzzy=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_food(self, food):
+        """Make a newly created or updated Food searchable"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def rebuild(self):
+        """Rebuild the backend's index from the Food table"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def invalidate(self):
+        """Drop in-process state after writes that bypassed add_food, e.g. bulk inserts"""
+        raise NotImplementedError
+
+
+class InProcessSearchBackend(SearchBackend):
+    """Search through the in-memory n-gram and fuzzy indexes of this process"""
+
+    name = 'memory'
+
+    def __init__(self, exact_index=food_search_index, fuzzy_index=food_fuzzy_index):
+        self.exact_index = exact_index
+        self.fuzzy_index = fuzzy_index
+
+    def search(self, query, limit=10, fuzzy=None):
+        if not fuzzy:
+            results = self.exact_index.search_foods(query, limit)
+            if results or fuzzy is False:
+                return results
+        return self.fuzzy_index.search_foods(query, limit)
+
+    def add_food(self, food):
+        self.exact_index.add_food(food)
+        self.fuzzy_index.add_food(food)
+
+    def rebuild(self):
+        self.exact_index.reset()
+        self.fuzzy_index.reset()
+
+    def invalidate(self):
+        self.rebuild()
+
+
+class FTS5SearchBackend(SearchBackend):
+    """SQLite FTS5 external-content table over the localized Food name columns
+
+    Triggers on the food table keep the index in step with every insert,
+    update and delete, including bulk writes that bypass the ORM. Results
+    are ranked by BM25 with the English name weighted highest. Fuzzy
+    matching is delegated to the in-process fuzzy index.
+    """
+
+    name = 'fts5'
+    table = 'food_fts'
+
+    def __init__(self, db, fuzzy_index=food_fuzzy_index):
+        self.db = db
+        self.fuzzy_index = fuzzy_index
+        self._lock = threading.Lock()
+        self._installed = False
+
+    def _ddl(self):
+        columns = ', '.join(FOOD_NAME_COLUMNS)
+        new_values = ', '.join(f'new.{c}' for c in FOOD_NAME_COLUMNS)
+        old_values = ', '.join(f'old.{c}' for c in FOOD_NAME_COLUMNS)
+        delete_old = (f"INSERT INTO {self.table}({self.table}, rowid, {columns}) "
+                      f"VALUES('delete', old.id, {old_values});")
+        insert_new = f"INSERT INTO {self.table}(rowid, {columns}) VALUES (new.id, {new_values});"
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5({columns}, "
+            f"content='food', content_rowid='id', "
+            f"tokenize=\"unicode61 remove_diacritics 2 categories 'L* N* Co M*'\")",
+            f"CREATE TRIGGER IF NOT EXISTS {self.table}_ai AFTER INSERT ON food BEGIN {insert_new} END",
+            f"CREATE TRIGGER IF NOT EXISTS {self.table}_ad AFTER DELETE ON food BEGIN {delete_old} END",
+            f"CREATE TRIGGER IF NOT EXISTS {self.table}_au AFTER UPDATE ON food BEGIN {delete_old} {insert_new} END",
+        ]
+
+    def install(self):
+        """Create the FTS table and its triggers, indexing existing rows the first time"""
+        if self._installed:
+            return
+        with self._lock:
+            if self._installed:
+                return
+            with self.db.engine.begin() as connection:
+                exists = connection.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                    {'name': self.table},
+                ).first()
+                for statement in self._ddl():
+                    connection.execute(text(statement))
+                if not exists:
+                    connection.execute(text(f"INSERT INTO {self.table}({self.table}) VALUES('rebuild')"))
+            self._installed = True
+
+    @staticmethod
+    def match_expression(query):
+        """Turn free text into an FTS5 query matching every word as a prefix"""
+        terms = normalize(query).split()
+        return ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+
+    def search(self, query, limit=10, fuzzy=None):
+        results = []
+        expression = self.match_expression(query)
+        if not fuzzy and expression:
+            self.install()
+            weights = ', '.join(str(w) for w in FTS_COLUMN_WEIGHTS)
+            columns = ', '.join(f'food.{c}' for c in FOOD_PAYLOAD_COLUMNS)
+            rows = self.db.session.execute(
+                text(f"SELECT {columns} FROM {self.table} "
+                     f"JOIN food ON food.id = {self.table}.rowid "
+                     f"WHERE {self.table} MATCH :expression "
+                     f"ORDER BY bm25({self.table}, {weights}) LIMIT :limit"),
+                {'expression': expression, 'limit': limit},
+            )
+            results = [dict(zip(FOOD_PAYLOAD_COLUMNS, row)) for row in rows]
+            if results or fuzzy is False:
+                return results
+        return self.fuzzy_index.search_foods(query, limit)
+
+    def add_food(self, food):
+        # The triggers already indexed the row; only the fuzzy index needs it
+        self.fuzzy_index.add_food(food)
+
+    def rebuild(self):
+        self.install()
+        with self.db.engine.begin() as connection:
+            connection.execute(text(f"INSERT INTO {self.table}({self.table}) VALUES('rebuild')"))
+        self.fuzzy_index.reset()
+
+    def invalidate(self):
+        # The triggers saw the writes; only the fuzzy index is stale
+        self.fuzzy_index.reset()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_search_backend():
+    """Return the process-wide backend chosen by the SEARCH_BACKEND setting"""
+    global _backend
+    if _backend is None:
+        from app import app, db
+
+        with _backend_lock:
+            if _backend is None:
+                choice = app.config.get('SEARCH_BACKEND', 'memory')
+                if choice == 'fts5' and db.engine.dialect.name != 'sqlite':
+                    logger.warning("SEARCH_BACKEND=fts5 needs SQLite, using the in-process backend")
+                    choice = 'memory'
+                _backend = FTS5SearchBackend(db) if choice == 'fts5' else InProcessSearchBackend()
+    return _backend
+
+
+def _invalidate_backend():
+    if _backend is not None:
+        _backend.invalidate()
+
+
+# Foods created or synced by other workers reach this worker's indexes through a rebuild
+shared_versions.on_change(FOODS, _invalidate_backend)
@@ -0,0 +1,319 @@
+import heapq
+import threading
+import unicodedata
+from array import array
+
+import numpy as np
+
+from catalog import food_catalog
+
+LOCALES = ('en', 'es', 'hi', 'kn', 'ta', 'te', 'mr', 'gu')
+FOOD_NAME_COLUMNS = ['name'] + [f'name_{lang}' for lang in LOCALES if lang != 'en']
+CSV_NAME_COLUMNS = ['Dish Name'] + [f'name_{lang}' for lang in LOCALES if lang not in ('en', 'es')]
+
+GRAM_SIZE = 3
+
+
+def normalize(text):
+    """Casefold text and turn punctuation, symbols and separators into single spaces
+
+    Combining marks are kept so Indic vowel signs stay part of the word.
+    """
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKC', text).casefold()
+    chars = [' ' if unicodedata.category(ch)[0] in 'PSZC' else ch for ch in text]
+    return ' '.join(''.join(chars).split())
+
+
+# Marks the gram holding a name's first characters; normalize() never leaves
+# control characters in a name, so it cannot collide with real text
+NAME_START = '\x02'
+# Low bits of a posting entry that hold which of a document's names it is for
+NAME_BITS = 4
+MAX_NAMES = 1 << NAME_BITS
+
+
+def name_grams(name):
+    """Return the set of n-grams for a normalized name, padded at word edges
+
+    One extra gram, NAME_START plus the first characters, marks where the
+    whole name begins.
+    """
+    padded = f' {name} '
+    grams = {padded[i:i + GRAM_SIZE] for i in range(len(padded) - GRAM_SIZE + 1)}
+    grams.add(NAME_START + name[:GRAM_SIZE - 1])
+    return grams
+
+
+def query_grams(query):
+    """Return the n-grams that every name containing a normalized query has
+
+    Queries shorter than the gram size have none; callers look them up
+    through the grams they are part of instead.
+    """
+    return {query[i:i + GRAM_SIZE] for i in range(len(query) - GRAM_SIZE + 1)}
+
+
+def match_tier(query, name):
+    """2 when name starts with query, 1 when a later word does, 0 for another substring, None for no match"""
+    if name.startswith(query):
+        return 2
+    if f' {query}' in name:
+        return 1
+    if query in name:
+        return 0
+    return None
+
+
+def score_name(query, name):
+    """Rank a match: whole-name and word prefix matches first, then shorter names"""
+    tier = match_tier(query, name)
+    if tier is None:
+        return 0.0
+    return tier + len(query) / len(name)
+
+
+class NgramIndex:
+    """Inverted index from character n-grams to documents with several names
+
+    Each posting entry packs (name length, document, name number) into one
+    integer, so an entry is the same in every posting of its name and a
+    sorted posting lists names from shortest to longest. A query intersects
+    its grams' postings smallest first with numpy, then walks the survivors
+    tier by tier (see score_name), each already in ranking order, and stops
+    as soon as `limit` names are verified. Queries shorter than a gram
+    merge the postings of the grams that contain them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # gram -> sorted uint64 array; never changed once published, so
+        # searches can use one without the lock
+        self._postings = {}
+        # gram -> entries added since its posting was last sorted
+        self._pending = {}
+        # (kind, fragment) -> grams, to find the grams a short query is part of
+        self._grams_by_part = {}
+        self._names = []
+        self._payloads = []
+        self._doc_for_key = {}
+
+    def __len__(self):
+        return len(self._doc_for_key)
+
+    def add(self, key, names, payload):
+        """Index a document under all of its names, replacing any older version"""
+        normalized = tuple(dict.fromkeys(n for n in map(normalize, names) if n))[:MAX_NAMES]
+
+        with self._lock:
+            old_doc = self._doc_for_key.get(key)
+            if old_doc is not None:
+                # Leave a tombstone; stale postings are skipped at query time
+                self._names[old_doc] = ()
+                self._payloads[old_doc] = None
+            doc = len(self._names)
+            self._names.append(normalized)
+            self._payloads.append(payload)
+            self._doc_for_key[key] = doc
+            for number, name in enumerate(normalized):
+                entry = (len(name) << (32 + NAME_BITS)) | (doc << NAME_BITS) | number
+                for gram in name_grams(name):
+                    pending = self._pending.get(gram)
+                    if pending is None:
+                        pending = self._pending[gram] = array('Q')
+                        if gram not in self._postings:
+                            for part in (('prefix', gram[:2]), ('inner', gram[1:2]), ('inner', gram[1:3])):
+                                self._grams_by_part.setdefault(part, set()).add(gram)
+                    pending.append(entry)
+
+    def remove(self, key):
+        """Drop a document from the results"""
+        with self._lock:
+            doc = self._doc_for_key.pop(key, None)
+            if doc is not None:
+                self._names[doc] = ()
+                self._payloads[doc] = None
+
+    def _posting(self, gram):
+        """Return the sorted posting of a gram, merging in entries added since it was last sorted"""
+        if gram in self._pending:
+            with self._lock:
+                pending = self._pending.pop(gram, None)
+                if pending is not None:
+                    merged = np.array(pending, dtype=np.uint64)
+                    if gram in self._postings:
+                        merged = np.concatenate((self._postings[gram], merged))
+                    merged.sort()
+                    self._postings[gram] = merged
+        return self._postings.get(gram)
+
+    def _merged(self, kind, fragment):
+        """Entries of every gram with fragment in the given place, in posting order"""
+        grams = sorted(self._grams_by_part.get((kind, fragment), ()))
+        return heapq.merge(*(_entries(self._posting(gram)) for gram in grams))
+
+    def _tier_sources(self, query):
+        """Return [(tier, entries)] for a normalized query, best tier first"""
+        if len(query) >= GRAM_SIZE:
+            postings = [self._posting(gram) for gram in query_grams(query)]
+            if any(posting is None for posting in postings):
+                return []
+            # Name prefixes also start a word, and every match has every gram
+            name_start = self._posting(NAME_START + query[:GRAM_SIZE - 1])
+            word_start = self._posting(' ' + query[:GRAM_SIZE - 1])
+            return [
+                (2, _intersection([name_start] + postings)),
+                (1, _intersection([word_start] + postings)),
+                (0, _intersection(postings)),
+            ]
+        if len(query) == GRAM_SIZE - 1:
+            return [
+                (2, _entries(self._posting(NAME_START + query))),
+                (1, _entries(self._posting(' ' + query))),
+                (0, self._merged('inner', query)),
+            ]
+        return [
+            (2, self._merged('prefix', NAME_START + query)),
+            (1, self._merged('prefix', ' ' + query)),
+            (0, self._merged('inner', query)),
+        ]
+
+    def search(self, query, limit=10):
+        """Return up to `limit` payloads whose names contain the query, best first
+
+        Within a tier, shorter names rank first and ties go to the older
+        document, so results are stable.
+        """
+        query = normalize(query)
+        if not query or limit <= 0:
+            return []
+
+        names = self._names
+        found = []
+        seen = set()
+        for tier, entries in self._tier_sources(query):
+            for entry in entries:
+                doc = (entry >> NAME_BITS) & 0xFFFFFFFF
+                if doc in seen:
+                    continue
+                number = entry & (MAX_NAMES - 1)
+                doc_names = names[doc]
+                # A tombstone has no names left, and a match on a better tier was taken already
+                if number >= len(doc_names) or match_tier(query, doc_names[number]) != tier:
+                    continue
+                seen.add(doc)
+                found.append(doc)
+                if len(found) == limit:
+                    return [self._payloads[doc] for doc in found]
+        return [self._payloads[doc] for doc in found]
+
+
+def _intersection(postings):
+    """Iterate the entries found in every sorted posting, intersecting smallest first
+
+    Nothing is computed until the first entry is asked for, so tiers a
+    search never reaches cost nothing.
+    """
+    if any(posting is None for posting in postings):
+        return
+    postings = sorted(postings, key=len)
+    entries = postings[0]
+    for posting in postings[1:]:
+        if not len(entries):
+            return
+        positions = np.minimum(np.searchsorted(posting, entries), len(posting) - 1)
+        entries = entries[posting[positions] == entries]
+    yield from _entries(entries)
+
+
+def _entries(posting, chunk=256):
+    """Iterate a posting as Python ints, converting a chunk at a time"""
+    if posting is None:
+        return
+    for start in range(0, len(posting), chunk):
+        yield from posting[start:start + chunk].tolist()
+
+
+def food_payload(food):
+    """Plain-dict copy of a Food row, enough to answer a search without the DB"""
+    payload = {column: getattr(food, column) for column in FOOD_NAME_COLUMNS}
+    payload.update({
+        'id': food.id,
+        'calories': food.calories,
+        'protein': food.protein,
+        'carbs': food.carbs,
+        'fat': food.fat,
+        'fiber': food.fiber,
+        'category': food.category,
+    })
+    return payload
+
+
+class FoodSearchIndex:
+    """Search index over every localized name of Food rows and the CSV catalog
+
+    The Food index is built from one query the first time it is needed and
+    then kept current through add_food() for foods created in this process;
+    the search backend resets it when another worker bumps the shared FOODS
+    version (see versions.py). The CSV index is rebuilt whenever
+    the catalog reloads. index_factory picks the matching strategy; any class
+    with NgramIndex's add/remove/search methods works.
+    """
+
+    def __init__(self, catalog=food_catalog, index_factory=NgramIndex):
+        self.catalog = catalog
+        self.index_factory = index_factory
+        self._lock = threading.Lock()
+        self._foods = None
+        self._csv = None
+        self._csv_version = None
+
+    def _food_index(self):
+        if self._foods is None:
+            from models import Food
+
+            with self._lock:
+                if self._foods is None:
+                    index = self.index_factory()
+                    for food in Food.query.all():
+                        index.add(food.id, [getattr(food, c) for c in FOOD_NAME_COLUMNS], food_payload(food))
+                    self._foods = index
+        return self._foods
+
+    def _csv_index(self):
+        snapshot = self.catalog.snapshot()
+        if self._csv_version != snapshot.version:
+            with self._lock:
+                if self._csv_version != snapshot.version:
+                    if self.index_factory is NgramIndex and snapshot.search_index is not None:
+                        # The mapped catalog snapshot ships its own trigram index
+                        index = snapshot.search_index
+                    else:
+                        index = self.index_factory()
+                        for position, row in enumerate(snapshot.rows):
+                            index.add(position, [row.get(c) for c in CSV_NAME_COLUMNS], row)
+                    self._csv = index
+                    self._csv_version = snapshot.version
+        return self._csv
+
+    def add_food(self, food):
+        """Index a newly created or updated Food; a no-op until the index is built"""
+        if self._foods is not None:
+            self._foods.add(food.id, [getattr(food, c) for c in FOOD_NAME_COLUMNS], food_payload(food))
+
+    def reset(self):
+        """Forget the Food index so it is rebuilt on next use"""
+        with self._lock:
+            self._foods = None
+
+    def search_foods(self, query, limit=10):
+        """Return ranked payload dicts for Food rows matching the query"""
+        return self._food_index().search(query, limit)
+
+    def search_csv(self, query, limit=10):
+        """Return ranked CSV catalog rows matching the query"""
+        return self._csv_index().search(query, limit)
+
+
+food_search_index = FoodSearchIndex()
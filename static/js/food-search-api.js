@@ -34,9 +34,15 @@ function initFoodSearch() {
         
         // Debounce the search to avoid too many requests
         searchTimeout = setTimeout(function() {
-            // Make AJAX request to search endpoint
-            fetch(`/food-search?q=${encodeURIComponent(query)}`)
+            // Ask the autocomplete endpoint first and only fall back to
+            // the full substring search when nothing starts with the query
+            fetch(`/food-autocomplete?q=${encodeURIComponent(query)}`)
                 .then(response => response.json())
+                .then(data => {
+                    if (data.length > 0) return data;
+                    return fetch(`/food-search?q=${encodeURIComponent(query)}`)
+                        .then(response => response.json());
+                })
                 .then(data => {
                     displaySearchResults(data, searchResults);
                 })
@@ -184,10 +184,10 @@ function setActiveNavLink() {
 }
 
 /**
- * Fetch nutrition data for charts
+ * Fetch nutrition data for charts over the last `days` days (7, 30, 90 or 365)
  */
-function loadNutritionData() {
-    fetch('/nutrition-data')
+function loadNutritionData(days) {
+    fetch('/nutrition-data?days=' + (days || 7))
         .then(response => response.json())
         .then(data => {
             // Update charts with new data
@@ -0,0 +1,126 @@
+from datetime import timedelta
+
+from app import db
+from models import Meal, UserStreak
+from achievements import achievement_engine, DAYS_STREAK
+from upserts import insert_ignore
+
+ONE_DAY = timedelta(days=1)
+
+
+def _active_dates(user_id, start=None, end=None):
+    """Return the sorted distinct dates on which the user logged a meal"""
+    query = db.session.query(Meal.date).filter(Meal.user_id == user_id)
+    if start is not None:
+        query = query.filter(Meal.date >= start)
+    if end is not None:
+        query = query.filter(Meal.date <= end)
+    return [row[0] for row in query.distinct().order_by(Meal.date)]
+
+
+def _runs(dates):
+    """Yield (first, last) for each run of consecutive dates in a sorted list"""
+    first = previous = None
+    for day in dates:
+        if previous is None or day != previous + ONE_DAY:
+            if previous is not None:
+                yield first, previous
+            first = day
+        previous = day
+    if previous is not None:
+        yield first, previous
+
+
+def _locked_streak(user_id):
+    """Return (the user's streak row locked for update, whether this call created it)
+
+    Two first meals at once could both find no row; the insert skips a row
+    another transaction created first, and the lock then serializes the two
+    updates instead of letting one overwrite the other.
+    """
+    query = UserStreak.query.filter_by(user_id=user_id).with_for_update()
+    streak = query.first()
+    if streak is not None:
+        return streak, False
+    created = insert_ignore(UserStreak, [{'user_id': user_id, 'current_streak': 0, 'longest_streak': 0}],
+                            ['user_id'])
+    return query.populate_existing().one(), bool(created)
+
+
+def rebuild_streak(user_id, streak=None):
+    """Recompute a user's streak from every logged meal date; the caller commits"""
+    runs = list(_runs(_active_dates(user_id)))
+    if streak is None:
+        streak, _ = _locked_streak(user_id)
+    streak.longest_streak = max(((last - first).days + 1 for first, last in runs), default=0)
+    streak.current_streak = (runs[-1][1] - runs[-1][0]).days + 1 if runs else 0
+    streak.last_active_date = runs[-1][1] if runs else None
+    return streak
+
+
+def longest_streaks_between(first_id, last_id):
+    """Return {user_id: longest streak} for users with ids in [first_id, last_id] from one ordered scan"""
+    rows = db.session.query(Meal.user_id, Meal.date).filter(
+        Meal.user_id.between(first_id, last_id)
+    ).distinct().order_by(Meal.user_id, Meal.date)
+    longest = {}
+    user = previous = None
+    run = 0
+    for user_id, day in rows:
+        if user_id != user or day != previous + ONE_DAY:
+            run = 0
+        run += 1
+        user, previous = user_id, day
+        if run > longest.get(user_id, 0):
+            longest[user_id] = run
+    return longest
+
+
+def _run_around(user_id, day, lookback, lookahead):
+    """Return (first, last) of the run of active dates containing day, within a window"""
+    dates = _active_dates(user_id, day - timedelta(days=lookback), day + timedelta(days=lookahead))
+    for first, last in _runs(dates):
+        if first <= day <= last:
+            return first, last
+    return day, day
+
+
+def record_active_day(user_id, day):
+    """Update a user's streak for a meal logged on day; the caller commits
+
+    Logging today or the day after the last active date is O(1). A
+    backdated meal can only join the runs on either side of it, and neither
+    is longer than the longest streak, so it is resolved from a window of
+    about twice the longest streak around the date. Users without a streak
+    row yet get one built from their full history. Returns the names of the
+    days_streak achievements awarded.
+    """
+    streak, created = _locked_streak(user_id)
+    previous_longest = streak.longest_streak
+    if created:
+        rebuild_streak(user_id, streak)
+    elif streak.last_active_date is None or day > streak.last_active_date:
+        if streak.last_active_date is not None and day == streak.last_active_date + ONE_DAY:
+            streak.current_streak += 1
+        else:
+            streak.current_streak = 1
+        streak.last_active_date = day
+    else:
+        last = streak.last_active_date
+        current_start = last - timedelta(days=streak.current_streak - 1)
+        if day < current_start:
+            bound = streak.longest_streak + 1
+            first, run_last = _run_around(user_id, day, bound, min((last - day).days, bound))
+            if run_last == last:
+                # The day closed the gap before the current streak
+                streak.current_streak = (last - first).days + 1
+            streak.longest_streak = max(streak.longest_streak, (run_last - first).days + 1)
+    streak.longest_streak = max(streak.longest_streak, streak.current_streak)
+    return achievement_engine.check_progress(user_id, DAYS_STREAK, previous_longest, streak.longest_streak)
+
+
+def current_streak(streak, today):
+    """Return the streak still alive today: it lapses once a full day passes without a meal"""
+    if streak is None or streak.last_active_date is None or streak.last_active_date < today - ONE_DAY:
+        return 0
+    return streak.current_streak
@@ -0,0 +1,131 @@
+import os
+import tempfile
+
+import pytest
+
+# Configure the app before it is imported: a throwaway SQLite database, no
+# shared catalog snapshot, a cheap password hash and no delay before a worker
+# sees shared version changes
+_TEST_DIR = tempfile.mkdtemp(prefix='smartcafe-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_TEST_DIR, 'test.db')}"
+os.environ['CATALOG_SNAPSHOT_PATH'] = ''
+os.environ['PASSWORD_HASH_COST'] = '1024'
+os.environ['SHARED_VERSION_POLL_INTERVAL'] = '0'
+os.environ['RESPONSE_CACHE_DIR'] = os.path.join(_TEST_DIR, 'response-cache')
+
+from sqlalchemy import text  # noqa: E402
+
+from app import app as flask_app, db  # noqa: E402
+import search_backends  # noqa: E402
+from achievements import achievement_engine, seed_achievements  # noqa: E402
+from autocomplete import food_autocomplete  # noqa: E402
+from fuzzy_search import food_fuzzy_index  # noqa: E402
+from leaderboard import leaderboard  # noqa: E402
+from models import Food, User, UserProfile, user_cache  # noqa: E402
+from nutrients import nutrient_store  # noqa: E402
+from response_cache import response_cache  # noqa: E402
+from search_index import food_search_index  # noqa: E402
+from versions import shared_versions  # noqa: E402
+
+PASSWORD = 'correct horse battery staple'
+
+
+def reset_process_state():
+    """Forget everything the module-level caches of this process have loaded"""
+    shared_versions.reset()
+    search_backends._backend = None
+    food_search_index.reset()
+    food_fuzzy_index.reset()
+    food_autocomplete.reset()
+    nutrient_store.reset()
+    achievement_engine.reset()
+    leaderboard.reset()
+    user_cache.clear()
+    if response_cache.backend is not None:
+        response_cache.backend.clear()
+    response_cache.hits.clear()
+    response_cache.misses.clear()
+
+
+@pytest.fixture(autouse=True)
+def database():
+    """Give every test empty tables and cold caches
+
+    No app context stays pushed while the test runs: the test client would
+    reuse it, sharing g and the session between requests.
+    """
+    flask_app.config['TESTING'] = True
+    with flask_app.app_context():
+        db.session.execute(text('DROP TABLE IF EXISTS food_fts'))
+        db.session.commit()
+        db.drop_all()
+        db.create_all()
+        seed_achievements()
+    reset_process_state()
+    yield
+    with flask_app.app_context():
+        db.session.remove()
+
+
+@pytest.fixture
+def app():
+    return flask_app
+
+
+@pytest.fixture
+def client():
+    return flask_app.test_client()
+
+
+@pytest.fixture
+def make_user():
+    """Create a user with a profile and return its id"""
+    def make(username='alice', password=PASSWORD, **values):
+        with flask_app.app_context():
+            user = User(username=username, email=f'{username}@example.com', **values)
+            user.set_password(password)
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(UserProfile(user_id=user.id))
+            db.session.commit()
+            return user.id
+    return make
+
+
+@pytest.fixture
+def make_food():
+    """Create a Food row and return its id"""
+    def make(name, calories=100, **values):
+        defaults = {'protein': 5.0, 'carbs': 10.0, 'fat': 2.0, 'fiber': 1.0, 'category': 'snack'}
+        with flask_app.app_context():
+            food = Food(name=name, calories=calories, **dict(defaults, **values))
+            db.session.add(food)
+            db.session.commit()
+            return food.id
+    return make
+
+
+@pytest.fixture
+def login(client):
+    """Log the test client in as a username"""
+    def log_in(username='alice', password=PASSWORD):
+        response = client.post('/login', data={'username': username, 'password': password})
+        assert response.status_code == 302
+        assert not response.headers['Location'].endswith('/login')
+        return client
+    return log_in
+
+
+@pytest.fixture
+def log_meals():
+    """Record meals through the bulk import path: [(user_id, date, meal_type, [(food_id, portion)])]"""
+    from meal_import import import_meals
+
+    def log(meals):
+        records = [{
+            'user_id': user_id, 'date': day.isoformat(), 'meal_type': meal_type,
+            'items': [{'food_id': food_id, 'portion_size': portion} for food_id, portion in items],
+        } for user_id, day, meal_type, items in meals]
+        with flask_app.app_context():
+            return import_meals(records)
+    return log
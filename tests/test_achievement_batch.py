@@ -0,0 +1,45 @@
+from datetime import date, datetime
+
+import achievement_batch
+from achievement_batch import recompute_achievements
+from app import db
+from models import UserAchievement
+
+
+def earned(user_id):
+    return sorted(row[0] for row in db.session.query(UserAchievement.achievement_id).filter_by(user_id=user_id))
+
+
+def test_recompute_awards_what_users_reached(app, make_user, make_food, log_meals, tmp_path):
+    alice, bob = make_user('alice'), make_user('bob')
+    tea = make_food('Tea')
+    log_meals([(alice, date(2026, 3, day), 'lunch', [(tea, 'medium')]) for day in range(1, 11)]
+              + [(bob, date(2026, 3, 1), 'lunch', [(tea, 'medium')])])
+    with app.app_context():
+        db.session.execute(db.delete(UserAchievement))
+        db.session.commit()
+        awarded = recompute_achievements(chunk_size=1, workers=1, state_file=str(tmp_path / 'state.json'),
+                                         report=lambda line: None)
+        assert awarded == 5
+        assert earned(alice) == [1, 2, 5, 6]
+        assert earned(bob) == [1]
+
+
+def test_awards_made_by_a_request_during_the_run_are_skipped(app, make_user, monkeypatch, tmp_path):
+    user_id = make_user()
+    compute_chunk = achievement_batch.compute_chunk
+
+    def chunk_racing_a_request(first_id, last_id, rules):
+        # The chunk was computed from a snapshot without this award
+        db.session.add(UserAchievement(user_id=user_id, achievement_id=1))
+        db.session.commit()
+        user_count, missing = compute_chunk(first_id, last_id, rules)
+        return user_count, missing + [{'user_id': user_id, 'achievement_id': 1}]
+
+    monkeypatch.setattr(achievement_batch, 'compute_chunk', chunk_racing_a_request)
+    with app.app_context():
+        awarded = recompute_achievements(workers=1, state_file=str(tmp_path / 'state.json'),
+                                         report=lambda line: None)
+        assert awarded == 0
+        assert earned(user_id) == [1]
+        assert UserAchievement.query.one().earned_date <= datetime.utcnow()
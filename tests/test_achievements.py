@@ -0,0 +1,130 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+import achievements
+from achievements import MEALS_LOGGED, achievement_engine
+from app import db
+from migrations import unique_user_achievements
+from models import Achievement, UserAchievement, UserCounter
+from upserts import insert_ignore
+from versions import ACHIEVEMENT_RULES, shared_versions
+
+
+def counter_value(user_id):
+    return db.session.query(UserCounter.value).filter_by(user_id=user_id, name=MEALS_LOGGED).scalar()
+
+
+def earned(user_id):
+    return sorted(row[0] for row in db.session.query(UserAchievement.achievement_id).filter_by(user_id=user_id))
+
+
+def test_thresholds_are_awarded_once(app, make_user):
+    user_id = make_user()
+    with app.app_context():
+        db.session.add(UserCounter(user_id=user_id, name=MEALS_LOGGED, value=0))
+        assert achievement_engine.record_event(user_id, MEALS_LOGGED, 1) == ['First Meal']
+        assert achievement_engine.record_event(user_id, MEALS_LOGGED, 8) == []
+        assert achievement_engine.record_event(user_id, MEALS_LOGGED, 25) == ['Regular Tracker', 'Committed Tracker']
+        db.session.commit()
+        assert counter_value(user_id) == 34
+        assert earned(user_id) == [1, 2, 3]
+
+
+def test_first_event_starts_from_logged_meals(app, make_user, make_food, log_meals):
+    user_id = make_user()
+    tea = make_food('Tea')
+    log_meals([(user_id, date(2026, 3, 2), 'lunch', [(tea, 'medium')]) for _ in range(10)])
+    with app.app_context():
+        db.session.execute(db.delete(UserCounter))
+        db.session.execute(db.delete(UserAchievement))
+        db.session.commit()
+        assert achievement_engine.record_event(user_id, MEALS_LOGGED, 1) == ['First Meal', 'Regular Tracker']
+        assert counter_value(user_id) == 10
+
+
+def test_concurrent_first_event_is_counted_on_the_existing_row(app, make_user, monkeypatch):
+    user_id = make_user()
+
+    def source_racing_another_request(user):
+        # Another request creates the counter after this one found none
+        db.session.execute(db.insert(UserCounter).values(user_id=user, name=MEALS_LOGGED, value=5))
+        return 1
+
+    monkeypatch.setitem(achievements.COUNTER_SOURCES, MEALS_LOGGED, source_racing_another_request)
+    with app.app_context():
+        assert achievement_engine.record_event(user_id, MEALS_LOGGED, 1) == []
+        db.session.commit()
+        assert counter_value(user_id) == 6
+
+
+def test_insert_ignore_reports_the_rows_it_created(app, make_user):
+    user_id = make_user()
+    with app.app_context():
+        rows = [{'user_id': user_id, 'name': name, 'value': 1} for name in ('a', 'b')]
+        assert insert_ignore(UserCounter, rows[:1], ['user_id', 'name']) == {(user_id, 'a')}
+        assert insert_ignore(UserCounter, rows, ['user_id', 'name']) == {(user_id, 'b')}
+        assert insert_ignore(UserCounter, [], ['user_id', 'name']) == set()
+        db.session.commit()
+        assert UserCounter.query.count() == 2
+
+
+def test_logging_meals_unlocks_achievements(make_user, make_food, login):
+    make_user()
+    tea = make_food('Tea')
+    client = login()
+    page = client.post('/add-meal', data={'food_id': [str(tea)], 'meal_type': 'lunch'}, follow_redirects=True)
+    assert 'Achievement unlocked: First Meal!' in page.get_data(as_text=True)
+
+
+def test_an_award_made_by_a_concurrent_request_is_not_repeated(app, make_user):
+    user_id = make_user()
+    with app.app_context():
+        # The other request awarded First Meal after this one read the counter
+        db.session.add(UserAchievement(user_id=user_id, achievement_id=1))
+        db.session.flush()
+        assert achievement_engine.check_progress(user_id, MEALS_LOGGED, 0, 10) == ['Regular Tracker']
+        db.session.commit()
+        assert earned(user_id) == [1, 2]
+
+
+def test_duplicate_awards_are_rejected_by_the_database(app, make_user):
+    user_id = make_user()
+    with app.app_context():
+        db.session.add_all([UserAchievement(user_id=user_id, achievement_id=1) for _ in range(2)])
+        with pytest.raises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+
+def test_rules_added_by_another_worker_are_picked_up(app, make_user):
+    user_id = make_user()
+    with app.app_context():
+        shared_versions.poll()
+        assert achievement_engine.check_progress(user_id, MEALS_LOGGED, 0, 5) == ['First Meal']
+
+        db.session.add(Achievement(id=8, name='High Five', description='Log 5 meals', icon='fa-utensils',
+                                   requirement_type=MEALS_LOGGED, requirement_value=5))
+        shared_versions.bump(ACHIEVEMENT_RULES)
+        db.session.commit()
+        shared_versions.poll()
+        assert achievement_engine.check_progress(user_id, MEALS_LOGGED, 1, 5) == ['High Five']
+
+
+def test_migration_removes_duplicate_awards_and_adds_the_index(app, make_user):
+    user_id = make_user()
+    with app.app_context():
+        db.session.execute(text('DROP INDEX uq_user_achievement_user_id_achievement_id'))
+        db.session.add_all([UserAchievement(user_id=user_id, achievement_id=1) for _ in range(3)]
+                           + [UserAchievement(user_id=user_id, achievement_id=2)])
+        db.session.commit()
+
+        unique_user_achievements()
+        db.session.commit()
+        assert earned(user_id) == [1, 2]
+        db.session.add(UserAchievement(user_id=user_id, achievement_id=2))
+        with pytest.raises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
@@ -0,0 +1,88 @@
+from datetime import date
+
+import pytest
+
+from aggregation import aggregate_nutrition
+from app import db
+from models import Meal, MealItem
+from rollups import rebuild_rollups
+
+MONDAY = date(2026, 3, 2)
+
+
+@pytest.fixture
+def meals(make_user, make_food, log_meals):
+    user_id = make_user()
+    tea = make_food('Tea', calories=40, category='beverage')
+    naan = make_food('Naan', calories=260, category='side')
+    log_meals([
+        (user_id, MONDAY, 'lunch', [(naan, 'large'), (tea, 'medium')]),
+        (user_id, MONDAY, 'snack', [(tea, 'small')]),
+        (user_id, date(2026, 3, 9), 'lunch', [(tea, 'medium')]),
+    ])
+    return user_id, tea, naan
+
+
+def test_rollup_dimensions(app, meals):
+    user_id, _, _ = meals
+    with app.app_context():
+        by_week = aggregate_nutrition(user_id, MONDAY, date(2026, 3, 31), ['week'], ['calories', 'meal_count'])
+        by_type = aggregate_nutrition(user_id, MONDAY, MONDAY, ['meal_type'])
+        total = aggregate_nutrition(user_id, MONDAY, date(2026, 3, 31))
+    assert by_week == [
+        {'week': '2026-03-02', 'calories': 460.0, 'meal_count': 2},
+        {'week': '2026-03-09', 'calories': 40.0, 'meal_count': 1},
+    ]
+    assert by_type == [{'meal_type': 'lunch', 'calories': 430.0}, {'meal_type': 'snack', 'calories': 30.0}]
+    assert total == [{'calories': 500.0}]
+
+
+def test_item_dimensions_scale_by_portion(app, meals):
+    user_id, tea, naan = meals
+    with app.app_context():
+        by_category = aggregate_nutrition(user_id, MONDAY, MONDAY, ['category'], ['calories', 'meal_count'])
+        by_food = aggregate_nutrition(user_id, MONDAY, date(2026, 3, 31), ['month', 'food'])
+    assert by_category == [
+        {'category': 'beverage', 'calories': 70.0, 'meal_count': 2},
+        {'category': 'side', 'calories': 390.0, 'meal_count': 1},
+    ]
+    assert by_food == [
+        {'month': '2026-03-01', 'food': tea, 'calories': 110.0, 'food_name': 'Tea'},
+        {'month': '2026-03-01', 'food': naan, 'calories': 390.0, 'food_name': 'Naan'},
+    ]
+
+
+def test_rollup_and_item_paths_count_the_same_meals(app, meals):
+    user_id, tea, _ = meals
+    with app.app_context():
+        # A meal whose items are gone, and one logged with a blank meal type
+        db.session.add(Meal(user_id=user_id, date=MONDAY, meal_type='dinner'))
+        blank = Meal(user_id=user_id, date=MONDAY, meal_type='')
+        db.session.add(blank)
+        db.session.flush()
+        db.session.add(MealItem(meal_id=blank.id, food_id=tea, portion_size='medium'))
+        rebuild_rollups()
+        db.session.commit()
+
+        for group_by in ([], ['date'], ['week'], ['meal_type'], ['date', 'meal_type']):
+            measures = ['calories', 'meal_count']
+            rollup = aggregate_nutrition(user_id, MONDAY, date(2026, 3, 31), group_by, measures)
+            items = aggregate_nutrition(user_id, MONDAY, date(2026, 3, 31), group_by, measures, use_rollup=False)
+            assert rollup == items
+        assert aggregate_nutrition(user_id, MONDAY, MONDAY, measures=['meal_count']) == [{'meal_count': 3}]
+
+
+def test_unknown_dimensions_and_measures_are_rejected(app, meals):
+    user_id, _, _ = meals
+    with app.app_context():
+        with pytest.raises(ValueError):
+            aggregate_nutrition(user_id, MONDAY, MONDAY, ['weekday'])
+        with pytest.raises(ValueError):
+            aggregate_nutrition(user_id, MONDAY, MONDAY, measures=['price'])
+
+
+def test_endpoint_reports_bad_input_as_400(meals, login):
+    client = login()
+    response = client.get('/nutrition-aggregate?group_by=meal_type&start_date=2026-03-02&end_date=2026-03-02')
+    assert response.get_json() == [{'meal_type': 'lunch', 'calories': 430.0}, {'meal_type': 'snack', 'calories': 30.0}]
+    assert client.get('/nutrition-aggregate?group_by=weekday').status_code == 400
@@ -0,0 +1,67 @@
+import math
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from analytics import ANALYTICS_MAX_DAYS, ANALYTICS_NUTRIENTS, compute_analytics, rolling_average
+
+TARGETS = {'calories': 2000, 'protein': 100, 'carbs': 250, 'fat': 60}
+MONDAY = date(2026, 3, 2)
+
+
+def series(calories):
+    """Arrays for compute_analytics with None marking days without meals"""
+    logged = np.array([value is not None for value in calories])
+    values = np.zeros((len(calories), len(ANALYTICS_NUTRIENTS)))
+    values[:, 0] = [value or 0 for value in calories]
+    return logged, values
+
+
+def test_rolling_average_skips_days_without_meals():
+    logged, values = series([100, None, 300, None])
+    rolling = rolling_average(logged, values, window=2)[:, 0]
+    assert rolling[0] == 100
+    assert rolling[1] == 100
+    assert rolling[2] == 300
+    assert rolling[3] == 300
+
+    logged, values = series([None, None])
+    assert np.isnan(rolling_average(logged, values)).all()
+
+
+def test_adherence_percentiles_and_weekdays_use_logged_days_only():
+    logged, values = series([2000, 1500, None, 2150, None, None, None, 1950])
+    result = compute_analytics(logged, values, MONDAY, TARGETS)
+
+    assert result['days'] == 8
+    assert result['logged_days'] == 4
+    assert result['dates'][0] == '2026-03-02'
+    assert result['end_date'] == '2026-03-09'
+    # 1500 is outside 10% of the target
+    assert result['adherence']['calories'] == 75.0
+    assert result['percentiles']['calories']['p50'] == 1975.0
+    assert result['weekday_average']['calories']['monday'] == 1975.0
+    assert result['weekday_average']['calories']['wednesday'] is None
+
+
+def test_nothing_logged_gives_nulls():
+    logged, values = series([None] * 3)
+    result = compute_analytics(logged, values, MONDAY, TARGETS)
+    assert result['adherence']['calories'] is None
+    assert result['percentiles']['calories']['p90'] is None
+    assert all(value is None for value in result['rolling_average']['calories'])
+
+
+def test_endpoint_reads_the_rollup_and_clamps_days(make_user, make_food, log_meals, login):
+    user_id = make_user()
+    today = datetime.utcnow().date()
+    food = make_food('Thali', calories=2000)
+    log_meals([(user_id, today - timedelta(days=offset), 'lunch', [(food, 'medium')]) for offset in range(3)])
+    client = login()
+
+    result = client.get('/nutrition-analytics?days=7').get_json()
+    assert result['logged_days'] == 3
+    assert result['adherence']['calories'] == 100.0
+    assert not math.isnan(result['rolling_average']['calories'][-1])
+    assert client.get('/nutrition-analytics?days=0').get_json()['days'] == 1
+    assert client.get('/nutrition-analytics?days=99999').get_json()['days'] == ANALYTICS_MAX_DAYS
@@ -0,0 +1,114 @@
+from datetime import date
+
+from app import db
+from autocomplete import FoodAutocomplete, PopularityTrie, completion_keys, food_autocomplete
+from models import Food
+from versions import FOODS, shared_versions
+
+
+def names(results):
+    return [food['name'] for food in results]
+
+
+def test_completion_keys_start_at_word_boundaries():
+    assert completion_keys('Hot tea (Garam Chai)') == ['hot tea garam chai', 'tea garam chai', 'garam chai', 'chai']
+
+
+def test_trie_ranks_by_popularity_then_id():
+    popularity = {2: 5}
+    trie = PopularityTrie(popularity)
+    trie.insert('chai', 1)
+    trie.insert('chai latte', 2)
+    assert trie.complete('cha') == [2, 1]
+
+    popularity[1] = 9
+    trie.bump('chai', 1)
+    assert trie.complete('cha') == [1, 2]
+
+
+def test_most_logged_food_completes_first(app, make_user, make_food, log_meals):
+    user_id = make_user()
+    latte = make_food('Chai Latte')
+    masala = make_food('Masala Chai')
+    log_meals([(user_id, date(2026, 1, 1), 'snack', [(masala, 'medium')])])
+
+    with app.app_context():
+        assert names(food_autocomplete.complete('chai')) == ['Masala Chai', 'Chai Latte']
+        food_autocomplete.record_use([latte, latte])
+        assert names(food_autocomplete.complete('chai')) == ['Chai Latte', 'Masala Chai']
+
+
+def test_renamed_food_loses_its_old_name(app, make_food):
+    food_id = make_food('Masala Chai')
+    with app.app_context():
+        assert names(food_autocomplete.complete('masala')) == ['Masala Chai']
+        food = db.session.get(Food, food_id)
+        food.name = 'Ginger Chai'
+        db.session.commit()
+        food_autocomplete.add_food(food)
+
+        assert food_autocomplete.complete('masala') == []
+        assert names(food_autocomplete.complete('ginger')) == ['Ginger Chai']
+
+
+def test_food_from_another_worker_completes(app, make_user, login):
+    make_user()
+    client = login()
+    assert client.get('/food-autocomplete?q=tikka').get_json() == []
+
+    # Another worker creates the food; only the shared version tells this one
+    with app.app_context():
+        db.session.add(Food(name='Paneer Tikka', calories=250, is_custom=True))
+        shared_versions.bump(FOODS)
+        db.session.commit()
+
+    # The request sees the bump and answers from the current tries while
+    # they are rebuilt in the background
+    assert client.get('/food-autocomplete?q=tikka').get_json() == []
+    food_autocomplete.wait()
+    assert names(client.get('/food-autocomplete?q=tikka').get_json()) == ['Paneer Tikka']
+
+
+def test_popularity_from_other_workers_is_reloaded_after_max_age(app, make_user, make_food, log_meals):
+    user_id = make_user()
+    make_food('Chai Latte')
+    masala = make_food('Masala Chai')
+    autocomplete = FoodAutocomplete(max_age=0)
+    with app.app_context():
+        assert names(autocomplete.complete('chai')) == ['Chai Latte', 'Masala Chai']
+    # Logged elsewhere: record_use() is never called on this instance
+    log_meals([(user_id, date(2026, 1, 1), 'snack', [(masala, 'medium')])])
+    with app.app_context():
+        # Counting the new meal happens in the background
+        assert names(autocomplete.complete('chai')) == ['Chai Latte', 'Masala Chai']
+        autocomplete.wait()
+        assert names(autocomplete.complete('chai')) == ['Masala Chai', 'Chai Latte']
+
+
+def test_own_uses_are_not_counted_twice(app, make_user, make_food, log_meals):
+    user_id = make_user()
+    latte = make_food('Chai Latte')
+    masala = make_food('Masala Chai')
+    autocomplete = FoodAutocomplete(max_age=0)
+    with app.app_context():
+        autocomplete.complete('chai')
+        autocomplete.wait()
+    log_meals([(user_id, date(2026, 1, 1), 'snack', [(latte, 'medium'), (latte, 'small')])])
+    autocomplete.record_use([latte, latte])
+    # Logged elsewhere: this instance only learns about it from the database
+    log_meals([(user_id, date(2026, 1, 2), 'snack', [(masala, 'medium')])])
+    with app.app_context():
+        autocomplete.complete('chai')
+        autocomplete.wait()
+        assert autocomplete._popularity == {latte: 2, masala: 1}
+
+
+def test_api_limit_is_clamped(make_user, make_food, login):
+    make_user()
+    for number in range(12):
+        make_food(f'Chai {number}')
+    client = login()
+
+    assert len(client.get('/food-autocomplete?q=chai&limit=0').get_json()) == 1
+    assert len(client.get('/food-autocomplete?q=chai&limit=-3').get_json()) == 1
+    assert len(client.get('/food-autocomplete?q=chai&limit=50').get_json()) == 10
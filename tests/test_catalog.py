@@ -0,0 +1,75 @@
+import os
+
+from catalog import CATEGORIES, FoodCatalog, categorize_food
+
+CSV_HEADER = 'Dish Name,Calories (kcal),Protein (g),name_hi\n'
+
+
+def write_csv(path, lines):
+    path.write_text(CSV_HEADER + ''.join(line + '\n' for line in lines), encoding='utf-8')
+
+
+def test_parses_once_and_reuses_the_snapshot(tmp_path, monkeypatch):
+    path = tmp_path / 'foods.csv'
+    write_csv(path, ['Masala tea,40,1.5,मसाला चाय', 'Veg curry,180,4'])
+    catalog = FoodCatalog(str(path), snapshot_path='')
+    parses = []
+    parse = catalog._parse
+    monkeypatch.setattr(catalog, '_parse', lambda: parses.append(1) or parse())
+
+    first = catalog.snapshot()
+    assert catalog.snapshot() is first
+    assert catalog.rows is first.rows
+    assert len(parses) == 1
+    assert first.rows[0]['Dish Name'] == 'Masala tea'
+    assert first.rows[0]['Calories (kcal)'] == 40.0
+    # Blank numeric cells read as zero
+    assert first.rows[1]['Protein (g)'] == 4.0
+
+
+def test_reloads_when_the_file_changes(tmp_path):
+    path = tmp_path / 'foods.csv'
+    write_csv(path, ['Masala tea,40,1.5'])
+    catalog = FoodCatalog(str(path), snapshot_path='')
+    first = catalog.snapshot()
+
+    write_csv(path, ['Masala tea,40,1.5', 'Plain naan,260,8'])
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, first.mtime + 1_000_000_000))
+
+    second = catalog.snapshot()
+    assert second is not first
+    assert second.version == first.version + 1
+    assert [row['Dish Name'] for row in second.rows] == ['Masala tea', 'Plain naan']
+
+
+def test_missing_file_gives_an_empty_catalog(tmp_path):
+    catalog = FoodCatalog(str(tmp_path / 'missing.csv'), snapshot_path='')
+    assert catalog.rows == ()
+
+
+
+def test_menu_renders_from_the_shared_catalog(make_user, login):
+    make_user()
+    client = login()
+    response = client.get('/menu')
+    assert response.status_code == 200
+    assert 'Hot tea (Garam Chai)' in response.get_data(as_text=True)
+
+
+def test_rows_are_grouped_by_category(tmp_path):
+    path = tmp_path / 'foods.csv'
+    write_csv(path, ['Masala tea,40,1', 'Veg curry,180,4', 'Plain naan,260,8', 'Samosa,250,5'])
+    snapshot = FoodCatalog(str(path), snapshot_path='').snapshot()
+
+    assert set(snapshot.by_category) == set(CATEGORIES)
+    assert [row['Dish Name'] for row in snapshot.by_category['beverage']] == ['Masala tea']
+    assert [row['Dish Name'] for row in snapshot.by_category['main_course']] == ['Veg curry']
+    assert [row['Dish Name'] for row in snapshot.by_category['side']] == ['Plain naan']
+    assert [row['Dish Name'] for row in snapshot.by_category['snack']] == ['Samosa']
+
+
+def test_categorize_food():
+    assert categorize_food('Lemonade') == 'beverage'
+    assert categorize_food('Jeera Rice') == 'main_course'
+    assert categorize_food(None) == 'snack'
@@ -0,0 +1,68 @@
+from catalog import CSV_PATH, FoodCatalog
+from catalog_snapshot import MappedCatalog, load_or_build, write_snapshot
+from search_index import CSV_NAME_COLUMNS, NgramIndex
+
+
+def parsed_rows():
+    return FoodCatalog(CSV_PATH, snapshot_path='')._parse()
+
+
+def test_snapshot_reads_back_the_parsed_rows(tmp_path):
+    rows = parsed_rows()
+    path = str(tmp_path / 'catalog.snapshot')
+    write_snapshot(rows, 123, path)
+
+    mapped = MappedCatalog(path)
+    assert mapped.source_mtime == 123
+    assert len(mapped.rows) == len(rows)
+    assert list(mapped.rows) == list(rows)
+    for category, category_rows in mapped.by_category.items():
+        assert list(category_rows) == [row for row in rows if row['category'] == category]
+
+
+def test_mapped_index_matches_the_in_memory_index(tmp_path):
+    rows = parsed_rows()
+    path = str(tmp_path / 'catalog.snapshot')
+    write_snapshot(rows, 1, path)
+    mapped = MappedCatalog(path)
+    index = NgramIndex()
+    for position, row in enumerate(rows):
+        index.add(position, [row.get(c) for c in CSV_NAME_COLUMNS], row)
+
+    for query in ('tea', 'coffee', 'चाय', 'ice', 'zzz'):
+        assert [row['Dish Name'] for row in mapped.search_index.search(query)] == \
+            [row['Dish Name'] for row in index.search(query)]
+
+
+def test_stale_or_corrupt_snapshots_are_rewritten(tmp_path):
+    path = tmp_path / 'catalog.snapshot'
+    path.write_bytes(b'not a snapshot')
+    parses = []
+
+    def parse():
+        parses.append(1)
+        return parsed_rows()
+
+    assert load_or_build(str(path), 5, parse).source_mtime == 5
+    assert load_or_build(str(path), 5, parse).source_mtime == 5
+    assert len(parses) == 1
+    assert load_or_build(str(path), 6, parse).source_mtime == 6
+    assert len(parses) == 2
+
+
+def test_catalog_falls_back_to_the_csv_when_the_snapshot_is_unusable(tmp_path, monkeypatch):
+    import catalog_snapshot
+
+    def unusable(*args):
+        raise ValueError('truncated snapshot')
+
+    monkeypatch.setattr(catalog_snapshot, 'load_or_build', unusable)
+    catalog = FoodCatalog(CSV_PATH, snapshot_path=str(tmp_path / 'catalog.snapshot'))
+    assert list(catalog.rows) == list(parsed_rows())
+
+
+def test_catalog_serves_rows_from_the_snapshot(tmp_path):
+    catalog = FoodCatalog(CSV_PATH, snapshot_path=str(tmp_path / 'catalog.snapshot'))
+    snapshot = catalog.snapshot()
+    assert snapshot.search_index is not None
+    assert list(snapshot.rows) == list(parsed_rows())
@@ -0,0 +1,73 @@
+from datetime import date, datetime, timedelta
+
+from utils import RANGE_MAX_DAYS, chart_bucket, clamp_range, get_nutrition_range_data
+
+
+def test_chart_bucket_grows_with_the_window():
+    assert chart_bucket(7) == 'day'
+    assert chart_bucket(31) == 'day'
+    assert chart_bucket(90) == 'week'
+    assert chart_bucket(365) == 'month'
+
+
+def test_daily_range_has_one_point_per_day(app, make_user, make_food, log_meals):
+    user_id = make_user()
+    tea = make_food('Tea', calories=40)
+    start = date(2026, 3, 2)
+    log_meals([(user_id, start, 'lunch', [(tea, 'medium')]), (user_id, start + timedelta(days=2), 'lunch', [(tea, 'large')])])
+
+    with app.app_context():
+        data = get_nutrition_range_data(user_id, start, start + timedelta(days=2))
+    assert data['bucket'] == 'day'
+    assert data['dates'] == ['2026-03-02', '2026-03-03', '2026-03-04']
+    assert data['calories'] == [40, 0, 60]
+    assert data['target_calories'] == 2000
+
+
+def test_weekly_buckets_average_the_days_inside_the_range(app, make_user, make_food, log_meals):
+    user_id = make_user()
+    tea = make_food('Tea', calories=70)
+    # Sunday 2026-03-08 ends a week that started before the range
+    start = date(2026, 3, 7)
+    log_meals([(user_id, start, 'lunch', [(tea, 'medium')])])
+
+    with app.app_context():
+        data = get_nutrition_range_data(user_id, start, start + timedelta(days=8), bucket='week')
+    assert data['dates'] == ['2026-03-02', '2026-03-09']
+    # 70 kcal over the two days of the first week that fall in the range
+    assert data['calories'] == [35, 0]
+
+
+def test_long_ranges_are_cut_to_their_last_days(app, make_user):
+    user_id = make_user()
+    end = date(2026, 3, 31)
+    assert clamp_range(date(1900, 1, 1), end) == (end - timedelta(days=RANGE_MAX_DAYS - 1), end)
+    assert clamp_range(end + timedelta(days=3), end) == (end, end)
+
+    with app.app_context():
+        data = get_nutrition_range_data(user_id, date(1900, 1, 1), end)
+    assert data['bucket'] == 'month'
+    assert data['dates'][0] == (end - timedelta(days=RANGE_MAX_DAYS - 1)).replace(day=1).isoformat()
+    assert data['dates'][-1] == '2026-03-01'
+
+
+def test_history_page_clamps_the_range(make_user, login):
+    make_user()
+    client = login()
+    response = client.get('/history?start_date=1900-01-01&end_date=2026-03-31')
+    assert response.status_code == 200
+    page = response.get_data(as_text=True)
+    assert '1900-01-01' not in page
+    assert (date(2026, 3, 31) - timedelta(days=RANGE_MAX_DAYS - 1)).isoformat() in page
+
+
+def test_nutrition_data_endpoint_accepts_known_windows_only(make_user, make_food, log_meals, login):
+    user_id = make_user()
+    log_meals([(user_id, datetime.utcnow().date(), 'lunch', [(make_food('Tea', calories=40), 'medium')])])
+    client = login()
+
+    week = client.get('/nutrition-data').get_json()
+    assert len(week['dates']) == 7
+    assert week['calories'][-1] == 40
+    assert client.get('/nutrition-data?days=365').get_json()['bucket'] == 'month'
+    assert len(client.get('/nutrition-data?days=12').get_json()['dates']) == 7
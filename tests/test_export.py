@@ -0,0 +1,46 @@
+import csv
+import io
+import json
+from datetime import date
+
+from export import EXPORT_COLUMNS, iter_meal_item_rows
+
+DAY = date(2026, 3, 2)
+
+
+def test_rows_come_in_batches_oldest_first(app, make_user, make_food, log_meals):
+    user_id = make_user()
+    other = make_user('bob')
+    tea = make_food('Tea', calories=40)
+    log_meals([
+        (user_id, date(2026, 3, 3), 'lunch', [(tea, 'large')]),
+        (user_id, DAY, 'lunch', [(tea, 'small'), (tea, 'medium')]),
+        (other, DAY, 'lunch', [(tea, 'medium')]),
+    ])
+
+    with app.app_context():
+        batches = list(iter_meal_item_rows(user_id, batch_size=2))
+    assert [len(batch) for batch in batches] == [2, 1]
+    rows = [row for batch in batches for row in batch]
+    assert [(row['date'], row['portion_size'], row['calories']) for row in rows] == [
+        ('2026-03-02', 'small', 30.0), ('2026-03-02', 'medium', 40.0), ('2026-03-03', 'large', 60.0)]
+    assert list(rows[0]) == list(EXPORT_COLUMNS)
+
+
+def test_export_formats(make_user, make_food, log_meals, login):
+    user_id = make_user()
+    log_meals([(user_id, DAY, 'lunch', [(make_food('Masala Chai', calories=40), 'medium')])])
+    client = login()
+
+    response = client.get('/export-meals')
+    assert response.mimetype == 'text/csv'
+    assert 'attachment' in response.headers['Content-Disposition']
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [(row['food_name'], row['calories']) for row in rows] == [('Masala Chai', '40.0')]
+
+    response = client.get('/export-meals?format=ndjson')
+    assert response.mimetype == 'application/x-ndjson'
+    lines = response.get_data(as_text=True).splitlines()
+    assert [json.loads(line)['food_name'] for line in lines] == ['Masala Chai']
+
+    assert client.get('/export-meals?format=xml').status_code == 400
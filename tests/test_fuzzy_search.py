@@ -0,0 +1,53 @@
+from fuzzy_search import FuzzyIndex, bounded_levenshtein, deletes, phonetic_key, transliterate, word_keys
+
+
+def test_romanized_and_native_spellings_share_keys():
+    assert word_keys('chai') == word_keys('chay') == word_keys('चाय')
+    assert word_keys('paneer') == word_keys('पनीर')
+    assert phonetic_key('bhaji') == phonetic_key('baji')
+
+
+def test_transliterate_leaves_latin_text_without_accents():
+    assert transliterate('café') == 'cafe'
+
+
+def test_bounded_levenshtein_stops_past_the_bound():
+    assert bounded_levenshtein('kitten', 'sitting', 5) == 3
+    assert bounded_levenshtein('kitten', 'sitting', 1) == 2
+
+
+def test_deletes_covers_every_variant_up_to_depth():
+    assert deletes('abc', 1) == {'abc', 'bc', 'ac', 'ab'}
+
+
+def test_typos_and_other_scripts_find_the_food():
+    index = FuzzyIndex()
+    index.add(1, ['Masala Chai'], 'masala chai')
+    index.add(2, ['Paneer Tikka', 'पनीर टिक्का'], 'paneer tikka')
+    index.add(3, ['Lemon Tea'], 'lemon tea')
+
+    assert index.search('masla chay') == ['masala chai']
+    assert index.search('panir') == ['paneer tikka']
+    assert index.search('पनीर') == ['paneer tikka']
+    assert index.search('xyzzy') == []
+
+
+def test_replaced_documents_leave_the_results():
+    index = FuzzyIndex()
+    index.add(1, ['Masala Chai'], 'old')
+    index.add(1, ['Ginger Tea'], 'new')
+    assert index.search('masala') == []
+    assert index.search('gingr') == ['new']
+
+
+def test_search_falls_back_to_fuzzy_only_without_exact_hits(make_user, make_food, login):
+    make_user()
+    make_food('Paneer Tikka')
+    client = login()
+
+    def db_names(url):
+        return [food['name'] for food in client.get(url).get_json() if food['source'] == 'db']
+
+    assert db_names('/food-search?q=panir') == ['Paneer Tikka']
+    assert db_names('/food-search?q=panir&fuzzy=0') == []
+    assert db_names('/food-search?q=tikka&fuzzy=1') == ['Paneer Tikka']
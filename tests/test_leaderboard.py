@@ -0,0 +1,133 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from achievements import MEALS_LOGGED
+from app import db
+from leaderboard import (
+    ADHERENCE_MIN_DAYS, ADHERENCE_WINDOW_DAYS, Leaderboard, MetricRanking, leaderboard, rebuild_leaderboard, refresh_adherence,
+)
+from models import DailyNutrition, LeaderboardChange, LeaderboardScore, UserCounter
+from versions import LEADERBOARD, shared_versions
+
+
+def log_meals_counted(user_id, count):
+    """Set a user's meal counter and score it, as logging a meal would"""
+    db.session.merge(UserCounter(id=user_id, user_id=user_id, name=MEALS_LOGGED, value=count))
+    leaderboard.update_user(user_id)
+    db.session.commit()
+
+
+def test_ties_are_ranked_together_in_user_order():
+    ranking = MetricRanking()
+    for user_id, score in ((5, 10), (3, 10), (9, 4), (1, 10), (7, 0)):
+        ranking.set(user_id, score)
+    assert ranking.top(10) == [(1, 1, 10), (1, 3, 10), (1, 5, 10), (4, 9, 4)]
+    assert ranking.buckets[10] == [1, 3, 5]
+
+    ranking.set(3, 2)
+    ranking.set(1, 0)
+    assert ranking.top(2) == [(1, 5, 10), (2, 9, 4)]
+    assert ranking.rank(3) == 3
+    assert ranking.rank(1) is None
+    assert 3 not in ranking.buckets[10]
+    assert len(ranking) == 3
+
+
+def test_other_workers_apply_changes_without_reloading(app, make_user, monkeypatch):
+    alice, bob = make_user('alice'), make_user('bob')
+    other_worker = Leaderboard(poll_interval=0)
+    with app.app_context():
+        log_meals_counted(alice, 3)
+        assert other_worker.top('meals') == [(1, alice, 3)]
+
+        def reload():
+            raise AssertionError('rankings were reloaded in full')
+        monkeypatch.setattr(other_worker, '_load', reload)
+
+        log_meals_counted(bob, 5)
+        assert other_worker.top('meals') == [(1, bob, 5), (2, alice, 3)]
+        assert other_worker.standing('meals', alice) == (2, 3, 2)
+
+
+def test_changes_committed_out_of_order_are_picked_up(app, make_user):
+    alice, bob = make_user('alice'), make_user('bob')
+    other_worker = Leaderboard(poll_interval=0)
+    with app.app_context():
+        assert other_worker.top('meals') == []
+
+        # Change 1 is still in flight when change 2 commits
+        db.session.add(LeaderboardScore(metric='meals', user_id=bob, score=2))
+        db.session.add(LeaderboardChange(id=2, user_id=bob))
+        db.session.commit()
+        assert other_worker.top('meals') == [(1, bob, 2)]
+
+        db.session.add(LeaderboardScore(metric='meals', user_id=alice, score=4))
+        db.session.add(LeaderboardChange(id=1, user_id=alice))
+        db.session.commit()
+        assert other_worker.top('meals') == [(1, alice, 4), (2, bob, 2)]
+
+
+def test_rebuild_makes_every_worker_reload(app, make_user, monkeypatch):
+    alice = make_user()
+    other_worker = Leaderboard(poll_interval=0)
+    monkeypatch.setitem(shared_versions._callbacks, LEADERBOARD, [other_worker.reset])
+    with app.app_context():
+        assert other_worker.top('meals') == []
+        db.session.add(UserCounter(user_id=alice, name=MEALS_LOGGED, value=7))
+        db.session.commit()
+
+        rebuild_leaderboard()
+        assert LeaderboardChange.query.count() == 0
+        shared_versions.poll()
+        assert other_worker.top('meals') == [(1, alice, 7)]
+
+
+@pytest.fixture
+def adherent_user(app, make_user):
+    """A user whose adherence was scored back when they still logged meals"""
+    user_id = make_user()
+    with app.app_context():
+        db.session.add(LeaderboardScore(metric='adherence', user_id=user_id, score=1000))
+        db.session.commit()
+    return user_id
+
+
+def test_adherence_lapses_for_users_who_stop_logging(app, adherent_user):
+    with app.app_context():
+        # Reading the rankings never rescores
+        assert leaderboard.standing('adherence', adherent_user) == (1, 1000, 1)
+        assert LeaderboardScore.query.filter_by(metric='adherence').count() == 1
+
+    result = app.test_cli_runner().invoke(args=['refresh-leaderboard-adherence'])
+    assert 'Rescored adherence' in result.output
+    assert 'already rescored' in app.test_cli_runner().invoke(args=['refresh-leaderboard-adherence']).output
+
+    with app.app_context():
+        shared_versions.poll(force=True)
+        assert leaderboard.standing('adherence', adherent_user) == (None, 0, 0)
+        assert LeaderboardScore.query.filter_by(metric='adherence').count() == 0
+
+
+def test_adherence_is_rescored_once_per_day(app, adherent_user):
+    today = datetime.utcnow().date()
+    with app.app_context():
+        for offset in range(ADHERENCE_MIN_DAYS):
+            db.session.add(DailyNutrition(user_id=adherent_user, date=today - timedelta(days=offset),
+                                          meal_type='lunch', calories=2000))
+        db.session.commit()
+
+        assert refresh_adherence(today)
+        assert not refresh_adherence(today)
+        assert LeaderboardScore.query.filter_by(metric='adherence').one().score == 1000
+        assert refresh_adherence(today + timedelta(days=ADHERENCE_WINDOW_DAYS))
+        assert LeaderboardScore.query.filter_by(metric='adherence').count() == 0
+
+
+def test_leaderboard_page_ranks_the_current_user(make_user, make_food, login):
+    make_user()
+    tea = make_food('Tea')
+    client = login()
+    client.post('/add-meal', data={'food_id': [str(tea)], 'meal_type': 'lunch'})
+    data = client.get('/leaderboard-data?metric=meals').get_json()
+    assert data['me']['rank'] == 1
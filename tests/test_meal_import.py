@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from app import db
+from meal_import import MealImportError, import_meals
+from models import DailyNutrition, Meal, MealItem, UserCounter
+
+TOKEN = 'kiosk-secret'
+
+
+@pytest.fixture
+def kiosk(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'MEAL_IMPORT_TOKEN', TOKEN)
+    return app.test_client()
+
+
+def meal(user_id, food_id, day='2026-03-02', **values):
+    return dict({'user_id': user_id, 'date': day, 'meal_type': 'lunch',
+                 'items': [{'food_id': food_id, 'portion_size': 'medium'}]}, **values)
+
+
+def test_import_writes_meals_rollups_and_counters(app, make_user, make_food):
+    alice = make_user('alice')
+    bob = make_user('bob')
+    tea = make_food('Tea', calories=40)
+
+    with app.app_context():
+        summary = import_meals([meal(alice, tea), meal(alice, tea, day='2026-03-03'), meal(bob, tea, time='08:30')])
+        assert summary['meals'] == 3
+        assert summary['items'] == 3
+        assert summary['users'] == 2
+        assert Meal.query.count() == 3
+        assert MealItem.query.count() == 3
+        assert db.session.query(db.func.sum(DailyNutrition.calories)).scalar() == 120
+        counters = dict(db.session.query(UserCounter.user_id, UserCounter.value).filter_by(name='meals_logged'))
+        assert counters == {alice: 2, bob: 1}
+        assert 'First Meal' in summary['achievements'][alice]
+
+
+def test_invalid_batch_writes_nothing(app, make_user, make_food):
+    alice = make_user()
+    tea = make_food('Tea')
+
+    with app.app_context():
+        with pytest.raises(MealImportError) as error:
+            import_meals([meal(alice, tea), meal(999, tea), meal(alice, 999, meal_type='brunch'), 'nope'])
+        assert error.value.errors == [
+            'meal 1: unknown user_id 999',
+            'meal 2: unknown meal_type \'brunch\'',
+            'meal 2: unknown food_id 999',
+            'meal 3: must be an object',
+        ]
+        assert Meal.query.count() == 0
+
+
+def test_api_needs_the_configured_token(app, make_user, make_food, kiosk):
+    alice = make_user()
+    tea = make_food('Tea')
+    headers = {'Authorization': f'Bearer {TOKEN}'}
+
+    assert kiosk.post('/api/meals/import', json=[meal(alice, tea)], headers={'Authorization': 'Bearer x'}).status_code == 401
+    assert kiosk.post('/api/meals/import', json={'meals': 'x'}, headers=headers).status_code == 400
+    assert kiosk.post('/api/meals/import', json=[meal(999, tea)], headers=headers).get_json()['errors'] == [
+        'meal 0: unknown user_id 999']
+    assert kiosk.post('/api/meals/import', json={'meals': [meal(alice, tea)]}, headers=headers).get_json()['meals'] == 1
+
+    app.config['MEAL_IMPORT_TOKEN'] = None
+    assert kiosk.post('/api/meals/import', json=[meal(alice, tea)], headers=headers).status_code == 404
+
+
+def test_cli_reads_json_and_ndjson(app, make_user, make_food, tmp_path):
+    alice = make_user()
+    tea = make_food('Tea')
+    array = tmp_path / 'meals.json'
+    array.write_text(json.dumps([meal(alice, tea)]))
+    lines = tmp_path / 'meals.ndjson'
+    lines.write_text('\n'.join(json.dumps(meal(alice, tea)) for _ in range(2)) + '\n')
+
+    runner = app.test_cli_runner()
+    assert 'Imported 1 meals' in runner.invoke(args=['import-meals', str(array)]).output
+    assert 'Imported 2 meals' in runner.invoke(args=['import-meals', str(lines)]).output
+    bad = tmp_path / 'bad.json'
+    bad.write_text('[{')
+    assert runner.invoke(args=['import-meals', str(bad)]).exit_code != 0
@@ -0,0 +1,80 @@
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+from app import db
+from utils import calculate_daily_nutrition, get_meals_in_range
+
+START = date(2026, 3, 1)
+
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def log_days(log_meals, user_id, foods, days):
+    log_meals([
+        (user_id, START + timedelta(days=offset), meal_type, [(food_id, 'medium') for food_id in foods])
+        for offset in range(days) for meal_type in ('breakfast', 'lunch')
+    ])
+
+
+def test_meal_count_does_not_change_the_query_count(app, make_user, make_food, log_meals):
+    user_id = make_user()
+    foods = [make_food('Tea', calories=40), make_food('Naan', calories=260)]
+    log_days(log_meals, user_id, foods, 2)
+
+    with app.app_context():
+        get_meals_in_range(user_id, START, START)  # load the nutrient matrix
+        with count_queries() as few:
+            meals = get_meals_in_range(user_id, START, START + timedelta(days=1))
+            assert all(meal.total_nutrition['calories'] == 300 for meal in meals)
+            assert all(item.food.name for meal in meals for item in meal.items)
+        db.session.remove()
+
+    log_days(log_meals, user_id, foods, 10)
+    with app.app_context():
+        get_meals_in_range(user_id, START, START)
+        with count_queries() as many:
+            meals = get_meals_in_range(user_id, START, START + timedelta(days=9))
+            assert len(meals) == 24
+            assert all(meal.total_nutrition['calories'] == 300 for meal in meals)
+            assert all(item.food.name for meal in meals for item in meal.items)
+    assert len(many) == len(few)
+
+
+def test_meals_come_newest_first_unless_asked(app, make_user, make_food, log_meals):
+    user_id = make_user()
+    log_days(log_meals, user_id, [make_food('Tea')], 3)
+    with app.app_context():
+        newest = [meal.date for meal in get_meals_in_range(user_id, START, START + timedelta(days=2))]
+        oldest = [meal.date for meal in get_meals_in_range(user_id, START, START + timedelta(days=2), newest_first=False)]
+    assert newest == sorted(newest, reverse=True)
+    assert oldest == sorted(oldest)
+
+
+def test_calculate_daily_nutrition_sums_meals_and_plain_totals(app, make_user, make_food, log_meals):
+    user_id = make_user()
+    log_days(log_meals, user_id, [make_food('Tea', calories=40)], 1)
+    with app.app_context():
+        meals = get_meals_in_range(user_id, START, START)
+        assert calculate_daily_nutrition(meals + [{'calories': 5}])['calories'] == 85
+
+
+def test_history_page_lists_the_range(make_user, make_food, log_meals, login):
+    user_id = make_user()
+    log_days(log_meals, user_id, [make_food('Masala Dosa')], 2)
+    client = login()
+    page = client.get(f'/history?start_date={START}&end_date={START + timedelta(days=1)}').get_data(as_text=True)
+    assert page.count('Masala Dosa') >= 4
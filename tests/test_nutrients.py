@@ -0,0 +1,74 @@
+import numpy as np
+
+from app import db
+from models import Food
+from nutrients import NUTRIENT_INDEX, NUTRIENTS, NutrientStore, nutrient_store, round_totals
+from versions import FOOD_NUTRIENTS, FOODS, shared_versions
+
+CALORIES = NUTRIENT_INDEX['calories']
+
+
+def test_grouped_totals_scale_by_portion(app, make_food):
+    tea = make_food('Tea', calories=40, sodium=10.0)
+    naan = make_food('Naan', calories=260)
+    with app.app_context():
+        totals = NutrientStore().grouped_totals([tea, naan, tea], ['small', 'large', 'medium'], [0, 0, 1], 2)
+
+    assert totals.shape == (2, len(NUTRIENTS))
+    assert totals[0, CALORIES] == 40 * 0.75 + 260 * 1.5
+    assert totals[1, CALORIES] == 40
+    assert totals[0, NUTRIENT_INDEX['sodium']] == 7.5
+
+
+def test_foods_added_after_the_build_are_fetched(app, make_food):
+    make_food('Tea', calories=40)
+    store = NutrientStore()
+    with app.app_context():
+        store.totals([], [])
+        naan = Food(name='Naan', calories=260)
+        db.session.add(naan)
+        db.session.commit()
+        assert store.totals([naan.id], ['medium'])[CALORIES] == 260
+
+
+def test_nutrients_changed_by_another_worker_are_reloaded(app, make_food):
+    tea = make_food('Tea', calories=40)
+    with app.app_context():
+        shared_versions.poll(force=True)
+        assert nutrient_store.totals([tea], ['medium'])[CALORIES] == 40
+
+        # e.g. flask sync-foods in another process
+        db.session.execute(db.update(Food).where(Food.id == tea).values(calories=55))
+        shared_versions.bump(FOOD_NUTRIENTS)
+        db.session.commit()
+        assert nutrient_store.totals([tea], ['medium'])[CALORIES] == 40
+
+        shared_versions.poll(force=True)
+        assert nutrient_store.totals([tea], ['medium'])[CALORIES] == 55
+
+
+def test_new_foods_keep_the_matrix(app, make_food):
+    tea = make_food('Tea', calories=40)
+    with app.app_context():
+        shared_versions.poll(force=True)
+        nutrient_store.totals([tea], ['medium'])
+        matrix = nutrient_store._matrix
+
+        naan = Food(name='Naan', calories=260, is_custom=True)
+        db.session.add(naan)
+        shared_versions.bump(FOODS)
+        db.session.commit()
+        nutrient_store.set_food(naan)
+        shared_versions.poll(force=True)
+
+        assert nutrient_store._matrix is matrix
+        assert nutrient_store.totals([tea, naan.id], ['medium', 'medium'])[CALORIES] == 300
+
+
+def test_round_totals():
+    vector = np.zeros(len(NUTRIENTS))
+    vector[CALORIES] = 99.9
+    vector[NUTRIENT_INDEX['protein']] = 1.26
+    totals = round_totals(vector)
+    assert totals['calories'] == 99
+    assert totals['protein'] == 1.3
@@ -0,0 +1,63 @@
+import threading
+import time
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+import models
+from app import db
+from models import User
+from password_hashing import PasswordHasher, PasswordHashingBusy, method_spec
+from conftest import PASSWORD
+
+
+@pytest.fixture
+def hasher(monkeypatch):
+    """A hasher that runs a single hash at a time"""
+    hasher = PasswordHasher(method='pbkdf2', cost=1000, max_concurrent=1)
+    monkeypatch.setattr(models, 'password_hasher', hasher)
+    return hasher
+
+
+def test_hashes_use_the_configured_method(hasher):
+    password_hash = hasher.hash(PASSWORD)
+    assert password_hash.startswith('pbkdf2:sha256:1000$')
+    assert hasher.verify(password_hash, PASSWORD)
+    assert not hasher.verify(password_hash, 'wrong')
+    # No pool: the request thread does its own hashing
+    assert hasher._limited(threading.current_thread) is threading.current_thread()
+    assert not hasher.needs_rehash(password_hash)
+    assert hasher.needs_rehash(generate_password_hash(PASSWORD, method_spec('pbkdf2', 2000)))
+    with pytest.raises(ValueError):
+        method_spec('md5')
+
+
+def test_old_hashes_are_upgraded_on_login(app, make_user, login, hasher):
+    user_id = make_user()
+    with app.app_context():
+        db.session.get(User, user_id).password_hash = generate_password_hash(PASSWORD, 'pbkdf2:sha256:2000')
+        db.session.commit()
+    login()
+    with app.app_context():
+        assert db.session.get(User, user_id).password_hash.startswith('pbkdf2:sha256:1000$')
+
+
+def test_logins_beyond_the_bound_fail_fast_with_503(make_user, client, hasher):
+    make_user()
+    release = threading.Event()
+    holder = threading.Thread(target=hasher._limited, args=(release.wait,))
+    holder.start()
+    try:
+        while hasher._slots._value:
+            time.sleep(0.001)
+        with pytest.raises(PasswordHashingBusy):
+            hasher.hash(PASSWORD)
+
+        response = client.post('/login', data={'username': 'alice', 'password': PASSWORD})
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '5'
+    finally:
+        release.set()
+        holder.join()
+    response = client.post('/login', data={'username': 'alice', 'password': PASSWORD})
+    assert response.status_code == 302
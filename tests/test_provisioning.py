@@ -0,0 +1,48 @@
+import io
+
+import pytest
+
+from app import db
+from models import User, UserProfile
+from provisioning import ProvisioningError, provision_users
+
+CSV = '''username,email,password,locale
+bob,bob@example.com,secret-bob,
+carol,carol@example.com,secret-carol,hi
+alice,new-alice@example.com,secret,
+dave,alice@example.com,secret,
+bob,bob2@example.com,secret,
+erin,erin@example.com,,
+frank,frank@example.com,secret,xx
+'''
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_new_employees_are_created_and_the_rest_skipped(app, make_user, workers):
+    make_user('alice')
+    with app.app_context():
+        summary = provision_users(io.StringIO(CSV), batch_size=1, workers=workers, report=lambda line: None)
+        assert summary['created'] == 2
+        assert len(summary['skipped']) == 5
+        assert summary['skipped'][0].startswith('line 4: alice')
+
+        carol = User.query.filter_by(username='carol').one()
+        assert carol.locale == 'hi'
+        assert carol.check_password('secret-carol')
+        assert UserProfile.query.filter_by(user_id=carol.id).count() == 1
+        assert User.query.count() == 3
+
+
+def test_missing_columns_are_refused(app):
+    with app.app_context():
+        with pytest.raises(ProvisioningError, match='password'):
+            provision_users(io.StringIO('username,email\nbob,bob@example.com\n'), report=lambda line: None)
+
+
+def test_provision_users_command(app, tmp_path):
+    path = tmp_path / 'employees.csv'
+    path.write_text(CSV, encoding='utf-8')
+    result = app.test_cli_runner().invoke(args=['provision-users', str(path), '--workers', '1'])
+    assert 'Created 4 users, skipped 3 lines' in result.output
+    with app.app_context():
+        assert db.session.query(UserProfile).count() == 4
@@ -0,0 +1,169 @@
+import os
+
+import pytest
+from sqlalchemy import event
+
+from app import db
+from response_cache import FileSystemCacheBackend, MemoryCacheBackend, response_cache
+from versions import FOODS, shared_versions, user_version
+
+
+@pytest.fixture
+def workers(monkeypatch):
+    """Two memory backends standing in for two worker processes; call it with 0 or 1 to switch"""
+    backends = [MemoryCacheBackend(), MemoryCacheBackend()]
+
+    def use(worker):
+        monkeypatch.setattr(response_cache, 'backend', backends[worker])
+    use(0)
+    return use
+
+
+def x_cache(client, path='/nutrition-data'):
+    response = client.get(path)
+    assert response.status_code == 200
+    return response.headers['X-Cache']
+
+
+def test_a_meal_logged_on_another_worker_invalidates_cached_responses(make_user, make_food, login, workers):
+    make_user()
+    tea = make_food('Tea')
+    client = login()
+    assert x_cache(client) == 'MISS'
+    assert x_cache(client) == 'HIT'
+
+    workers(1)
+    client.post('/add-meal', data={'food_id': [str(tea)], 'meal_type': 'lunch'})
+    workers(0)
+    assert x_cache(client) == 'MISS'
+    assert x_cache(client) == 'HIT'
+
+
+def test_food_changes_from_any_process_invalidate_cached_responses(app, make_user, login, workers):
+    make_user()
+    client = login()
+    assert x_cache(client, '/food-search?q=tea') == 'MISS'
+    assert x_cache(client, '/food-search?q=tea') == 'HIT'
+    with app.app_context():
+        shared_versions.bump(FOODS)
+        db.session.commit()
+    assert x_cache(client, '/food-search?q=tea') == 'MISS'
+
+
+def test_entries_are_kept_per_user(make_user, login, workers):
+    make_user('alice')
+    make_user('bob')
+    client = login('alice')
+    assert x_cache(client) == 'MISS'
+    client.get('/logout')
+    login('bob')
+    assert x_cache(client) == 'MISS'
+
+
+def test_filesystem_backend_round_trip(tmp_path):
+    backend = FileSystemCacheBackend(str(tmp_path))
+    backend.set('key', ('application/json', b'{}'), 60)
+    assert backend.get('key') == ('application/json', b'{}')
+    backend.set('old', ('application/json', b'[]'), -1)
+    assert backend.get('old') is None
+    backend.prune()
+    assert len(os.listdir(tmp_path)) == 1
+    backend.clear()
+    assert backend.get('key') is None
+
+
+def test_cache_stats_name_the_worker(make_user, login, workers):
+    make_user()
+    client = login()
+    x_cache(client)
+    x_cache(client)
+    stats = client.get('/cache-stats').get_json()
+    assert stats['pid'] == os.getpid()
+    assert stats['endpoints']['nutrition_data'] == {'hits': 1, 'misses': 1}
+
+
+def revalidate(client, etag, path='/nutrition-data'):
+    return client.get(path, headers={'If-None-Match': f'"{etag}"'})
+
+
+@pytest.fixture
+def etag_client(make_user, login, workers):
+    """A logged-in client and the ETag it holds for its chart data"""
+    make_user()
+    client = login()
+    response = client.get('/nutrition-data')
+    etag = response.headers['ETag'].strip('"')
+    assert revalidate(client, etag).status_code == 304
+    return client, etag
+
+
+def test_etag_changes_after_a_meal_logged_on_another_worker(make_food, workers, etag_client):
+    client, etag = etag_client
+    tea = make_food('Tea')
+    workers(1)
+    client.post('/add-meal', data={'food_id': [str(tea)], 'meal_type': 'lunch'}, follow_redirects=True)
+    workers(0)
+    response = revalidate(client, etag)
+    assert response.status_code == 200
+    assert response.headers['ETag'].strip('"') != etag
+
+
+def test_etags_work_without_a_cache_backend(make_user, make_food, login, monkeypatch):
+    monkeypatch.setattr(response_cache, 'backend', None)
+    make_user()
+    tea = make_food('Tea')
+    client = login()
+    response = client.get('/nutrition-data')
+    assert 'X-Cache' not in response.headers
+    etag = response.headers['ETag'].strip('"')
+    assert revalidate(client, etag).status_code == 304
+
+    client.post('/add-meal', data={'food_id': [str(tea)], 'meal_type': 'lunch'}, follow_redirects=True)
+    response = revalidate(client, etag)
+    assert response.status_code == 200
+    assert response.headers['ETag'].strip('"') != etag
+
+
+@pytest.mark.parametrize('args', [['rebuild-rollups'], ['rebuild-rollups', '--user-id', '1']])
+def test_rebuild_rollups_command_changes_etags(app, args, etag_client):
+    client, etag = etag_client
+    assert app.test_cli_runner().invoke(args=args).exit_code == 0
+    assert revalidate(client, etag).status_code == 200
+
+
+def test_import_meals_command_changes_etags(app, make_food, tmp_path, etag_client):
+    client, etag = etag_client
+    tea = make_food('Tea')
+    path = tmp_path / 'meals.ndjson'
+    path.write_text(f'{{"user_id": 1, "date": "2026-03-02", "meal_type": "lunch", '
+                    f'"items": [{{"food_id": {tea}, "portion_size": "medium"}}]}}\n', encoding='utf-8')
+    assert app.test_cli_runner().invoke(args=['import-meals', str(path)]).exit_code == 0
+    assert revalidate(client, etag).status_code == 200
+
+
+def test_stacked_decorators_read_the_versions_once(app, make_user, login, workers):
+    make_user()
+    client = login()
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        assert client.get('/nutrition-data').status_code == 200
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert len([statement for statement in statements if 'user_data_version' in statement]) == 1
+
+
+def test_changing_language_invalidates_the_users_responses(app, etag_client):
+    client, etag = etag_client
+    with app.app_context():
+        before = user_version(1)
+    client.get('/set-language/es', follow_redirects=True)
+    with app.app_context():
+        assert user_version(1) == before + 1
+    assert revalidate(client, etag).status_code == 200
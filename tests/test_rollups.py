@@ -0,0 +1,109 @@
+from datetime import date, time
+
+from app import db
+from catalog import food_catalog
+from migrations import run_migrations
+from models import DailyNutrition, Food, Meal, MealItem
+from nutrients import NUTRIENT_INDEX, nutrient_store
+from rollups import get_daily_totals, rebuild_rollup_days, rebuild_rollups
+from utils import sync_foods_from_catalog
+from versions import shared_versions
+
+CALORIES = NUTRIENT_INDEX['calories']
+DAY = date(2026, 3, 2)
+
+
+def rollup_rows():
+    return sorted(
+        (row.user_id, row.date, row.meal_type, row.meal_count, round(row.calories, 3))
+        for row in DailyNutrition.query.all()
+    )
+
+
+def insert_meal_without_rollup(user_id, day, meal_type, items):
+    """Write a meal the way code from before the rollup did"""
+    meal = Meal(user_id=user_id, date=day, time=time(12, 0), meal_type=meal_type)
+    db.session.add(meal)
+    db.session.flush()
+    for food_id, portion_size in items:
+        db.session.add(MealItem(meal_id=meal.id, food_id=food_id, portion_size=portion_size))
+    db.session.commit()
+
+
+def test_logged_meals_are_summed_per_day_and_meal_type(app, make_user, make_food, log_meals):
+    user_id = make_user()
+    tea = make_food('Tea', calories=40)
+    naan = make_food('Naan', calories=260)
+    log_meals([
+        (user_id, DAY, 'lunch', [(naan, 'large'), (tea, 'medium')]),
+        (user_id, DAY, 'lunch', [(tea, 'small')]),
+        (user_id, DAY, 'snack', [(tea, 'medium')]),
+    ])
+
+    with app.app_context():
+        assert rollup_rows() == [(user_id, DAY, 'lunch', 2, 460.0), (user_id, DAY, 'snack', 1, 40.0)]
+        assert get_daily_totals(user_id, DAY, DAY)[DAY][CALORIES] == 500
+
+
+def test_rebuild_matches_incremental_rollup(app, make_user, make_food, log_meals):
+    first = make_user('alice')
+    second = make_user('bob')
+    tea = make_food('Tea', calories=40)
+    log_meals([(first, DAY, 'lunch', [(tea, 'large')]), (second, DAY, None, [(tea, 'small')])])
+
+    with app.app_context():
+        incremental = rollup_rows()
+        assert rebuild_rollups(batch_size=1) == 2
+        assert rollup_rows() == incremental
+        assert rebuild_rollups(user_id=second) == 1
+        assert rollup_rows() == incremental
+
+
+def test_migration_backfills_meals_logged_before_the_rollup(app, make_user, make_food):
+    user_id = make_user()
+    tea = make_food('Tea', calories=40)
+    with app.app_context():
+        insert_meal_without_rollup(user_id, DAY, 'lunch', [(tea, 'medium')])
+        assert get_daily_totals(user_id, DAY, DAY) == {}
+
+        run_migrations()
+        assert rollup_rows() == [(user_id, DAY, 'lunch', 1, 40.0)]
+
+        # Each step runs once per database
+        db.session.execute(db.delete(DailyNutrition))
+        db.session.commit()
+        run_migrations()
+        assert rollup_rows() == []
+
+
+def test_rebuild_rollup_days_leaves_other_days_alone(app, make_user, make_food, log_meals):
+    user_id = make_user()
+    tea = make_food('Tea', calories=40)
+    other_day = date(2026, 3, 3)
+    log_meals([(user_id, DAY, 'lunch', [(tea, 'medium')]), (user_id, other_day, 'lunch', [(tea, 'medium')])])
+
+    with app.app_context():
+        db.session.execute(db.update(Food).values(calories=50))
+        nutrient_store.reset()
+        rebuild_rollup_days([(user_id, DAY)])
+        db.session.commit()
+        assert rollup_rows() == [(user_id, DAY, 'lunch', 1, 50.0), (user_id, other_day, 'lunch', 1, 40.0)]
+
+
+def test_sync_foods_rolls_up_days_of_corrected_foods_again(app, make_user, log_meals):
+    user_id = make_user()
+    row = food_catalog.rows[0]
+    with app.app_context():
+        sync_foods_from_catalog()
+        food_id = Food.query.filter_by(name=row['Dish Name']).one().id
+        # The catalog value was wrong when the meal was logged
+        db.session.execute(db.update(Food).where(Food.id == food_id).values(calories=1))
+        db.session.commit()
+        nutrient_store.reset()
+        shared_versions.reset()
+    log_meals([(user_id, DAY, 'lunch', [(food_id, 'medium')])])
+
+    with app.app_context():
+        assert rollup_rows() == [(user_id, DAY, 'lunch', 1, 1.0)]
+        assert sync_foods_from_catalog()['updated'] == 1
+        assert rollup_rows() == [(user_id, DAY, 'lunch', 1, float(round(row['Calories (kcal)'])))]
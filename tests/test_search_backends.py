@@ -0,0 +1,71 @@
+import pytest
+
+import search_backends
+from app import db
+from models import Food
+from response_cache import CacheBackend
+from search_backends import FTS5SearchBackend, InProcessSearchBackend, SearchBackend, get_search_backend
+
+
+def names(results):
+    return [food['name'] for food in results]
+
+
+def test_interfaces_cannot_be_instantiated():
+    with pytest.raises(TypeError):
+        SearchBackend()
+    with pytest.raises(TypeError):
+        CacheBackend()
+
+
+def test_incomplete_backend_is_rejected():
+    class SearchOnly(SearchBackend):
+        def search(self, query, limit=10, fuzzy=None):
+            return []
+
+    with pytest.raises(TypeError):
+        SearchOnly()
+
+
+def test_backend_follows_the_setting(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'SEARCH_BACKEND', 'fts5')
+    with app.app_context():
+        assert isinstance(get_search_backend(), FTS5SearchBackend)
+    search_backends._backend = None
+    monkeypatch.setitem(app.config, 'SEARCH_BACKEND', 'memory')
+    with app.app_context():
+        assert isinstance(get_search_backend(), InProcessSearchBackend)
+
+
+def test_fts5_tracks_inserts_and_updates(app, make_food):
+    make_food('Masala Chai')
+    with app.app_context():
+        backend = FTS5SearchBackend(db)
+        assert names(backend.search('masala', fuzzy=False)) == ['Masala Chai']
+
+        # Bulk writes bypass the ORM; the triggers still see them
+        db.session.execute(db.insert(Food), [{'name': 'Masala Dosa', 'calories': 300}])
+        db.session.execute(db.update(Food).where(Food.name == 'Masala Chai').values(name='Ginger Chai'))
+        db.session.commit()
+
+        assert names(backend.search('masala', fuzzy=False)) == ['Masala Dosa']
+        assert names(backend.search('ginger', fuzzy=False)) == ['Ginger Chai']
+
+
+def test_fts5_ranks_the_english_name_first(app, make_food):
+    make_food('Plain Rice', name_hi='Chawal')
+    make_food('Chawal Khichdi')
+    with app.app_context():
+        assert names(FTS5SearchBackend(db).search('chawal', fuzzy=False)) == ['Chawal Khichdi', 'Plain Rice']
+
+
+def test_fts5_uses_the_fuzzy_index_for_typos(app, make_food):
+    make_food('Paneer Tikka')
+    with app.app_context():
+        backend = FTS5SearchBackend(db)
+        assert backend.search('panir', fuzzy=False) == []
+        assert names(backend.search('panir')) == ['Paneer Tikka']
+
+
+def test_match_expression_quotes_every_word_as_a_prefix():
+    assert FTS5SearchBackend.match_expression('Masala "chai"') == '"masala"* "chai"*'
@@ -0,0 +1,129 @@
+from app import db
+from models import Food
+from autocomplete import food_autocomplete
+from search_index import NgramIndex, food_search_index
+from versions import FOODS, shared_versions
+
+
+def test_matches_any_localized_name_best_first():
+    index = NgramIndex()
+    index.add(1, ['Masala Chai', 'मसाला चाय'], 'masala chai')
+    index.add(2, ['Chai Latte'], 'chai latte')
+    index.add(3, ['Lemon Tea'], 'lemon tea')
+
+    assert index.search('chai') == ['chai latte', 'masala chai']
+    assert index.search('चाय') == ['masala chai']
+    assert index.search('coffee') == []
+    assert index.search('chai', limit=1) == ['chai latte']
+
+
+def test_short_queries_match_substrings():
+    index = NgramIndex()
+    index.add(1, ['Masala Chai'], 'masala chai')
+    index.add(2, ['Dal'], 'dal')
+    index.add(3, ['Aloo Paratha'], 'aloo paratha')
+
+    assert index.search('d') == ['dal']
+    assert index.search('c') == ['masala chai']
+    assert index.search('a') == ['aloo paratha', 'dal', 'masala chai']
+    assert index.search('x') == []
+    assert index.search('al') == ['aloo paratha', 'dal', 'masala chai']
+    assert index.search('ha') == ['masala chai', 'aloo paratha']
+    assert index.search('ai') == ['masala chai']
+    assert index.search('th', limit=1) == ['aloo paratha']
+
+
+def test_ranks_name_then_word_prefixes_then_shorter_names():
+    index = NgramIndex()
+    index.add(1, ['Iced Green Tea'], 'iced green tea')
+    index.add(2, ['Steamed Rice'], 'steamed rice')
+    index.add(3, ['Tea'], 'tea')
+    index.add(4, ['Teacake'], 'teacake')
+    index.add(5, ['Lemon Tea'], 'lemon tea')
+
+    assert index.search('tea') == ['tea', 'teacake', 'lemon tea', 'iced green tea', 'steamed rice']
+    assert index.search('tea', limit=3) == ['tea', 'teacake', 'lemon tea']
+
+
+def test_adding_a_key_again_replaces_its_names():
+    index = NgramIndex()
+    index.add(1, ['Masala Chai'], 'old')
+    index.add(1, ['Ginger Tea'], 'new')
+
+    assert index.search('masala') == []
+    assert index.search('ginger') == ['new']
+    assert len(index) == 1
+
+
+def test_food_created_here_is_searchable_at_once(make_user, login):
+    make_user()
+    client = login()
+    client.get('/food-search?q=zzz')
+
+    client.post('/custom-entry', data={'name': 'Paneer Tikka', 'calories': 250})
+
+    names = [food['name'] for food in client.get('/food-search?q=paneer').get_json()]
+    assert 'Paneer Tikka' in names
+
+
+def test_food_created_here_is_added_without_a_rebuild(make_user, login, monkeypatch):
+    make_user()
+    client = login()
+    client.get('/food-search?q=zzz')
+    client.get('/food-autocomplete?q=zz')
+    foods, tries = food_search_index._foods, food_autocomplete._tries
+    assert foods is not None and tries is not None
+
+    client.post('/custom-entry', data={'name': 'Paneer Tikka', 'calories': 250})
+
+    names = [food['name'] for food in client.get('/food-search?q=paneer&fuzzy=0').get_json()]
+    assert names == ['Paneer Tikka']
+    assert food_search_index._foods is foods
+    assert food_autocomplete._tries is tries
+    assert [food['name'] for food in client.get('/food-autocomplete?q=paneer').get_json()] == ['Paneer Tikka']
+
+
+def test_food_created_by_another_worker_becomes_searchable(app, make_user, login):
+    make_user()
+    client = login()
+    # Build this worker's index before the other worker writes
+    assert client.get('/food-search?q=tikka').get_json() == []
+
+    # Another worker inserts a food: this process never sees its add_food() call
+    with app.app_context():
+        db.session.add(Food(name='Paneer Tikka', calories=250, is_custom=True))
+        shared_versions.bump(FOODS)
+        db.session.commit()
+
+    names = [food['name'] for food in client.get('/food-search?q=tikka&fuzzy=0').get_json()]
+    assert names == ['Paneer Tikka']
+
+
+def test_bump_advances_the_shared_version(app):
+    with app.app_context():
+        shared_versions.poll(force=True)
+        before = shared_versions.current(FOODS)
+        shared_versions.bump(FOODS)
+        shared_versions.bump(FOODS)
+        db.session.commit()
+        shared_versions.poll(force=True)
+        assert shared_versions.current(FOODS) == before + 2
+
+
+def test_own_bump_is_skipped_only_when_nothing_else_changed(app, monkeypatch):
+    calls = []
+    monkeypatch.setitem(shared_versions._callbacks, FOODS, [lambda: calls.append(1)])
+    with app.app_context():
+        shared_versions.poll(force=True)
+        shared_versions.bump(FOODS, applied=True)
+        db.session.commit()
+        shared_versions.poll(force=True)
+        assert calls == []
+
+        # Another worker's bump lands before this worker's own
+        shared_versions.bump(FOODS)
+        db.session.commit()
+        shared_versions.bump(FOODS, applied=True)
+        db.session.commit()
+        shared_versions.poll(force=True)
+        assert calls == [1]
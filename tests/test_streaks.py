@@ -0,0 +1,84 @@
+from datetime import date, timedelta
+
+import streaks
+from app import db
+from models import Meal, UserStreak
+from streaks import current_streak, rebuild_streak, record_active_day
+
+DAY = date(2026, 3, 2)
+
+
+def add_meal(user_id, day):
+    db.session.add(Meal(user_id=user_id, date=day, meal_type='lunch'))
+    db.session.flush()
+
+
+def log_day(user_id, day):
+    add_meal(user_id, day)
+    return record_active_day(user_id, day)
+
+
+def streak_of(user_id):
+    streak = UserStreak.query.filter_by(user_id=user_id).one()
+    return streak.current_streak, streak.longest_streak, streak.last_active_date
+
+
+def test_consecutive_days_extend_the_streak(app, make_user):
+    user_id = make_user()
+    with app.app_context():
+        log_day(user_id, DAY)
+        log_day(user_id, DAY + timedelta(days=1))
+        assert log_day(user_id, DAY + timedelta(days=2)) == ['Three in a Row']
+        log_day(user_id, DAY + timedelta(days=2))
+        assert streak_of(user_id) == (3, 3, DAY + timedelta(days=2))
+
+        log_day(user_id, DAY + timedelta(days=5))
+        assert streak_of(user_id) == (1, 3, DAY + timedelta(days=5))
+
+
+def test_backdated_meal_closes_a_gap(app, make_user):
+    user_id = make_user()
+    with app.app_context():
+        for offset in (0, 1, 3, 4):
+            log_day(user_id, DAY + timedelta(days=offset))
+        assert streak_of(user_id) == (2, 2, DAY + timedelta(days=4))
+
+        log_day(user_id, DAY + timedelta(days=2))
+        assert streak_of(user_id) == (5, 5, DAY + timedelta(days=4))
+
+
+def test_first_meal_builds_the_streak_from_history(app, make_user):
+    user_id = make_user()
+    with app.app_context():
+        for offset in range(3):
+            add_meal(user_id, DAY + timedelta(days=offset))
+        assert record_active_day(user_id, DAY + timedelta(days=2)) == ['Three in a Row']
+        assert streak_of(user_id) == (3, 3, DAY + timedelta(days=2))
+
+        streak = rebuild_streak(user_id)
+        assert (streak.current_streak, streak.longest_streak) == (3, 3)
+
+
+def test_concurrent_first_meals_share_one_row(app, make_user, monkeypatch):
+    user_id = make_user()
+    insert_ignore = streaks.insert_ignore
+
+    def insert_racing_another_request(model, rows, index_elements):
+        # Another request logged yesterday's meal and created the row first
+        db.session.execute(db.insert(UserStreak).values(
+            user_id=user_id, current_streak=1, longest_streak=1, last_active_date=DAY))
+        return insert_ignore(model, rows, index_elements)
+
+    monkeypatch.setattr(streaks, 'insert_ignore', insert_racing_another_request)
+    with app.app_context():
+        log_day(user_id, DAY + timedelta(days=1))
+        db.session.commit()
+        assert UserStreak.query.count() == 1
+        assert streak_of(user_id) == (2, 2, DAY + timedelta(days=1))
+
+
+def test_current_streak_lapses_after_a_missed_day():
+    streak = UserStreak(current_streak=4, longest_streak=4, last_active_date=DAY)
+    assert current_streak(streak, DAY + timedelta(days=1)) == 4
+    assert current_streak(streak, DAY + timedelta(days=2)) == 0
+    assert current_streak(None, DAY) == 0
@@ -0,0 +1,48 @@
+from app import db
+from autocomplete import food_autocomplete
+from catalog import food_catalog
+from models import Food
+from utils import sync_foods_from_catalog
+
+
+def test_sync_is_idempotent(app):
+    with app.app_context():
+        first = sync_foods_from_catalog()
+        assert first == {'inserted': len(food_catalog.rows), 'updated': 0, 'unchanged': 0}
+        assert sync_foods_from_catalog() == {'inserted': 0, 'updated': 0, 'unchanged': len(food_catalog.rows)}
+        assert Food.query.count() == len(food_catalog.rows)
+
+
+def test_sync_updates_changed_rows_and_leaves_custom_foods(app):
+    name = food_catalog.rows[0]['Dish Name']
+    other = food_catalog.rows[1]['Dish Name']
+    with app.app_context():
+        db.session.add(Food(name=other, calories=1, is_custom=True))
+        db.session.commit()
+        sync_foods_from_catalog()
+        db.session.execute(db.update(Food).where(Food.name == name).values(calories=1))
+        db.session.commit()
+
+        counts = sync_foods_from_catalog(batch_size=2)
+        assert counts['updated'] == 1
+        assert Food.query.filter_by(name=name).one().calories == round(food_catalog.rows[0]['Calories (kcal)'])
+        assert Food.query.filter_by(name=other).one().calories == 1
+
+
+def test_synced_foods_reach_workers_that_already_built_their_indexes(app, make_user, login):
+    make_user()
+    client = login()
+    name = food_catalog.rows[0]['Dish Name']
+    word = name.split()[0].lower()
+    assert [food for food in client.get(f'/food-search?q={word}&fuzzy=0').get_json() if food['source'] == 'db'] == []
+    assert client.get(f'/food-autocomplete?q={word}').get_json() == []
+
+    # The sync runs in another process, e.g. flask sync-foods
+    with app.app_context():
+        sync_foods_from_catalog()
+
+    db_names = [food['name'] for food in client.get(f'/food-search?q={word}').get_json() if food['source'] == 'db']
+    assert name in db_names
+    # The search request saw the bump; autocomplete rebuilds in the background
+    food_autocomplete.wait()
+    assert name in [food['name'] for food in client.get(f'/food-autocomplete?q={word}').get_json()]
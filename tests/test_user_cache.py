@@ -0,0 +1,43 @@
+import time
+
+from app import db
+from models import User, load_user, user_cache
+from user_cache import UserCache
+
+
+def test_load_user_is_served_from_the_cache(app, make_user, monkeypatch):
+    user_id = make_user()
+    with app.app_context():
+        assert load_user(str(user_id)).username == 'alice'
+
+    def no_query(*args, **kwargs):
+        raise AssertionError('user was loaded from the database')
+
+    with app.app_context():
+        monkeypatch.setattr(db.session, 'get', no_query)
+        user = load_user(str(user_id))
+        assert user.username == 'alice'
+        assert user in db.session
+
+
+def test_entries_expire_and_the_oldest_are_evicted(app, make_user, monkeypatch):
+    alice, bob = make_user('alice'), make_user('bob')
+    cache = UserCache(User, max_size=1, ttl=60)
+    with app.app_context():
+        cache.put(db.session.get(User, alice))
+        cache.put(db.session.get(User, bob))
+        assert cache.get(alice, db.session) is None
+        assert cache.get(bob, db.session).username == 'bob'
+
+        expired = time.monotonic() + 61
+        monkeypatch.setattr(time, 'monotonic', lambda: expired)
+        assert cache.get(bob, db.session) is None
+
+
+def test_changing_the_language_invalidates_the_cached_user(app, make_user, login):
+    user_id = make_user()
+    client = login()
+    client.get('/set-language/hi')
+    with app.app_context():
+        assert user_cache.get(user_id, db.session) is None
+        assert load_user(str(user_id)).locale == 'hi'
@@ -0,0 +1,54 @@
+"""Inserts that tolerate another transaction creating the same row first
+
+Rows such as a user's first counter or streak are created lazily by
+whichever request needs them, so two requests can try to create one at
+the same time. A plain INSERT then fails the slower request with an
+IntegrityError; insert_ignore() skips the conflicting rows instead.
+"""
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+
+UPSERT_DIALECTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+# Rows per multi-row INSERT, well under SQLite's limit on bound parameters
+INSERT_BATCH_SIZE = 500
+
+
+def insert_ignore(model, rows, index_elements, batch_size=INSERT_BATCH_SIZE):
+    """Insert rows, skipping those that conflict on the unique index_elements; the caller commits
+
+    Returns the set of index_elements value tuples that were inserted, so
+    callers can tell which rows they created.
+    """
+    rows = list(rows)
+    if not rows:
+        return set()
+    columns = [model.__table__.c[name] for name in index_elements]
+    dialect = db.session.get_bind().dialect
+    dialect_insert = UPSERT_DIALECTS.get(dialect.name)
+
+    if dialect_insert is not None and dialect.insert_returning:
+        inserted = set()
+        for start in range(0, len(rows), batch_size):
+            statement = dialect_insert(model).values(rows[start:start + batch_size])
+            statement = statement.on_conflict_do_nothing(index_elements=index_elements)
+            inserted.update(tuple(row) for row in db.session.execute(statement.returning(*columns)))
+        return inserted
+
+    inserted = set()
+    for row in rows:
+        key = tuple(row[name] for name in index_elements)
+        if dialect_insert is not None:
+            statement = dialect_insert(model).values(row).on_conflict_do_nothing(index_elements=index_elements)
+            if db.session.execute(statement).rowcount == 1:
+                inserted.add(key)
+            continue
+        # No ON CONFLICT here: try the row in a savepoint and undo just it on a conflict
+        try:
+            with db.session.begin_nested():
+                db.session.execute(db.insert(model).values(row))
+            inserted.add(key)
+        except IntegrityError:
+            pass
+    return inserted
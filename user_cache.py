@@ -0,0 +1,61 @@
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy.orm import make_transient_to_detached
+
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 60
+
+
+class UserCache:
+    """Bounded LRU of User column values with a time to live, per process
+
+    Values are copied out of the session, so no ORM instance is shared
+    between requests or threads. Changes made by another worker become
+    visible once the entry expires; changes made here should call
+    invalidate().
+    """
+
+    def __init__(self, model, max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.model = model
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._columns = None
+
+    def get(self, user_id, session):
+        """Return the user attached to session without a query, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, values = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+
+        user = self.model(**values)
+        make_transient_to_detached(user)
+        return session.merge(user, load=False)
+
+    def put(self, user):
+        if self._columns is None:
+            # Read lazily: the mapper can only be inspected once every model is defined
+            self._columns = [column.key for column in self.model.__mapper__.column_attrs]
+        values = {column: getattr(user, column) for column in self._columns}
+        with self._lock:
+            self._entries[user.id] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
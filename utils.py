@@ -1,106 +1,126 @@
-import csv
-import os
 import math
+import numpy as np
 from datetime import datetime, timedelta
 from models import Food, Meal, MealItem
 from app import db
+from sqlalchemy.orm import selectinload
+from catalog import food_catalog, CSV_TO_FOOD_COLUMNS
+from search_index import food_search_index
+from fuzzy_search import food_fuzzy_index
+from search_backends import get_search_backend
+from nutrients import NUTRIENTS, DEFAULT_TARGETS, nutrient_store, round_totals
+from rollups import days_with_foods, get_daily_totals, rebuild_rollup_days
+from aggregation import aggregate_nutrition
+from versions import FOOD_NUTRIENTS, FOODS, shared_versions
 
 def get_food_data_from_csv():
-    """Read food data from CSV file"""
-    food_data = []
-    csv_path = os.path.join(os.path.dirname(__file__), 'food_data.csv')
+    """Return the typed food rows from the cached CSV catalog"""
+    return food_catalog.rows
+
+def search_food_in_csv(query, lang='en', limit=50, fuzzy=False):
+    """Search the CSV catalog by any of its localized names, best matches first
+    
+    With fuzzy=True, names are matched by transliterated spelling with a small
+    edit-distance budget instead of by exact substring.
+    """
+    index = food_fuzzy_index if fuzzy else food_search_index
+    return index.search_csv(query, limit)
+
+def search_food_catalog(query, food_limit=10, csv_limit=10, fuzzy=None):
+    """Search Food rows and the CSV catalog, returning (food payloads, CSV rows)
     
-    if os.path.exists(csv_path):
-        with open(csv_path, 'r', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                food_data.append(row)
+    fuzzy=None runs the exact search and falls back to fuzzy matching only
+    when it finds nothing; True or False force one mode.
+    """
+    backend = get_search_backend()
+    if not fuzzy:
+        foods = backend.search(query, food_limit, fuzzy=False)
+        rows = food_search_index.search_csv(query, csv_limit)
+        if foods or rows or fuzzy is False:
+            return foods, rows
     
-    return food_data
+    return backend.search(query, food_limit, fuzzy=True), food_fuzzy_index.search_csv(query, csv_limit)
 
-def search_food_in_csv(query, lang='en'):
-    """Search for food items in the CSV file based on a query"""
-    results = []
-    csv_path = os.path.join(os.path.dirname(__file__), 'food_data.csv')
+def _food_values_from_row(row):
+    """Map a typed catalog row onto Food column values, coerced to the column types"""
+    values = {}
+    for csv_column, attribute in CSV_TO_FOOD_COLUMNS.items():
+        value = row.get(csv_column)
+        column_type = Food.__table__.c[attribute].type.python_type
+        if column_type is str:
+            value = value or None
+        elif column_type is int:
+            value = int(round(value or 0))
+        else:
+            value = float(value or 0)
+        values[attribute] = value
+    return values
+
+def sync_foods_from_catalog(batch_size=1000):
+    """Bring the non-custom Food rows in line with the CSV catalog
     
-    if not os.path.exists(csv_path):
-        return results
+    Existing foods are loaded in one query and diffed against the catalog;
+    new rows go in as batched bulk inserts and only changed rows are updated.
+    Foods with a catalog name that users created themselves are left alone.
+    Days with meals of foods whose nutrients changed are rolled up again in
+    the same transaction. Returns a dict with inserted, updated and
+    unchanged counts.
+    """
+    desired = {}
+    for row in food_catalog.rows:
+        values = _food_values_from_row(row)
+        desired[values['name']] = values
     
-    with open(csv_path, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            # Check name in English
-            if query.lower() in row['Dish Name'].lower():
-                results.append(row)
-            # Check name in the specified language if available
-            elif lang != 'en' and f'name_{lang}' in row and row[f'name_{lang}'] and query.lower() in row[f'name_{lang}'].lower():
-                results.append(row)
+    attributes = list(CSV_TO_FOOD_COLUMNS.values())
+    columns = [Food.id, Food.is_custom] + [getattr(Food, attribute) for attribute in attributes]
+    existing = {row.name: row for row in db.session.execute(db.select(*columns))}
     
-    return results
-
-def import_foods_from_csv():
-    """Import foods from CSV into the database"""
-    food_data = get_food_data_from_csv()
-    count = 0
+    inserts = []
+    updates = []
+    unchanged = 0
+    for name, values in desired.items():
+        current = existing.get(name)
+        if current is None:
+            inserts.append(dict(values, is_custom=False))
+        elif current.is_custom:
+            unchanged += 1
+        else:
+            changes = {a: v for a, v in values.items() if getattr(current, a) != v}
+            if changes:
+                updates.append(dict(changes, id=current.id))
+            else:
+                unchanged += 1
     
-    for item in food_data:
-        try:
-            # Check if food already exists by name
-            if 'Dish Name' not in item or not item['Dish Name']:
-                continue
-                
-            existing_food = Food.query.filter_by(name=item['Dish Name']).first()
-            if not existing_food:
-                # Safe conversion of values with defaults if missing or invalid
-                try:
-                    calories = float(item.get('Calories (kcal)', 0)) if item.get('Calories (kcal)') else 0
-                except (ValueError, TypeError):
-                    calories = 0
-                    
-                try:
-                    protein = float(item.get('Protein (g)', 0)) if item.get('Protein (g)') else 0
-                except (ValueError, TypeError):
-                    protein = 0
-                    
-                try:
-                    carbs = float(item.get('Carbohydrate (g)', 0)) if item.get('Carbohydrate (g)') else 0
-                except (ValueError, TypeError):
-                    carbs = 0
-                    
-                try:
-                    fat = float(item.get('Fats (g)', 0)) if item.get('Fats (g)') else 0
-                except (ValueError, TypeError):
-                    fat = 0
-                    
-                try:
-                    fiber = float(item.get('Fibre (g)', 0)) if item.get('Fibre (g)') else 0
-                except (ValueError, TypeError):
-                    fiber = 0
-                
-                food = Food(
-                    name=item['Dish Name'],
-                    calories=calories,
-                    protein=protein,
-                    carbs=carbs,
-                    fat=fat,
-                    fiber=fiber,
-                    category='other',  # Default category
-                    is_custom=False
-                )
-                
-                # Add multilingual names if available
-                for lang in ['hi', 'kn', 'ta', 'te', 'mr', 'gu']:
-                    lang_key = f'name_{lang}'
-                    if lang_key in item and item[lang_key]:
-                        setattr(food, lang_key, item[lang_key])
-                
-                db.session.add(food)
-                count += 1
-        except Exception as e:
-            print(f"Error importing food item: {str(e)}")
+    for start in range(0, len(inserts), batch_size):
+        db.session.execute(db.insert(Food), inserts[start:start + batch_size])
+    for start in range(0, len(updates), batch_size):
+        db.session.execute(db.update(Food), updates[start:start + batch_size])
+    if inserts or updates:
+        # Bulk statements bypass the ORM; every worker, not just this process,
+        # reloads its food indexes and stops serving cached responses when
+        # the version moves
+        shared_versions.bump(FOODS)
     
+    changed_foods = [row['id'] for row in updates if any(name in row for name in NUTRIENTS)]
+    if changed_foods:
+        # New foods are fetched into the nutrient matrix when first used; only
+        # corrected rows make every worker reload it
+        shared_versions.bump(FOOD_NUTRIENTS)
+        # Roll up the affected days from the corrected values this session sees
+        nutrient_store.reset()
+        try:
+            rebuild_rollup_days(days_with_foods(changed_foods))
+        except Exception:
+            db.session.rollback()
+            nutrient_store.reset()
+            raise
     db.session.commit()
-    return count
+    
+    return {'inserted': len(inserts), 'updated': len(updates), 'unchanged': unchanged}
+
+def import_foods_from_csv():
+    """Import foods from CSV into the database, returning how many were added"""
+    return sync_foods_from_catalog()['inserted']
 
 def calculate_bmi(weight, height):
     """Calculate BMI from weight (kg) and height (cm)"""
@@ -156,96 +176,141 @@ def calculate_daily_calorie_needs(weight, height, age, gender, activity_level, h
     
     return int(daily_calories)
 
+def get_meals_in_range(user_id, start_date, end_date, newest_first=True):
+    """Get a user's meals between two dates with items, foods and totals loaded
+    
+    Meals, then items joined with their foods, are fetched in two queries no
+    matter how many meals the range holds, and each meal's total_nutrition
+    is computed up front so templates can read it without further queries.
+    """
+    order = (Meal.date.desc(), Meal.time.desc()) if newest_first else (Meal.date, Meal.time)
+    meals = Meal.query.options(
+        selectinload(Meal.items).joinedload(MealItem.food)
+    ).filter(
+        Meal.user_id == user_id,
+        Meal.date >= start_date,
+        Meal.date <= end_date
+    ).order_by(*order).all()
+    
+    Meal.load_totals(meals)
+    return meals
+
 def get_daily_meals(user_id, date=None):
     """Get all meals logged by a user on a specific date"""
     if date is None:
         date = datetime.utcnow().date()
     
-    meals = Meal.query.filter_by(
-        user_id=user_id,
-        date=date
-    ).order_by(Meal.time).all()
+    return get_meals_in_range(user_id, date, date, newest_first=False)
+
+def get_daily_nutrition(user_id, date=None):
+    """Get a user's nutrition totals for one day from the rollup table"""
+    if date is None:
+        date = datetime.utcnow().date()
     
-    return meals
+    vector = get_daily_totals(user_id, date, date).get(date, np.zeros(len(NUTRIENTS)))
+    return round_totals(vector)
 
 def calculate_daily_nutrition(meals):
-    """Calculate total nutrition from a list of meal logs"""
-    total = {
-        'calories': 0,
-        'protein': 0,
-        'carbs': 0,
-        'fat': 0
-    }
+    """Calculate total nutrition from a list of meal logs
+    
+    Items of all Meal objects are fetched in one query and summed through the
+    nutrient matrix; plain dicts are treated as precomputed meal totals.
+    """
+    meal_ids = [meal.id for meal in meals if not isinstance(meal, dict)]
+    vector = np.zeros(len(NUTRIENTS))
+    if meal_ids:
+        rows = db.session.query(MealItem.food_id, MealItem.portion_size).filter(
+            MealItem.meal_id.in_(meal_ids)
+        ).all()
+        vector = nutrient_store.totals([row.food_id for row in rows], [row.portion_size for row in rows])
     
+    total = round_totals(vector)
     for meal in meals:
-        # Check if meal is a dictionary or object
         if isinstance(meal, dict):
-            meal_nutrition = meal
-        else:
-            try:
-                # Try to call the function
-                meal_nutrition = meal.total_nutrition()
-            except (AttributeError, TypeError):
-                # If it fails, try to access it as an attribute
-                meal_nutrition = getattr(meal, 'total_nutrition', {})
-                if callable(meal_nutrition):
-                    meal_nutrition = meal_nutrition()
-                elif not isinstance(meal_nutrition, dict):
-                    meal_nutrition = {}
-        
-        total['calories'] += meal_nutrition.get('calories', 0)
-        total['protein'] += meal_nutrition.get('protein', 0)
-        total['carbs'] += meal_nutrition.get('carbs', 0)
-        total['fat'] += meal_nutrition.get('fat', 0)
+            for name in total:
+                total[name] += meal.get(name, 0)
     
     return total
 
-def get_weekly_nutrition_data(user_id):
-    """Get nutrition data for the past 7 days for charts"""
-    end_date = datetime.utcnow().date()
-    start_date = end_date - timedelta(days=6)  # 7 days including today
-    
-    dates = []
-    calories = []
-    protein = []
-    carbs = []
-    fat = []
-    
-    # Get user profile for targets
+# Chart windows offered by /nutrition-data, in days
+RANGE_WINDOWS = (7, 30, 90, 365)
+# Longest custom range the history page and its charts cover, about five years
+RANGE_MAX_DAYS = 5 * 366
+
+def clamp_range(start_date, end_date, max_days=RANGE_MAX_DAYS):
+    """Return the range cut to its last max_days days, with start never after end"""
+    start_date = min(max(start_date, end_date - timedelta(days=max_days - 1)), end_date)
+    return start_date, end_date
+
+def chart_bucket(day_count):
+    """Pick the chart granularity for a window: daily, then weekly, then monthly"""
+    if day_count <= 31:
+        return 'day'
+    if day_count <= 120:
+        return 'week'
+    return 'month'
+
+def _bucket_start(day, bucket):
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+def get_nutrition_targets(user_id):
+    """Get a user's daily calorie and macro targets, with defaults for missing values"""
     from models import UserProfile
     profile = UserProfile.query.filter_by(user_id=user_id).first()
-    target_calories = profile.target_calories if profile else 2000
-    target_protein = profile.target_protein if profile else 125
-    target_carbs = profile.target_carbs if profile else 250
-    target_fat = profile.target_fat if profile else 55
+    return {
+        name: (getattr(profile, f'target_{name}', None) if profile else None) or default
+        for name, default in DEFAULT_TARGETS.items()
+    }
+
+def get_nutrition_range_data(user_id, start_date, end_date, bucket=None):
+    """Get chart data for any date range from a single grouped rollup query
+    
+    Long ranges are downsampled to weekly or monthly buckets; each bucket
+    holds the average per day over its days inside the range, so values stay
+    comparable with the daily targets. Ranges longer than RANGE_MAX_DAYS
+    are cut to their last RANGE_MAX_DAYS days.
+    """
+    start_date, end_date = clamp_range(start_date, end_date)
+    day_count = (end_date - start_date).days + 1
+    bucket = bucket or chart_bucket(day_count)
     
-    # Get data for each day
-    current_date = start_date
-    while current_date <= end_date:
-        dates.append(current_date.isoformat())
-        
-        daily_meals = get_daily_meals(user_id, current_date)
-        daily_nutrition = calculate_daily_nutrition(daily_meals)
-        
-        calories.append(daily_nutrition['calories'])
-        protein.append(daily_nutrition['protein'])
-        carbs.append(daily_nutrition['carbs'])
-        fat.append(daily_nutrition['fat'])
-        
-        current_date += timedelta(days=1)
+    targets = get_nutrition_targets(user_id)
+    
+    days = [start_date + timedelta(days=offset) for offset in range(day_count)]
+    labels = list(dict.fromkeys(_bucket_start(day, bucket) for day in days))
+    positions = {label: position for position, label in enumerate(labels)}
+    groups = np.array([positions[_bucket_start(day, bucket)] for day in days], dtype=np.int64)
+    
+    daily = np.zeros((day_count, len(NUTRIENTS)))
+    for day, vector in get_daily_totals(user_id, start_date, end_date).items():
+        daily[(day - start_date).days] = vector
+    sums = np.zeros((len(labels), len(NUTRIENTS)))
+    np.add.at(sums, groups, daily)
+    totals = [round_totals(row) for row in sums / np.bincount(groups, minlength=len(labels))[:, None]]
     
     return {
-        'dates': dates,
-        'calories': calories,
-        'protein': protein,
-        'carbs': carbs,
-        'fat': fat,
-        'target_calories': target_calories,
-        'target_protein': target_protein,
-        'target_carbs': target_carbs,
-        'target_fat': target_fat
+        'dates': [label.isoformat() for label in labels],
+        'bucket': bucket,
+        'calories': [day['calories'] for day in totals],
+        'protein': [day['protein'] for day in totals],
+        'carbs': [day['carbs'] for day in totals],
+        'fat': [day['fat'] for day in totals],
+        'target_calories': targets['calories'],
+        'target_protein': targets['protein'],
+        'target_carbs': targets['carbs'],
+        'target_fat': targets['fat']
     }
 
+def get_weekly_nutrition_data(user_id, days=7):
+    """Get nutrition data for the past days (7 by default) for charts"""
+    end_date = datetime.utcnow().date()
+    start_date = end_date - timedelta(days=days - 1)  # including today
+    return get_nutrition_range_data(user_id, start_date, end_date)
+
 def get_meal_type_distribution(user_id, date=None):
     """Get distribution of calories by meal type for a specific day"""
     if date is None:
@@ -258,26 +323,8 @@ def get_meal_type_distribution(user_id, date=None):
         'snack': 0
     }
     
-    meals = get_daily_meals(user_id, date)
-    
-    for meal in meals:
-        if not hasattr(meal, 'meal_type') or meal.meal_type not in distribution:
-            continue
-            
-        try:
-            # Try to get nutrition info
-            if hasattr(meal, 'total_nutrition'):
-                if callable(meal.total_nutrition):
-                    nutrition = meal.total_nutrition()
-                else:
-                    nutrition = meal.total_nutrition
-            else:
-                nutrition = {'calories': 0}
-                
-            distribution[meal.meal_type] += nutrition.get('calories', 0)
-        except Exception as e:
-            # Log error but continue processing
-            print(f"Error getting meal nutrition: {str(e)}")
-            continue
+    for group in aggregate_nutrition(user_id, date, date, group_by=['meal_type'], measures=['calories']):
+        if group['meal_type'] in distribution:
+            distribution[group['meal_type']] = int(group['calories'])
     
-    return distribution
\ No newline at end of file
+    return distribution
@@ -0,0 +1,198 @@
+"""Versions of shared data, kept in the database so every worker sees changes
+
+Process-wide caches (food search indexes, autocomplete, the nutrient matrix,
+achievement rules, leaderboard rankings) register a callback per name with
+on_change(). Code that changes the underlying rows calls bump() inside the
+same transaction. Each worker polls the versions at the start of a request,
+at most every SHARED_VERSION_POLL_INTERVAL seconds, and runs the callbacks
+of the names that moved, so another worker's write is seen within that
+interval instead of never.
+"""
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import app, db
+from upserts import UPSERT_DIALECTS
+
+# Food rows, including custom foods and catalog syncs
+FOODS = 'foods'
+# Nutrient values of existing Food rows, which only catalog syncs change
+FOOD_NUTRIENTS = 'food_nutrients'
+# Achievement rows, i.e. the rules the achievement engine caches
+ACHIEVEMENT_RULES = 'achievement_rules'
+# DailyNutrition rebuilt for every user at once
+ROLLUPS = 'rollups'
+# LeaderboardScore rows rewritten in bulk, so rankings must be reloaded in full
+LEADERBOARD = 'leaderboard'
+
+# Session.info key of {name: version} bumped with applied=True, pending commit
+APPLIED_KEY = 'shared_versions_applied'
+
+
+class SharedVersions:
+    """Poll the DataVersion table and tell local caches when another worker changed their data"""
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._callbacks = defaultdict(list)
+        # None until the first poll, so bumps made before it are not taken as seen
+        self._seen = None
+        self._next_poll = 0.0
+
+    def on_change(self, name, callback):
+        """Call callback() whenever the version of name moves, including on the first poll"""
+        self._callbacks[name].append(callback)
+
+    def bump(self, name, applied=False):
+        """Advance a version inside the caller's transaction; the caller commits
+
+        Pass applied=True when the caller brings this worker's caches up to
+        date itself, e.g. by adding a new food to its indexes: once the
+        transaction commits, this worker's next poll skips the callbacks
+        for its own bump, unless another worker bumped the name as well.
+        """
+        from models import DataVersion
+
+        dialect = db.session.get_bind().dialect
+        dialect_insert = UPSERT_DIALECTS.get(dialect.name)
+        if dialect_insert is not None:
+            statement = dialect_insert(DataVersion).values(name=name, version=1)
+            statement = statement.on_conflict_do_update(
+                index_elements=['name'], set_={'version': DataVersion.version + 1})
+            if dialect.insert_returning:
+                version = db.session.execute(statement.returning(DataVersion.version)).scalar()
+            else:
+                db.session.execute(statement)
+                version = db.session.query(DataVersion.version).filter_by(name=name).scalar()
+        else:
+            row = db.session.get(DataVersion, name, with_for_update=True)
+            if row is None:
+                row = DataVersion(name=name, version=1)
+                db.session.add(row)
+            else:
+                row.version += 1
+            version = row.version
+        if applied:
+            db.session.info.setdefault(APPLIED_KEY, {})[name] = version
+
+    def _applied(self, versions):
+        """Take committed bumps of this worker as seen when nothing else happened in between"""
+        with self._lock:
+            for name, version in versions.items():
+                if self._seen is not None and self._seen.get(name, 0) == version - 1:
+                    self._seen[name] = version
+
+    def claim(self, name, value):
+        """Raise a version to value unless it is already there; True for the one caller that did
+
+        Lets exactly one worker run a job per value, e.g. once per day or
+        once per migration. The caller commits.
+        """
+        from models import DataVersion
+
+        dialect_insert = UPSERT_DIALECTS.get(db.session.get_bind().dialect.name)
+        if dialect_insert is not None:
+            db.session.execute(
+                dialect_insert(DataVersion).values(name=name, version=0).on_conflict_do_nothing(index_elements=['name']))
+        elif db.session.get(DataVersion, name) is None:
+            db.session.add(DataVersion(name=name, version=0))
+            db.session.flush()
+        result = db.session.execute(
+            db.update(DataVersion).where(DataVersion.name == name, DataVersion.version < value).values(version=value))
+        return result.rowcount == 1
+
+    def poll(self, force=False):
+        """Read every version and run the callbacks of those that changed since the last poll"""
+        from models import DataVersion
+
+        if not force and time.monotonic() < self._next_poll:
+            return
+        with self._lock:
+            if not force and time.monotonic() < self._next_poll:
+                return
+            self._next_poll = time.monotonic() + self.interval
+            versions = dict(db.session.query(DataVersion.name, DataVersion.version))
+            seen = self._seen or {}
+            changed = [name for name, version in versions.items() if seen.get(name) != version]
+            self._seen = versions
+        for name in changed:
+            for callback in self._callbacks.get(name, ()):
+                callback()
+
+    def current(self, name):
+        """The version of name as of this worker's last poll"""
+        return (self._seen or {}).get(name, 0)
+
+    def read(self, *names):
+        """Return {name: version} from the database now, for callers that cannot wait for a poll"""
+        from models import DataVersion
+
+        versions = dict.fromkeys(names, 0)
+        versions.update(db.session.query(DataVersion.name, DataVersion.version).filter(DataVersion.name.in_(names)))
+        return versions
+
+    def reset(self):
+        """Forget the versions seen, so the next poll runs every callback"""
+        with self._lock:
+            self._seen = None
+            self._next_poll = 0.0
+
+
+def bump_user_versions(user_ids):
+    """Advance the data version of each user inside the caller's transaction; the caller commits"""
+    from models import UserDataVersion
+
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return
+    dialect_insert = UPSERT_DIALECTS.get(db.session.get_bind().dialect.name)
+    if dialect_insert is not None:
+        statement = dialect_insert(UserDataVersion).values([{'user_id': user_id, 'version': 1} for user_id in user_ids])
+        statement = statement.on_conflict_do_update(
+            index_elements=['user_id'], set_={'version': UserDataVersion.version + 1})
+        db.session.execute(statement)
+        return
+
+    for user_id in user_ids:
+        row = db.session.get(UserDataVersion, user_id, with_for_update=True)
+        if row is None:
+            db.session.add(UserDataVersion(user_id=user_id, version=1))
+        else:
+            row.version += 1
+
+
+def user_version(user_id):
+    """The data version of a user as this session sees it, 0 before the first change"""
+    from models import UserDataVersion
+
+    return db.session.query(UserDataVersion.version).filter_by(user_id=user_id).scalar() or 0
+
+
+def read_versions(user_id, *names):
+    """Return (user_version(user_id), {name: version}) read together in one query"""
+    from models import DataVersion, UserDataVersion
+
+    columns = [db.select(UserDataVersion.version).where(UserDataVersion.user_id == user_id).scalar_subquery()]
+    columns += [db.select(DataVersion.version).where(DataVersion.name == name).scalar_subquery() for name in names]
+    row = db.session.execute(db.select(*columns)).one()
+    return row[0] or 0, {name: version or 0 for name, version in zip(names, row[1:])}
+
+
+shared_versions = SharedVersions(app.config['SHARED_VERSION_POLL_INTERVAL'])
+
+
+@event.listens_for(Session, 'after_commit')
+def _record_applied_versions(session):
+    applied = session.info.pop(APPLIED_KEY, None)
+    if applied:
+        shared_versions._applied(applied)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_applied_versions(session, previous_transaction):
+    session.info.pop(APPLIED_KEY, None)